@@ -0,0 +1,248 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from competency_agent import CompetencyAgent, MultiCompetencyAgent
+from evaluation_cache import EvaluationCache, evaluation_key
+from evaluation_engine import EvaluationEngine
+from metrics import RELEVANCE_DECISIONS, add_usage, timed
+from patch_reducer import reduce_patch, describe_reduction
+from patch_store import load_patch
+from relevance import RelevanceScorer
+from repos import DEFAULT_REPO
+from response_store import record_competency_version, response_refs
+
+# "per_competency" sends one model call per PR and competency, "multi" scores
+# each PR against all competencies in a single structured-output call
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "per_competency")
+EVALUATION_MODEL = os.getenv("EVALUATION_MODEL", "gpt-4")
+MULTI_COMPETENCY_MODEL = os.getenv("MULTI_COMPETENCY_MODEL", "gpt-4o-2024-08-06")
+EVALUATION_MODES = ("per_competency", "multi")
+
+def mode_model(mode: str) -> str:
+    return MULTI_COMPETENCY_MODEL if mode == "multi" else EVALUATION_MODEL
+
+class RunEvaluator:
+    # Evaluates the PRs of one agent run and stores a response per PR and
+    # competency. Used both for inline runs (frontend.process_agents) and by
+    # queue workers (agent_worker.py), which may handle items of many runs.
+    def __init__(self, db, call_id: str, mode: str, competencies: List[Dict[str, Any]], engine: EvaluationEngine,
+                 log: Callable[[str, str], None]):
+        self.db = db
+        self.call_id = call_id
+        self.mode = mode
+        self.competencies = competencies
+        self.engine = engine
+        self.log = log
+        self.model = mode_model(mode)
+        # Results are reused while the patch, description, competency, model
+        # and prompt version are all unchanged
+        self.cache = EvaluationCache(db.evaluation_cache)
+        # Responses reference competencies by version instead of copying the description
+        self.versions = {
+            competency.get('name'): record_competency_version(db, competency.get('name'), competency.get('description'))
+            for competency in competencies
+        }
+        self.agents = {
+            competency.get('name'): CompetencyAgent(competency.get('description'), async_client=engine.client, model=EVALUATION_MODEL)
+            for competency in competencies
+        }
+        self.multi_agent = MultiCompetencyAgent(
+            {competency.get('name'): competency.get('description') for competency in competencies},
+            async_client=engine.client,
+            model=MULTI_COMPETENCY_MODEL
+        )
+        self.patch_tokens = {"original": 0, "reduced": 0}
+        # Pairs the local relevance score rules out skip the model call
+        self.relevance = RelevanceScorer({competency.get('name'): competency.get('description') for competency in competencies})
+        self.relevance_decisions = Counter()
+
+    def reduce(self, pr: Dict[str, Any]) -> Dict[str, Any]:
+        # Patches live in the blob store and are trimmed to the token budget
+        # of the model they are sent to
+        with timed("fetch"):
+            reduction = reduce_patch(load_patch(self.db, pr), model=self.model)
+        self.patch_tokens["original"] += reduction["original_tokens"]
+        self.patch_tokens["reduced"] += reduction["tokens"]
+        self.log("info", f"Analyzing PR #{pr.get('number')}.")
+        if reduction["tokens"] < reduction["original_tokens"]:
+            self.log("info", f"Reduced patch for PR #{pr.get('number')}: {describe_reduction(reduction)}.")
+        reduction["features"] = self.relevance.features(pr, reduction["patch"])
+        return reduction
+
+    def decide(self, reduction: Dict[str, Any], competency_name: str):
+        # (relevance score, "evaluate" / "skip" / "audit") for a pair without a cached result
+        score = self.relevance.score(reduction["features"], competency_name)
+        decision = self.relevance.decide(score, competency_name)
+        self.relevance_decisions[decision] += 1
+        RELEVANCE_DECISIONS.labels(decision).inc()
+        add_usage(**{f"relevance_{decision}": 1})
+        return round(score, 4), decision
+
+    def describe_relevance(self) -> Optional[str]:
+        decisions = self.relevance_decisions
+        scored = sum(decisions.values())
+        if not scored:
+            return None
+        return (f"skipped {decisions['skip']} of {scored} uncached pairs ({decisions['skip'] / scored:.0%}) below relevance "
+                f"{self.relevance.threshold}, audited {decisions['audit']}")
+
+    def store_responses(self, documents: List[Dict[str, Any]]):
+        # Keyed by run, PR and competency, so a work item retried after a
+        # crash doesn't store its response twice
+        with timed("persist"):
+            self.db.agent_responses.bulk_write([
+                UpdateOne(
+                    {
+                        "call_id": document["call_id"],
+                        "repo": document["repo"],
+                        "pr_number": document["pr_number"],
+                        "competency_name": document["competency_name"]
+                    },
+                    {"$setOnInsert": document},
+                    upsert=True
+                )
+                for document in documents
+            ])
+
+    def pr_link(self, pr: Dict[str, Any]) -> str:
+        return f"https://github.com/{pr.get('repo', DEFAULT_REPO)}/pull/{pr.get('number')}"
+
+    async def evaluate_pair(self, pr: Dict[str, Any], reduction: Dict[str, Any], competency: Dict[str, Any]) -> bool:
+        pr_patch = reduction["patch"]
+        pr_number = pr.get('number')
+        pr_description = pr.get('body', '')
+        pr_link = self.pr_link(pr)
+        competency_name = competency.get('name')
+        agent = self.agents[competency_name]
+
+        self.log("info", f"Evaluating competency '{competency_name}' for PR #{pr_number}.")
+
+        prompt = agent.generate_prompt(pr_patch, pr_description, pr_link)
+        cache_key = evaluation_key(pr_patch, pr_description, agent.competency_description, agent.model, agent.PROMPT_VERSION)
+        summary = await asyncio.to_thread(self.cache.get, cache_key)
+        cached = summary is not None
+        relevance, decision = (None, "cached") if cached else self.decide(reduction, competency_name)
+        started = time.monotonic()
+        if decision == "skip":
+            # Stored like the model's own "unrelated" answer, but not cached
+            summary = "-"
+            self.log("info", f"Skipped competency '{competency_name}' for PR #{pr_number} (relevance {relevance}).")
+        elif not cached:
+            with timed("evaluate"):
+                result = await self.engine.call_with_retries(lambda: agent.analyze_pr_async(pr_patch, pr_description, pr_link))
+            summary = result.get("summary")
+            await asyncio.to_thread(self.cache.put, cache_key, summary, agent.competency_description, agent.model, agent.PROMPT_VERSION)
+        duration_ms = int((time.monotonic() - started) * 1000)
+
+        # References only; /agent_responses/<call_id>?expand=1 rebuilds the patch, description and prompt
+        await asyncio.to_thread(self.store_responses, [{
+            "call_id": self.call_id,
+            "competency_name": competency_name,
+            "competency_id": str(competency.get('_id')),
+            "competency_version": self.versions[competency_name],
+            "summary": summary,
+            "cached": cached,
+            "relevance": relevance,
+            "skipped": decision == "skip",
+            "audit": decision == "audit",
+            "pr_link": pr_link,
+            # Only a pair answered by this call has a prompt to refer to
+            **response_refs(pr, reduction, agent.model, agent.PROMPT_VERSION, prompt if decision != "skip" and not cached else None),
+            "duration_ms": duration_ms,
+            "timestamp": datetime.utcnow()
+        }])
+
+        self.log("info", f"Stored response for competency '{competency_name}' and PR #{pr_number}.")
+        return cached
+
+    async def evaluate_pr(self, pr: Dict[str, Any], reduction: Dict[str, Any]) -> bool:
+        # One call for every competency, fanned back out into one response per competency
+        pr_patch = reduction["patch"]
+        pr_number = pr.get('number')
+        pr_description = pr.get('body', '')
+        pr_link = self.pr_link(pr)
+        multi_agent = self.multi_agent
+
+        self.log("info", f"Evaluating all competencies for PR #{pr_number}.")
+
+        cache_keys = {
+            name: evaluation_key(pr_patch, pr_description, description, multi_agent.model, multi_agent.PROMPT_VERSION)
+            for name, description in multi_agent.competencies.items()
+        }
+        cached = await asyncio.to_thread(self.cache.get_many, cache_keys.values())
+        summaries = {name: cached[key] for name, key in cache_keys.items() if key in cached}
+
+        # Only the competencies without a cached result, and not ruled out
+        # by the relevance filter, go to the model
+        from_cache = set(summaries)
+        relevance = {
+            name: self.decide(reduction, name)
+            for name in multi_agent.competencies if name not in from_cache
+        }
+        skipped = [name for name, (_, decision) in relevance.items() if decision == "skip"]
+        for name in skipped:
+            summaries[name] = "-"
+        if skipped:
+            self.log("info", f"Skipped {len(skipped)} competencies for PR #{pr_number} below relevance {self.relevance.threshold}.")
+        missing = {name: description for name, description in multi_agent.competencies.items() if name not in summaries}
+        started = time.monotonic()
+        prompt = None
+        if missing:
+            agent = MultiCompetencyAgent(missing, async_client=self.engine.client, model=multi_agent.model)
+            prompt = agent.generate_prompt(pr_patch, pr_description, pr_link)
+            with timed("evaluate"):
+                results = await self.engine.call_with_retries(lambda: agent.analyze_pr_async(pr_patch, pr_description, pr_link))
+
+            def store_results():
+                for name, description in missing.items():
+                    if name not in results:
+                        # Left out of the reply: stored as unrelated, but not
+                        # cached, so the next run asks again
+                        summaries[name] = "-"
+                        continue
+                    summaries[name] = results[name].get("summary")
+                    self.cache.put(cache_keys[name], summaries[name], description, agent.model, agent.PROMPT_VERSION)
+
+            await asyncio.to_thread(store_results)
+        duration_ms = int((time.monotonic() - started) * 1000)
+
+        timestamp = datetime.utcnow()
+        refs = response_refs(pr, reduction, multi_agent.model, multi_agent.PROMPT_VERSION)
+        # Answers from this call refer to the prompt that was sent, which only
+        # lists the competencies without a cached or skipped result
+        called_refs = {
+            **response_refs(pr, reduction, multi_agent.model, multi_agent.PROMPT_VERSION, prompt),
+            "prompt_competencies": [self.versions[name] for name in missing]
+        } if missing else refs
+        await asyncio.to_thread(self.store_responses, [
+            {
+                "call_id": self.call_id,
+                "competency_name": competency.get('name'),
+                "competency_id": str(competency.get('_id')),
+                "competency_version": self.versions[competency.get('name')],
+                **(called_refs if competency.get('name') in missing else refs),
+                "summary": summaries[competency.get('name')],
+                "cached": competency.get('name') in from_cache,
+                "relevance": relevance.get(competency.get('name'), (None, None))[0],
+                "skipped": competency.get('name') in skipped,
+                "audit": relevance.get(competency.get('name'), (None, None))[1] == "audit",
+                "pr_link": pr_link,
+                "duration_ms": duration_ms,
+                "timestamp": timestamp
+            }
+            for competency in self.competencies
+        ])
+
+        self.log("info", f"Stored responses for {len(self.competencies)} competencies and PR #{pr_number}.")
+        return len(from_cache) == len(multi_agent.competencies)
+
+    async def report_failure(self, pr: Dict[str, Any], competency_name, error: Exception):
+        what = f"competency '{competency_name}'" if competency_name else "competencies"
+        # "warning" rather than "error" so the dashboard keeps following the run
+        self.log("warning", f"Failed to evaluate {what} for PR #{pr.get('number')}: {error}")
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import threading
+import uuid
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from agent_evaluation import RunEvaluator
+from db_indexes import ensure_indexes
+from evaluation_engine import EVALUATION_CONCURRENCY, EvaluationEngine
+from log_sink import BufferedLogWriter
+from metrics import RunUsage, run_usage, serve_metrics
+from repos import DEFAULT_REPO
+from work_queue import (WORK_LEASE_SECONDS, WORK_MAX_ATTEMPTS, claim_item, claim_run, complete_item, expand_run,
+                        fail_item, heartbeat)
+
+load_dotenv()
+
+# How long an idle worker waits before looking for new work again
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
+
+# Work items of one PR are claimed one after another, so a few reduced
+# patches are kept instead of reloading the patch for every competency
+REDUCTION_CACHE_SIZE = 32
+EVALUATOR_CACHE_SIZE = 16
+
+class AgentWorker:
+    def __init__(self, db, engine=None):
+        self.db = db
+        self.engine = engine
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stopping = threading.Event()
+        self.held = set()
+        self.held_lock = threading.Lock()
+        # Touched from the engine's worker threads
+        self.cache_lock = threading.Lock()
+        self.evaluators = OrderedDict()
+        self.reductions = OrderedDict()
+        self.logs = None
+        # Model usage of the items being handled, by item id
+        self.usage = {}
+
+    def log_for(self, call_id):
+        def log_agent_event(status, message, **fields):
+            self.logs.log(status, message, call_id=call_id, **fields)
+        return log_agent_event
+
+    def recall(self, cache, key):
+        with self.cache_lock:
+            return cache.get(key)
+
+    def remember(self, cache, key, value, size):
+        with self.cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > size:
+                cache.popitem(last=False)
+        return value
+
+    def evaluator_for(self, call_id):
+        evaluator = self.recall(self.evaluators, call_id)
+        if evaluator:
+            return evaluator
+        run = self.db.agent_runs.find_one({"_id": call_id})
+        evaluator = RunEvaluator(self.db, call_id, run["mode"], run["competencies"], self.engine, self.log_for(call_id))
+        return self.remember(self.evaluators, call_id, evaluator, EVALUATOR_CACHE_SIZE)
+
+    def prepared_pr(self, evaluator, item):
+        key = (item["call_id"], item["repo"], item["pr_number"])
+        prepared = self.recall(self.reductions, key)
+        if prepared:
+            return prepared
+        repo_query = {"$in": [item["repo"], None]} if item["repo"] == DEFAULT_REPO else item["repo"]
+        pr = self.db.pull_requests.find_one({"repo": repo_query, "number": item["pr_number"]}, {"patch": 0})
+        if pr is None:
+            raise LookupError(f"PR {item['repo']}#{item['pr_number']} is no longer stored")
+        return self.remember(self.reductions, key, (pr, evaluator.reduce(pr)), REDUCTION_CACHE_SIZE)
+
+    def claimed_items(self):
+        # Runs in a thread (EvaluationEngine.run advances it off the event
+        # loop) and only ends when the worker is asked to stop
+        while not self.stopping.is_set():
+            run = claim_run(self.db, self.owner)
+            if run:
+                log = self.log_for(run["_id"])
+                log("info", f"Processing {self.db.pull_requests.count_documents({})} PRs and "
+                            f"{len(run['competencies'])} competencies ({run['mode']} mode).")
+                self.finish_run(expand_run(self.db, run, DEFAULT_REPO))
+                continue
+            item = claim_item(self.db, self.owner)
+            if item is None:
+                self.stopping.wait(WORKER_POLL_SECONDS)
+                continue
+            with self.held_lock:
+                self.held.add(item["_id"])
+            yield item
+
+    def heartbeats(self):
+        # Keep the leases of every claimed item alive, including items still
+        # waiting in the engine's queue
+        while not self.stopping.wait(WORK_LEASE_SECONDS / 3):
+            with self.held_lock:
+                item_ids = list(self.held)
+            try:
+                heartbeat(self.db, self.owner, item_ids)
+            except Exception as e:
+                print(f"Error extending work leases: {e}")
+
+    def release(self, item):
+        with self.held_lock:
+            self.held.discard(item["_id"])
+
+    def flush_logs(self):
+        # Called before an item is counted, so once the last item of a run
+        # is counted every worker's entries for it are stored, and the
+        # "completed" entry really is the last one
+        try:
+            self.logs.flush()
+        except Exception as e:
+            print(f"Error writing agent logs: {e}")
+
+    def finish_run(self, run):
+        # Called by the one worker that marked the run completed
+        if run is None:
+            return
+        log = self.log_for(run["_id"])
+        elapsed = (run["finished_at"] - run.get("started_at", run["created_at"])).total_seconds()
+        log("info", f"Evaluated {run['done']} of {run['total']} work items in {elapsed:.1f}s "
+                    f"({run['failed']} failed, {run['cached']} from the evaluation cache).")
+        usage = run.get("usage", {})
+        if usage.get("relevance_skip"):
+            log("info", f"Relevance filter skipped {usage['relevance_skip']} pairs, audited {usage.get('relevance_audit', 0)}.")
+        # Summed over every worker that handled an item of the run
+        log("completed", "All agents have been processed successfully.", usage=usage)
+        with self.cache_lock:
+            self.evaluators.pop(run["_id"], None)
+
+    async def handle(self, item):
+        if item["attempts"] > WORK_MAX_ATTEMPTS:
+            raise RuntimeError(f"Gave up after {WORK_MAX_ATTEMPTS} attempts")
+        usage = self.usage[item["_id"]] = RunUsage()
+        with run_usage(usage):
+            evaluator = await asyncio.to_thread(self.evaluator_for, item["call_id"])
+            pr, reduction = await asyncio.to_thread(self.prepared_pr, evaluator, item)
+            if item["competency_name"] is None:
+                cached = await evaluator.evaluate_pr(pr, reduction)
+            else:
+                competency = next(competency for competency in evaluator.competencies if competency["name"] == item["competency_name"])
+                cached = await evaluator.evaluate_pair(pr, reduction, competency)
+        del self.usage[item["_id"]]
+        await asyncio.to_thread(self.flush_logs)
+        run = await asyncio.to_thread(complete_item, self.db, item, self.owner, cached, usage.totals())
+        self.release(item)
+        await asyncio.to_thread(self.finish_run, run)
+
+    async def on_error(self, item, error):
+        self.log_for(item["call_id"])(
+            "warning", f"Failed to evaluate {item['competency_name'] or 'competencies'} for PR #{item['pr_number']} "
+                       f"(attempt {item['attempts']}): {error}"
+        )
+        usage = self.usage.pop(item["_id"], None)
+        await asyncio.to_thread(self.flush_logs)
+        run = await asyncio.to_thread(fail_item, self.db, item, self.owner, str(error), WORK_MAX_ATTEMPTS,
+                                      usage.totals() if usage else None)
+        self.release(item)
+        await asyncio.to_thread(self.finish_run, run)
+
+    async def work(self):
+        self.engine = self.engine or EvaluationEngine()
+        try:
+            await self.engine.run(self.claimed_items(), self.handle, self.on_error)
+        finally:
+            await self.engine.client.close()
+
+    def run(self):
+        print(f"Agent worker {self.owner} started.")
+        heartbeat_thread = threading.Thread(target=self.heartbeats, daemon=True)
+        heartbeat_thread.start()
+        with BufferedLogWriter(self.db.agent_logs) as self.logs:
+            asyncio.run(self.work())
+        print(f"Agent worker {self.owner} stopped.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate queued agent runs.")
+    parser.add_argument("--concurrency", type=int, default=EVALUATION_CONCURRENCY, help="model calls in flight in this process")
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URI")).github_prs
+    ensure_indexes(db)
+    serve_metrics()
+    worker = AgentWorker(db, EvaluationEngine(concurrency=args.concurrency))
+    # Finish the items already claimed, then exit; anything left is picked
+    # up by other workers once its lease runs out
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stopping.set())
+    worker.run()
@@ -1,70 +1,246 @@
 import requests
 import json
+import time
+import random
+import argparse
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from bson import Binary
+from pymongo import MongoClient, UpdateOne
+from requests.adapters import HTTPAdapter
+from patch_store import store_patch, patch_file_stats
+from rate_limit import RateLimitScheduler, PRIORITY_HIGH, PRIORITY_LOW
+from db_indexes import ensure_indexes
+from metrics import record_github_response, serve_metrics, timed
+from repos import DEFAULT_REPO
+from sync_status import SWEEP_STATE_ID, freshness, parse_github_time, sync_state_id
 
 # Load environment variables from .env file
 load_dotenv()
 
-# GitHub API settings
-GITHUB_API_URL = "https://api.github.com"
-REPO_OWNER = "openai"
-REPO_NAME = "openai-python"
+# GitHub API settings; the base URL can point at GitHub Enterprise or at
+# the local stand-in in fake_github.py
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+# Repositories to ingest as "owner/name", comma separated. Setting GITHUB_ORG
+# instead discovers every non-archived repository of that organization.
+GITHUB_REPOS = [repo.strip() for repo in os.getenv("GITHUB_REPOS", DEFAULT_REPO).split(",") if repo.strip()]
+GITHUB_ORG = os.getenv("GITHUB_ORG")
+
+# Number of repositories synced in parallel, and the cap on GitHub requests
+# in flight across all of them so every shard shares one rate budget
+REPO_SHARDS = int(os.getenv("REPO_SHARDS", "4"))
+
+GITHUB_GRAPHQL_URL = os.getenv("GITHUB_GRAPHQL_URL", f"{GITHUB_API_URL}/graphql")
+
+# "rest" fetches the PR list plus details/patch/comments per PR, "graphql"
+# fetches metadata, stats and review comments for a page of PRs in one query
+FETCH_BACKEND = os.getenv("FETCH_BACKEND", "rest")
+GRAPHQL_PAGE_SIZE = int(os.getenv("GRAPHQL_PAGE_SIZE", "50"))
 
 # Get the tokens from the .env file
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 MONGO_URI = os.getenv("MONGO_URI")
 
+# Number of PRs enriched in parallel (details, patch and comments per PR)
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "8"))
+GITHUB_MAX_IN_FLIGHT = int(os.getenv("GITHUB_MAX_IN_FLIGHT", str(ENRICH_CONCURRENCY)))
+
+# PR upserts are sent to MongoDB in bulk_write batches of this size
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "100"))
+BULK_ORDERED = os.getenv("BULK_ORDERED", "false").lower() == "true"
+
+# Incremental sync: poll interval (plus random jitter) and the window used
+# for the very first sync, before any watermark exists
+SYNC_INTERVAL_SECONDS = int(os.getenv("SYNC_INTERVAL_SECONDS", "300"))
+SYNC_JITTER_SECONDS = int(os.getenv("SYNC_JITTER_SECONDS", "30"))
+INITIAL_SYNC_DAYS = int(os.getenv("INITIAL_SYNC_DAYS", "30"))
+
+# Rate-limit budget: below GITHUB_LOW_BUDGET remaining calls patch downloads
+# wait for the reset, below GITHUB_PACE_BELOW of the limit calls are spaced out
+GITHUB_LOW_BUDGET = int(os.getenv("GITHUB_LOW_BUDGET", "100"))
+GITHUB_PACE_BELOW = float(os.getenv("GITHUB_PACE_BELOW", "0.2"))
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "5"))
+
 headers = {}
 if GITHUB_TOKEN:
     headers["Authorization"] = f"token {GITHUB_TOKEN}"
 
+# One pooled session shared by all fetches so connections are kept alive
+# across requests; the pool is sized to the in-flight request cap.
+session = requests.Session()
+session.headers.update(headers)
+adapter = HTTPAdapter(pool_connections=GITHUB_MAX_IN_FLIGHT, pool_maxsize=GITHUB_MAX_IN_FLIGHT)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
+# REST and GraphQL calls draw from separate GitHub budgets
+rest_scheduler = RateLimitScheduler(low_budget=GITHUB_LOW_BUDGET, pace_below=GITHUB_PACE_BELOW, max_retries=GITHUB_MAX_RETRIES)
+graphql_scheduler = RateLimitScheduler(low_budget=GITHUB_LOW_BUDGET, pace_below=GITHUB_PACE_BELOW, max_retries=GITHUB_MAX_RETRIES)
+in_flight = threading.BoundedSemaphore(GITHUB_MAX_IN_FLIGHT)
+
+def github_request(method, url, scheduler=rest_scheduler, priority=PRIORITY_HIGH, **kwargs):
+    # Send a request within the rate budget, retrying rate limits and server
+    # errors with backoff instead of failing the whole sweep
+    for attempt in range(scheduler.max_retries + 1):
+        scheduler.wait_turn(priority)
+        try:
+            with in_flight:
+                response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == scheduler.max_retries:
+                raise
+            delay = scheduler.retry_delay(None, attempt)
+            print(f"Request to {url} failed ({e}), retrying in {delay:.1f}s")
+            scheduler.pause(delay)
+            continue
+
+        scheduler.record(response)
+        record_github_response("graphql" if scheduler is graphql_scheduler else "rest", response)
+        if attempt < scheduler.max_retries and scheduler.should_retry(response):
+            delay = scheduler.retry_delay(response, attempt)
+            print(f"GitHub returned {response.status_code} for {url}, retrying in {delay:.1f}s")
+            scheduler.pause(delay)
+            continue
+        return response
+
 # MongoDB connection
 client = MongoClient(MONGO_URI)
 db = client.github_prs
 pr_collection = db.pull_requests
+http_cache_collection = db.http_cache
+sync_state_collection = db.sync_state
+
+def ensure_pr_indexes():
+    # PRs are keyed by (repo, number); documents from the single-repo days
+    # belong to the default repository
+    pr_collection.update_many({"repo": {"$exists": False}}, {"$set": {"repo": DEFAULT_REPO}})
+    # The unique (repo, number) index can only be built once that is done
+    ensure_indexes(db)
+
+# Conditional-request cache hit/miss counters, reset at the start of each sweep
+cache_stats = {"hits": 0, "misses": 0}
+cache_stats_lock = threading.Lock()
+
+def count_cache(kind):
+    with cache_stats_lock:
+        cache_stats[kind] += 1
+
+def cached_get(url, params=None, accept=None, priority=PRIORITY_HIGH, cache=True):
+    # GET through the shared session, revalidating against the stored
+    # ETag/Last-Modified so an unchanged resource comes back as a 304 and
+    # its body is served from the cache (304s don't count against the rate limit).
+    # cache=False skips the cache for bodies that are stored elsewhere.
+    request_headers = {}
+    if accept:
+        request_headers["Accept"] = accept
+    cache_key = requests.Request("GET", url, params=params).prepare().url
+    if accept:
+        cache_key += f" [{accept}]"
+
+    cached = http_cache_collection.find_one({"_id": cache_key}) if cache else None
+    if cached:
+        if cached.get("etag"):
+            request_headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            request_headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = github_request("GET", url, priority=priority, params=params, headers=request_headers)
+    if response.status_code == 304 and cached:
+        count_cache("hits")
+        response.status_code = 200
+        response._content = zlib.decompress(cached["body"])
+        response.encoding = cached.get("encoding") or "utf-8"
+        if cached.get("link"):
+            response.headers["Link"] = cached["link"]
+        return response
+
+    response.raise_for_status()
+    count_cache("misses")
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if cache and (etag or last_modified):
+        http_cache_collection.replace_one(
+            {"_id": cache_key},
+            {
+                "etag": etag,
+                "last_modified": last_modified,
+                "link": response.headers.get("Link"),
+                "encoding": response.encoding,
+                "body": Binary(zlib.compress(response.content)),
+                "fetched_at": datetime.now(timezone.utc)
+            },
+            upsert=True
+        )
+    return response
+
+def fetch_org_repos(org):
+    url = f"{GITHUB_API_URL}/orgs/{org}/repos"
+    params = {"type": "all", "per_page": 100}
+    repos = []
+
+    while True:
+        response = cached_get(url, params=params)
+        repos.extend(repo["full_name"] for repo in response.json() if not repo.get("archived"))
+
+        if 'next' in response.links:
+            url = response.links['next']['url']
+            params = None
+        else:
+            break
+
+    return repos
+
+def configured_repos():
+    if GITHUB_ORG:
+        return fetch_org_repos(GITHUB_ORG)
+    return GITHUB_REPOS
 
-def fetch_recent_merged_prs(from_date, to_date):
-    url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/pulls"
+def fetch_recent_merged_prs(repo, from_date, to_date):
+    url = f"{GITHUB_API_URL}/repos/{repo}/pulls"
     params = {
         "state": "closed",
         "sort": "updated",
         "direction": "desc",
         "per_page": 100,
     }
-    
-    params["since"] = from_date.isoformat()
+    # /pulls has no "since" filter: pages are read newest first until they
+    # pass from_date. Leaving it out also keeps the first page's URL, and so
+    # its cached ETag, the same from one sync to the next.
 
     all_prs = []
 
     while True:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
+        response = cached_get(url, params=params)
         prs = response.json()
         
         if not prs:
             break
 
         # Filter PRs based on the to_date
-        filtered_prs = [pr for pr in prs if datetime.fromisoformat(pr['updated_at'].replace('Z', '+00:00')) <= to_date]
+        filtered_prs = [pr for pr in prs if parse_github_time(pr['updated_at']) <= to_date]
         all_prs.extend(filtered_prs)
 
-        if 'next' in response.links and datetime.fromisoformat(prs[-1]['updated_at'].replace('Z', '+00:00')) > from_date:
+        if 'next' in response.links and parse_github_time(prs[-1]['updated_at']) > from_date:
+            # The next link carries the query already
             url = response.links['next']['url']
+            params = None
         else:
             break
 
     return all_prs
 
-def fetch_pr_comments(pr_number):
-    url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/pulls/{pr_number}/comments"
+def fetch_pr_comments(repo, pr_number):
+    url = f"{GITHUB_API_URL}/repos/{repo}/pulls/{pr_number}/comments"
     all_comments = []
 
     while True:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
+        response = cached_get(url)
         comments = response.json()
         all_comments.extend(comments)
 
@@ -75,74 +251,377 @@ def fetch_pr_comments(pr_number):
 
     return all_comments
 
-def fetch_pr_details(pr_number):
-    url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/pulls/{pr_number}"
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
+def fetch_pr_details(repo, pr_number):
+    url = f"{GITHUB_API_URL}/repos/{repo}/pulls/{pr_number}"
+    response = cached_get(url)
     return response.json()
 
-def fetch_pr_patch(pr_number):
-    url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/pulls/{pr_number}"
-    headers_with_patch = headers.copy()
-    headers_with_patch["Accept"] = "application/vnd.github.v3.patch"
-    response = requests.get(url, headers=headers_with_patch)
-    response.raise_for_status()
+def fetch_pr_patch(repo, pr_number):
+    url = f"{GITHUB_API_URL}/repos/{repo}/pulls/{pr_number}"
+    # Patches are the bulkiest downloads, so they yield when the budget is low.
+    # They are only fetched for changed PRs and already kept in patch_blobs,
+    # so a second copy in http_cache would never be revalidated.
+    response = cached_get(url, accept="application/vnd.github.v3.patch", priority=PRIORITY_LOW, cache=False)
     return response.text
 
-def get_last_update_time():
-    most_recent_pr = pr_collection.find_one(sort=[("updated_at", -1)])
+PULL_REQUESTS_QUERY = """
+query($owner: String!, $name: String!, $first: Int!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(states: [CLOSED, MERGED], orderBy: {field: UPDATED_AT, direction: DESC}, first: $first, after: $after) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number
+        title
+        body
+        createdAt
+        mergedAt
+        updatedAt
+        author { login }
+        additions
+        deletions
+        changedFiles
+        reviewThreads(first: 50) {
+          pageInfo { hasNextPage }
+          nodes {
+            comments(first: 50) {
+              pageInfo { hasNextPage }
+              nodes {
+                databaseId
+                body
+                path
+                createdAt
+                updatedAt
+                url
+                author { login }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+def graphql_query(query, variables):
+    response = github_request("POST", GITHUB_GRAPHQL_URL, scheduler=graphql_scheduler, json={"query": query, "variables": variables})
+    response.raise_for_status()
+    payload = response.json()
+    if payload.get("errors"):
+        raise RuntimeError(f"GraphQL query failed: {payload['errors']}")
+    return payload["data"]
+
+def graphql_review_comments(node):
+    # Review comments in the REST /pulls/{number}/comments shape, or None
+    # when there are threads or comments beyond the first page. That is rare,
+    # so enrich_pr_graphql then paginates the REST endpoint for that PR.
+    threads = node["reviewThreads"]
+    if threads["pageInfo"]["hasNextPage"] or any(
+        thread["comments"]["pageInfo"]["hasNextPage"] for thread in threads["nodes"]
+    ):
+        return None
+
+    comments = [
+        {
+            "id": comment["databaseId"],
+            "body": comment["body"],
+            "path": comment["path"],
+            "created_at": comment["createdAt"],
+            "updated_at": comment["updatedAt"],
+            "html_url": comment["url"],
+            "user": {"login": comment["author"]["login"] if comment["author"] else None}
+        }
+        for thread in threads["nodes"]
+        for comment in thread["comments"]["nodes"]
+    ]
+    return sorted(comments, key=lambda comment: comment["id"])
+
+def graphql_pr_info(repo, node):
+    # Same document shape as enrich_pr, minus the patch which GraphQL doesn't expose
+    return {
+        "repo": repo,
+        "number": node["number"],
+        "title": node["title"],
+        "created_at": node["createdAt"],
+        "merged_at": node["mergedAt"],
+        "updated_at": node["updatedAt"],
+        "user": node["author"]["login"] if node["author"] else None,
+        "body": node["body"],
+        "comments": graphql_review_comments(node),
+        "additions": node["additions"],
+        "deletions": node["deletions"],
+        "changed_files": node["changedFiles"],
+        "state": "closed"
+    }
+
+def fetch_recent_merged_prs_graphql(repo, from_date, to_date):
+    owner, name = repo.split("/", 1)
+    variables = {"owner": owner, "name": name, "first": GRAPHQL_PAGE_SIZE, "after": None}
+    all_prs = []
+
+    while True:
+        data = graphql_query(PULL_REQUESTS_QUERY, variables)
+        connection = data["repository"]["pullRequests"]
+        nodes = connection["nodes"]
+
+        if not nodes:
+            break
+
+        all_prs.extend(
+            graphql_pr_info(repo, node) for node in nodes
+            if parse_github_time(node["updatedAt"]) <= to_date
+        )
+
+        if connection["pageInfo"]["hasNextPage"] and parse_github_time(nodes[-1]["updatedAt"]) > from_date:
+            variables["after"] = connection["pageInfo"]["endCursor"]
+        else:
+            break
+
+    return all_prs
+
+def get_last_update_time(repo=DEFAULT_REPO):
+    most_recent_pr = pr_collection.find_one({"repo": repo}, sort=[("updated_at", -1)])
     if most_recent_pr and "updated_at" in most_recent_pr:
         return most_recent_pr["updated_at"]
     else:
         # If no PRs exist or if 'updated_at' is missing, return None
         return None
 
-def update_prs():
+def get_sync_watermark(repo=DEFAULT_REPO):
+    # Prefer the repo's sync-state document, fall back to its newest stored PR
+    state = sync_state_collection.find_one({"_id": sync_state_id(repo)})
+    if state and state.get("watermark"):
+        return parse_github_time(state["watermark"])
+    last_update_time = get_last_update_time(repo)
+    if last_update_time:
+        return parse_github_time(last_update_time)
+    return None
+
+def load_known_update_times(repo, pr_numbers):
+    # One projected query for the whole batch instead of a find_one per PR
+    cursor = pr_collection.find(
+        {"repo": repo, "number": {"$in": pr_numbers}},
+        {"number": 1, "updated_at": 1, "_id": 0}
+    )
+    return {doc["number"]: doc.get("updated_at") for doc in cursor}
+
+def flush_pr_writes(operations, ordered=BULK_ORDERED):
+    if not operations:
+        return
+    with timed("persist"):
+        result = pr_collection.bulk_write(operations, ordered=ordered)
+    print(f"Wrote {len(operations)} PRs to MongoDB ({result.upserted_count} inserted, {result.modified_count} updated)")
+    operations.clear()
+
+def fetch_pr_patch_fields(repo, pr_number):
+    # Store the patch as a compressed blob and keep only a reference on the PR
+    pr_patch = fetch_pr_patch(repo, pr_number)
+    return {
+        "patch_ref": store_patch(db, pr_patch),
+        "patch_size": len(pr_patch.encode("utf-8")),
+        "files": patch_file_stats(pr_patch)
+    }
+
+@timed("fetch")
+def enrich_pr(repo, pr):
+    # Fetch additional details, patch and comments for a single PR
+    pr_details = fetch_pr_details(repo, pr['number'])
+    return {
+        "repo": repo,
+        "number": pr['number'],
+        "title": pr['title'],
+        "created_at": pr['created_at'],
+        "merged_at": pr['merged_at'],
+        "updated_at": pr['updated_at'],
+        "user": pr['user']['login'],
+        "body": pr['body'],
+        "comments": fetch_pr_comments(repo, pr['number']),
+        "additions": pr_details['additions'],
+        "deletions": pr_details['deletions'],
+        "changed_files": pr_details['changed_files'],
+        **fetch_pr_patch_fields(repo, pr['number']),
+        "state": pr['state']
+    }
+
+@timed("fetch")
+def enrich_pr_graphql(repo, pr):
+    # Everything but the patch already came back with the GraphQL page, and
+    # the comments too unless there were more than one page of them. Only
+    # PRs that changed since the last sync get here.
+    comments = pr['comments']
+    if comments is None:
+        comments = fetch_pr_comments(repo, pr['number'])
+    return dict(pr, comments=comments, **fetch_pr_patch_fields(repo, pr['number']))
+
+def update_prs(repo=DEFAULT_REPO, from_date=None, concurrency=ENRICH_CONCURRENCY, batch_size=BULK_BATCH_SIZE, backend=FETCH_BACKEND):
     to_date = datetime.now(timezone.utc)
-    from_date = to_date - timedelta(days=30)
-    
-    prs = fetch_recent_merged_prs(from_date, to_date)
-    print(f"Fetched {len(prs)} PRs updated between {from_date.date()} and {to_date.date()}.")
+    if from_date is None:
+        from_date = get_sync_watermark(repo) or to_date - timedelta(days=INITIAL_SYNC_DAYS)
 
+    if backend == "graphql":
+        prs = fetch_recent_merged_prs_graphql(repo, from_date, to_date)
+        enrich = enrich_pr_graphql
+    else:
+        prs = fetch_recent_merged_prs(repo, from_date, to_date)
+        enrich = enrich_pr
+    print(f"[{repo}] Fetched {len(prs)} PRs updated between {from_date.date()} and {to_date.date()}.")
+
+    # Skip PRs whose updated_at matches what is already stored
+    known_update_times = load_known_update_times(repo, [pr['number'] for pr in prs])
+    changed_prs = []
     for pr in prs:
-        # Check if PR exists and if it has been updated
-        existing_pr = pr_collection.find_one({"number": pr['number']})
-        if existing_pr and existing_pr.get('updated_at') == pr['updated_at']:
-            print(f"No changes for PR #{pr['number']}")
+        if known_update_times.get(pr['number']) == pr['updated_at']:
+            print(f"[{repo}] No changes for PR #{pr['number']}")
             continue
+        changed_prs.append(pr)
 
-        # Fetch additional details only if PR is new or updated
-        pr_details = fetch_pr_details(pr['number'])
-        pr_patch = fetch_pr_patch(pr['number'])
-        pr_info = {
-            "number": pr['number'],
-            "title": pr['title'],
-            "created_at": pr['created_at'],
-            "merged_at": pr['merged_at'],
-            "updated_at": pr['updated_at'],
-            "user": pr['user']['login'],
-            "body": pr['body'],
-            "comments": fetch_pr_comments(pr['number']),
-            "additions": pr_details['additions'],
-            "deletions": pr_details['deletions'],
-            "changed_files": pr_details['changed_files'],
-            "patch": pr_patch,
-            "state": pr['state']
-        }
-        
-        # Insert or update the PR in MongoDB
-        result = pr_collection.update_one(
-            {"number": pr['number']},
-            {"$set": pr_info},
-            upsert=True
-        )
-        
-        if result.modified_count > 0:
-            print(f"Updated data for PR #{pr['number']} in MongoDB")
-        elif result.upserted_id:
-            print(f"Inserted new data for PR #{pr['number']} in MongoDB")
+    # Fetch additional details only for new or updated PRs, several at a time
+    enriched = 0
+    failed_update_times = []
+    operations = []
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(enrich, repo, pr): pr for pr in changed_prs}
+        for future in as_completed(futures):
+            pr = futures[future]
+            try:
+                pr_info = future.result()
+            except (requests.RequestException, RuntimeError) as e:
+                failed_update_times.append(pr['updated_at'])
+                print(f"[{repo}] Failed to fetch details for PR #{pr['number']}: {e}")
+                continue
+
+            # Queue the insert or update and write it out once the batch is full
+            operations.append(UpdateOne(
+                {"repo": repo, "number": pr['number']},
+                {"$set": pr_info, "$unset": {"patch": ""}},
+                upsert=True
+            ))
+            enriched += 1
+            if len(operations) >= batch_size:
+                flush_pr_writes(operations)
+
+    flush_pr_writes(operations)
 
-    print("PR data has been updated in MongoDB")
+    elapsed = time.monotonic() - start
+    rate = enriched / elapsed if elapsed > 0 else 0.0
+    print(f"[{repo}] Enriched {enriched} PRs ({len(failed_update_times)} failed) in {elapsed:.1f}s with concurrency {concurrency} ({rate:.2f} PRs/s)")
+
+    # Advance the watermark to the newest PR seen, but never past a PR that
+    # failed to sync so the next cycle picks it up again
+    if failed_update_times:
+        watermark = min(failed_update_times)
+    elif prs:
+        watermark = max(pr['updated_at'] for pr in prs)
+    else:
+        watermark = from_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+    finished_at = datetime.now(timezone.utc)
+    # Sync lag is the time since the last run that left nothing behind
+    previous = sync_state_collection.find_one({"_id": sync_state_id(repo)}, {"last_success_at": 1}) or {}
+    last_success_at = finished_at if not failed_update_times else previous.get("last_success_at")
+    stats = {
+        "repo": repo,
+        "watermark": watermark,
+        "last_run_at": finished_at,
+        "last_success_at": last_success_at,
+        **freshness(last_success_at, watermark, finished_at),
+        "records": enriched,
+        "fetched": len(prs),
+        "failed": len(failed_update_times),
+        "duration_seconds": elapsed
+    }
+    sync_state_collection.update_one({"_id": sync_state_id(repo)}, {"$set": stats}, upsert=True)
+
+    lag = f"{stats['lag_seconds']:.0f}s" if stats["lag_seconds"] is not None else "no complete sync yet"
+    print(f"[{repo}] PR data has been updated in MongoDB (watermark {watermark}, lag {lag})")
+    return stats
+
+def sync_all_repos(repos=None, shards=REPO_SHARDS, backend=FETCH_BACKEND):
+    # One shard per repository; shards share the session, the HTTP cache,
+    # the in-flight cap and the rate-limit schedulers
+    with cache_stats_lock:
+        cache_stats.update(hits=0, misses=0)
+    rest_scheduler.reset_stats()
+    graphql_scheduler.reset_stats()
+
+    repos = repos or configured_repos()
+    start = time.monotonic()
+    repo_stats = []
+    with ThreadPoolExecutor(max_workers=max(1, min(shards, len(repos)))) as executor:
+        futures = {executor.submit(update_prs, repo, backend=backend): repo for repo in repos}
+        for future in as_completed(futures):
+            repo = futures[future]
+            try:
+                repo_stats.append(future.result())
+            except Exception as e:
+                print(f"[{repo}] Sync failed: {e}")
+
+    elapsed = time.monotonic() - start
+    print(f"HTTP cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    rate_limit = {"rest": rest_scheduler.stats(), "graphql": graphql_scheduler.stats()}
+    print(f"GitHub budget: {rate_limit['rest']['consumed']} REST and {rate_limit['graphql']['consumed']} GraphQL calls charged, "
+          f"{rate_limit['rest']['retries'] + rate_limit['graphql']['retries']} retries, {rate_limit['rest']['remaining']} REST calls remaining")
+
+    sweep = {
+        "last_run_at": datetime.now(timezone.utc),
+        "repos": len(repos),
+        "failed_repos": len(repos) - len(repo_stats),
+        "records": sum(stats["records"] for stats in repo_stats),
+        "max_lag_seconds": max((stats["lag_seconds"] for stats in repo_stats if stats["lag_seconds"] is not None), default=None),
+        "max_data_age_seconds": max((stats["data_age_seconds"] for stats in repo_stats), default=None),
+        "duration_seconds": elapsed,
+        "cache": dict(cache_stats),
+        "rate_limit": rate_limit
+    }
+    sync_state_collection.update_one({"_id": SWEEP_STATE_ID}, {"$set": sweep}, upsert=True)
+    print(f"Synced {sweep['records']} PRs across {len(repos)} repositories in {elapsed:.1f}s")
+    return sweep
+
+def migrate_inline_patches(batch_size=BULK_BATCH_SIZE):
+    # Move patches stored inline by older syncs into the blob collection
+    operations = []
+    migrated = 0
+    for pr in pr_collection.find({"patch": {"$exists": True}}, {"patch": 1}):
+        pr_patch = pr["patch"] or ""
+        operations.append(UpdateOne(
+            {"_id": pr["_id"]},
+            {
+                "$set": {
+                    "patch_ref": store_patch(db, pr_patch),
+                    "patch_size": len(pr_patch.encode("utf-8")),
+                    "files": patch_file_stats(pr_patch)
+                },
+                "$unset": {"patch": ""}
+            }
+        ))
+        migrated += 1
+        if len(operations) >= batch_size:
+            flush_pr_writes(operations)
+    flush_pr_writes(operations)
+    print(f"Moved {migrated} inline patches to the patch blob store")
+
+def run_sync_loop(interval=SYNC_INTERVAL_SECONDS, jitter=SYNC_JITTER_SECONDS, backend=FETCH_BACKEND, repos=None):
+    # Long-running worker: sync every repo from its watermark, then sleep and repeat
+    while True:
+        try:
+            sync_all_repos(repos=repos, backend=backend)
+        except Exception as e:
+            print(f"Sync cycle failed: {e}")
+        time.sleep(interval + random.uniform(0, jitter))
 
 if __name__ == "__main__":
-    update_prs()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sync GitHub pull requests into MongoDB.")
+    parser.add_argument("--once", action="store_true", help="run a single sync cycle and exit")
+    parser.add_argument("--backend", choices=["rest", "graphql"], default=FETCH_BACKEND, help="GitHub API used to fetch PRs")
+    parser.add_argument("--migrate-patches", action="store_true", help="move inline patches into the patch blob store and exit")
+    parser.add_argument("--repo", action="append", help="repository to sync as owner/name (repeatable, overrides GITHUB_REPOS)")
+    args = parser.parse_args()
+
+    ensure_pr_indexes()
+    serve_metrics()
+    if args.migrate_patches:
+        migrate_inline_patches()
+    elif args.once:
+        sync_all_repos(repos=args.repo, backend=args.backend)
+    else:
+        run_sync_loop(backend=args.backend, repos=args.repo)
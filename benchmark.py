@@ -0,0 +1,210 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+import httpx
+import mongomock
+
+from fake_openai import FakeOpenAI
+
+# End-to-end throughput of the model-bound stages against the fake OpenAI
+# server (fake_openai.py) and an in-memory MongoDB (mongomock), on synthetic
+# PR corpora of increasing size:
+#
+#   python benchmark.py --sizes 10,100,500 --latency 0.2 --rate-limit-rate 0.02
+#
+# Each stage reports wall time, HTTP calls to the model API (429s and
+# retries included), calls/sec and the p50/p95 latency of those calls as
+# seen by the client.
+
+STAGES = ("agents", "review", "summaries")
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+class CallTimer:
+    # httpx event hooks that time every request a model client sends
+    def __init__(self):
+        self.durations = []
+
+    def reset(self):
+        self.durations = []
+
+    def started(self, request):
+        request.extensions["benchmark_started"] = time.perf_counter()
+
+    def finished(self, response):
+        self.durations.append(time.perf_counter() - response.request.extensions["benchmark_started"])
+
+    async def started_async(self, request):
+        self.started(request)
+
+    async def finished_async(self, response):
+        self.finished(response)
+
+    def async_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(event_hooks={"request": [self.started_async], "response": [self.finished_async]})
+
+    def client(self) -> httpx.Client:
+        return httpx.Client(event_hooks={"request": [self.started], "response": [self.finished]})
+
+def synthetic_patch(rng: random.Random, files: int, lines: int) -> str:
+    chunks = []
+    for index in range(files):
+        path = f"src/module_{rng.randrange(1000)}/file_{index}.py"
+        body = "\n".join(f"+    value_{line} = compute({line}, {rng.randrange(10 ** 6)})" for line in range(lines))
+        chunks.append(f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,0 +1,{lines} @@\n{body}")
+    return "\n".join(chunks)
+
+def seed_corpus(db, size: int, competencies: int, patch_lines: int, seed: int):
+    from repos import DEFAULT_REPO
+
+    rng = random.Random(seed)
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    db.pull_requests.insert_many([
+        {
+            "repo": DEFAULT_REPO,
+            "number": number,
+            "title": f"Synthetic change {number}",
+            "body": f"Refactors module {rng.randrange(1000)} and adds tests for the new behaviour.",
+            "user": f"dev{rng.randrange(5)}",
+            "patch": synthetic_patch(rng, rng.randint(1, 4), patch_lines),
+            "comments": [{"body": f"Review comment {index} on change {number}."} for index in range(rng.randint(0, 5))],
+            "created_at": (created + timedelta(hours=number)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "updated_at": (created + timedelta(hours=number + 1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        }
+        for number in range(1, size + 1)
+    ])
+    db.competencies.insert_many([
+        {"name": f"Competency_{index}", "description": f"Shows skill {index} in design, code quality and testing."}
+        for index in range(competencies)
+    ])
+
+def clear(db):
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+
+def measure(stage: str, size: int, fake: FakeOpenAI, timer: CallTimer, work: Callable[[], Any]) -> Dict[str, Any]:
+    fake.reset()
+    timer.reset()
+    started = time.perf_counter()
+    error = None
+    # The stages log every step; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            work()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - started
+    return {
+        "stage": stage,
+        "prs": size,
+        "wall_s": round(wall, 3),
+        "calls": len(timer.durations),
+        "calls_per_s": round(len(timer.durations) / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(timer.durations, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(timer.durations, 0.95) * 1000, 1),
+        "rate_limited": fake.stats["rate_limited"],
+        "errors": fake.stats["errors"],
+        "error": error
+    }
+
+def run_benchmark(args) -> List[Dict[str, Any]]:
+    fake = FakeOpenAI(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.retry_after, seed=args.seed).start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+    os.environ["RELEVANCE_THRESHOLD"] = str(args.relevance_threshold)
+    timer = CallTimer()
+    results = []
+
+    # Every MongoClient the app modules open shares one in-memory server
+    with mongomock.patch(servers=(("localhost", 27017),)):
+        import frontend
+        from evaluation_engine import EvaluationEngine
+        from openai import AsyncOpenAI
+        from performance_review import REVIEW_MODEL, start_review
+
+        # The app's own engine, with its client pointed at the fake server
+        frontend.EvaluationEngine = lambda: EvaluationEngine(
+            client=AsyncOpenAI(base_url=fake.base_url, max_retries=0, http_client=timer.async_client()),
+            concurrency=args.concurrency
+        )
+        db = frontend.db
+
+        def agents():
+            frontend.process_agents(call_id, args.mode)
+
+        def review():
+            competencies = list(db.competencies.find({}, {"_id": 0, "name": 1, "description": 1}))
+            job, _ = start_review(db.performance_reviews, str(uuid.uuid4()), call_id, competencies, REVIEW_MODEL, force=True)
+            frontend.process_review(job["_id"], call_id, competencies)
+
+        def summaries():
+            import summarize_prs
+            from langchain.chat_models import ChatOpenAI
+
+            summarize_prs.model = ChatOpenAI(temperature=0.7, model=summarize_prs.SUMMARY_MODEL, openai_api_base=fake.base_url,
+                                             http_client=timer.client())
+            summarize_prs.summarize_prs(max_concurrency=args.concurrency)
+
+        stages = {"agents": agents, "review": review, "summaries": summaries}
+        try:
+            for size in args.sizes:
+                clear(db)
+                seed_corpus(db, size, args.competencies, args.patch_lines, args.seed)
+                call_id = str(uuid.uuid4())
+                for stage in args.stages:
+                    result = measure(stage, size, fake, timer, stages[stage])
+                    results.append(result)
+                    if args.json:
+                        print(json.dumps(result), flush=True)
+                    else:
+                        print(format_row(result), flush=True)
+        finally:
+            fake.stop()
+    return results
+
+def format_row(result: Dict[str, Any]) -> str:
+    row = (f"{result['stage']:<10}{result['prs']:>7}{result['wall_s']:>10.2f}{result['calls']:>8}"
+           f"{result['calls_per_s']:>10.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['rate_limited']:>6}{result['errors']:>6}")
+    return row + (f"  {result['error']}" if result["error"] else "")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agent, review and summary stages offline.")
+    parser.add_argument("--sizes", default="10,50,200", help="comma-separated synthetic corpus sizes (PRs)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated stages out of {', '.join(STAGES)}")
+    parser.add_argument("--competencies", type=int, default=5)
+    parser.add_argument("--mode", choices=["per_competency", "multi"], default="per_competency")
+    parser.add_argument("--concurrency", type=int, default=8, help="model calls in flight per stage")
+    parser.add_argument("--patch-lines", type=int, default=40, help="lines per file of each synthetic patch")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    # The synthetic corpus shares few words with the competencies; with the
+    # filter on, most pairs never reach the model
+    parser.add_argument("--relevance-threshold", type=float, default=0.0, help="relevance filter threshold (0 turns it off)")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per result")
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+    args.stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    if not args.json:
+        print(f"{'stage':<10}{'prs':>7}{'wall_s':>10}{'calls':>8}{'calls/s':>10}{'p50_ms':>9}{'p95_ms':>9}{'429s':>6}{'5xx':>6}")
+    run_benchmark(args)
@@ -0,0 +1,150 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+import mongomock
+
+from fake_github import FakeGitHub
+
+# Ingestion throughput of backend.py against the GitHub stand-in
+# (fake_github.py) and an in-memory MongoDB (mongomock):
+#
+#   python benchmark_ingest.py --prs 100,1000 --patch-size 20000 --comments 40
+#
+# For each corpus size it runs a full sweep into an empty database, an
+# incremental sweep with nothing changed, and one after --touch PRs per
+# repository were updated. Each sweep reports wall time, GitHub requests
+# (and how many were 304s), bytes served, and MongoDB operations.
+
+SCENARIOS = ("full", "unchanged", "incremental")
+
+class CountingCollection:
+    # Counts every method call on a collection, e.g. find_one or bulk_write
+    def __init__(self, collection, counts: Counter, lock: threading.Lock):
+        self._collection = collection
+        self._counts = counts
+        self._lock = lock
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def counted(*args, **kwargs):
+            with self._lock:
+                self._counts[f"{self._collection.name}.{name}"] += 1
+            return attribute(*args, **kwargs)
+        return counted
+
+class CountingDatabase:
+    def __init__(self, db):
+        self._db = db
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._db, name)
+        if isinstance(attribute, mongomock.Collection):
+            return CountingCollection(attribute, self.counts, self.lock)
+        return attribute
+
+    def __getitem__(self, name):
+        return CountingCollection(self._db[name], self.counts, self.lock)
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+def run_sweep(scenario: str, size: int, backend, fake: FakeGitHub, counting: CountingDatabase) -> Dict[str, Any]:
+    fake.reset_stats()
+    counting.reset()
+    started = time.perf_counter()
+    # backend logs every PR; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        sweep = backend.sync_all_repos(repos=fake.repos, backend="rest")
+    wall = time.perf_counter() - started
+    return {
+        "scenario": scenario,
+        "prs": size,
+        "repos": len(fake.repos),
+        "wall_s": round(wall, 3),
+        "records": sweep["records"],
+        "requests": fake.stats["requests"],
+        "not_modified": fake.stats["not_modified"],
+        "rate_limited": fake.stats["rate_limited"],
+        "bytes": fake.stats["bytes_sent"],
+        "requests_by_kind": dict(fake.stats["by_kind"]),
+        "mongo_ops": sum(counting.counts.values()),
+        "mongo_ops_by_call": dict(counting.counts),
+        "prs_per_s": round(sweep["records"] / wall, 1) if wall else 0.0
+    }
+
+def run_benchmark(args) -> List[Dict[str, Any]]:
+    results = []
+    for size in args.prs:
+        fake = FakeGitHub(args.repos, size, args.patch_size, args.comments, args.rate_limit, latency=args.latency).start()
+        os.environ["GITHUB_API_URL"] = fake.base_url
+        os.environ["ENRICH_CONCURRENCY"] = str(args.concurrency)
+        os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+        # Wide enough to cover the whole synthetic corpus on the first sweep
+        os.environ["INITIAL_SYNC_DAYS"] = "30"
+        try:
+            # A fresh in-memory server, and a fresh backend module (its
+            # session, HTTP cache and rate-limit state), for every size
+            with mongomock.patch(servers=(("localhost", 27017),)):
+                import importlib
+                import backend
+                backend = importlib.reload(backend)
+                counting = CountingDatabase(backend.db)
+                backend.db = counting
+                backend.pr_collection = counting.pull_requests
+                backend.http_cache_collection = counting.http_cache
+                backend.sync_state_collection = counting.sync_state
+                with contextlib.redirect_stdout(io.StringIO()):
+                    backend.ensure_pr_indexes()
+
+                for scenario in args.scenarios:
+                    if scenario == "incremental":
+                        for repo in fake.repos:
+                            fake.touch(repo, args.touch)
+                    result = run_sweep(scenario, size, backend, fake, counting)
+                    results.append(result)
+                    print(json.dumps(result) if args.json else format_row(result), flush=True)
+        finally:
+            fake.stop()
+    return results
+
+def format_row(result: Dict[str, Any]) -> str:
+    return (f"{result['scenario']:<12}{result['prs']:>7}{result['wall_s']:>9.2f}{result['records']:>9}{result['requests']:>10}"
+            f"{result['not_modified']:>7}{result['bytes'] / 1024:>11.1f}{result['mongo_ops']:>11}{result['prs_per_s']:>9.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PR ingestion against a local GitHub stand-in.")
+    parser.add_argument("--prs", default="100,500", help="comma-separated PRs per repository")
+    parser.add_argument("--repos", default="acme/api", help="comma-separated repositories to serve and sync")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated sweeps out of {', '.join(SCENARIOS)}")
+    parser.add_argument("--patch-size", type=int, default=4000, help="approximate patch size in bytes")
+    parser.add_argument("--comments", type=int, default=5, help="review comments per PR (30 per page)")
+    parser.add_argument("--touch", type=int, default=10, help="PRs per repository updated before the incremental sweep")
+    parser.add_argument("--concurrency", type=int, default=8, help="PRs enriched in parallel")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake GitHub latency in seconds")
+    # Generous by default so backend's pacing doesn't dominate the numbers
+    parser.add_argument("--rate-limit", type=int, default=1000000, help="GitHub calls per rate-limit window")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per sweep")
+    args = parser.parse_args()
+    args.prs = [int(size) for size in args.prs.split(",")]
+    args.repos = [repo.strip() for repo in args.repos.split(",") if repo.strip()]
+    args.scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if not args.json:
+        print(f"{'scenario':<12}{'prs':>7}{'wall_s':>9}{'records':>9}{'requests':>10}{'304s':>7}{'KiB':>11}{'mongo_ops':>11}{'prs/s':>9}")
+    run_benchmark(args)
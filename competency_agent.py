@@ -1,17 +1,51 @@
 import re
 import json
-from openai import OpenAI
-from typing import Dict, Any
+import time
+from openai import OpenAI, AsyncOpenAI
+from typing import Dict, Any, List, Optional
+from metrics import record_completion
+
+class ResponseParseError(ValueError):
+    # A truncated or empty model reply; retried, and never cached as an answer
+    pass
+
+CODE_FENCE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.S)
+
+def reply_content(choice) -> str:
+    # Only truncated or empty replies are worth paying for again; anything
+    # else is parsed, with a ```json fence around it removed
+    content = (choice.message.content or "").strip()
+    if getattr(choice, "finish_reason", None) == "length":
+        raise ResponseParseError("The model's reply was cut off")
+    if not content:
+        raise ResponseParseError("The model's reply was empty")
+    fenced = CODE_FENCE.match(content)
+    return fenced.group(1) if fenced else content
 
 class CompetencyAgent:
-    def __init__(self, competency_description: str, api_key: str):
+    # Bump when the prompt or response parsing changes so cached evaluations
+    # made with the old prompt are no longer reused
+    PROMPT_VERSION = "competency-v1"
+
+    def __init__(self, competency_description: str, api_key: Optional[str] = None,
+                 client: Optional[OpenAI] = None, async_client: Optional[AsyncOpenAI] = None,
+                 model: str = "gpt-4"):
         self.competency_description = competency_description
-        self.client = OpenAI(api_key=api_key)
+        self.model = model
+        # Callers evaluating many PRs pass in one shared client instead of
+        # opening a new one per agent
+        self.async_client = async_client
+        self.client = client or (None if async_client else OpenAI(api_key=api_key))
 
     def generate_prompt(self, pr_patch: str, pr_description: str, pr_link: str) -> str:
+        return self.format_prompt(self.competency_description, pr_patch, pr_description, pr_link)
+
+    @staticmethod
+    def format_prompt(competency_description: str, pr_patch: str, pr_description: str, pr_link: str) -> str:
+        # Static so stored prompts can be rebuilt without an OpenAI client
         return f"""
         Competency Description:
-        {self.competency_description}
+        {competency_description}
 
         PR Description:
         {pr_description}
@@ -30,25 +64,149 @@ class CompetencyAgent:
         }}
         """
 
+    def build_messages(self, pr_patch: str, pr_description: str, pr_link: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": self.generate_prompt(pr_patch, pr_description, pr_link)}
+        ]
+
+    def parse_response(self, content: str, pr_description: str, pr_link: str) -> Dict[str, Any]:
+        try:
+            result = json.loads(content)
+        except ValueError:
+            result = None
+        if not isinstance(result, dict) or not isinstance(result.get("summary"), str):
+            # Prose instead of JSON ("This PR does not relate...") reads as unrelated
+            return {"pr_link": pr_link, "summary": "-"}
+        result["pr_link"] = pr_link
+        # Ensure the summary is "-" if it doesn't relate to the competency
+        if not result["summary"] or result["summary"].strip() == pr_description:
+            result["summary"] = "-"
+        return result
+
     def analyze_pr(self, pr_patch: str, pr_description: str, pr_link: str) -> Dict[str, Any]:
-        prompt = self.generate_prompt(pr_patch, pr_description, pr_link)
-        
+        started = time.monotonic()
         response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
+            model=self.model,
+            messages=self.build_messages(pr_patch, pr_description, pr_link),
+            temperature=0.0
+        )
+        record_completion(self.model, response, time.monotonic() - started)
+        return self.parse_response(reply_content(response.choices[0]), pr_description, pr_link)
+
+    async def analyze_pr_async(self, pr_patch: str, pr_description: str, pr_link: str) -> Dict[str, Any]:
+        started = time.monotonic()
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(pr_patch, pr_description, pr_link),
             temperature=0.0
         )
-        
+        record_completion(self.model, response, time.monotonic() - started)
+        return self.parse_response(reply_content(response.choices[0]), pr_description, pr_link)
+
+class MultiCompetencyAgent:
+    # Scores one PR against every competency in a single structured-output
+    # request, so the patch is only sent (and paid for) once per PR
+    PROMPT_VERSION = "multi-v1"
+
+    def __init__(self, competencies: Dict[str, str], api_key: Optional[str] = None,
+                 client: Optional[OpenAI] = None, async_client: Optional[AsyncOpenAI] = None,
+                 model: str = "gpt-4o-2024-08-06"):
+        self.competencies = competencies
+        self.model = model
+        self.async_client = async_client
+        self.client = client or (None if async_client else OpenAI(api_key=api_key))
+
+    def generate_prompt(self, pr_patch: str, pr_description: str, pr_link: str) -> str:
+        return self.format_prompt(self.competencies, pr_patch, pr_description, pr_link)
+
+    @staticmethod
+    def format_prompt(competencies: Dict[str, str], pr_patch: str, pr_description: str, pr_link: str) -> str:
+        competency_list = "\n".join(
+            f"        - {name}: {description}" for name, description in competencies.items()
+        )
+        return f"""
+        Competencies:
+{competency_list}
+
+        PR Description:
+        {pr_description}
+
+        PR Patch:
+        {pr_patch}
+
+        PR Link:
+        {pr_link}
+
+        For each competency, determine if the PR relates to it. If it does, summarize the relevant parts starting with the PR title and name of the competency it relates to. If it does not, answer "-".
+        """
+
+    def response_format(self) -> Dict[str, Any]:
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "competency_evaluations",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "evaluations": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "competency": {"type": "string", "enum": list(self.competencies)},
+                                    "summary": {"type": "string"}
+                                },
+                                "required": ["competency", "summary"],
+                                "additionalProperties": False
+                            }
+                        }
+                    },
+                    "required": ["evaluations"],
+                    "additionalProperties": False
+                }
+            }
+        }
+
+    def build_messages(self, pr_patch: str, pr_description: str, pr_link: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": self.generate_prompt(pr_patch, pr_description, pr_link)}
+        ]
+
+    def parse_response(self, content: str, pr_description: str, pr_link: str) -> Dict[str, Dict[str, Any]]:
+        # One result per competency the reply answers, in the same shape
+        # CompetencyAgent returns; a reply that doesn't follow the schema
+        # answers none (they are stored as "-" but not cached)
         try:
-            result = json.loads(response.choices[0].message.content.strip())
-            result["pr_link"] = pr_link
-            # Ensure the summary is "-" if it doesn't relate to the competency
-            if not result["summary"] or result["summary"].strip() == pr_description:
-                result["summary"] = "-"
-            return result
-        except:
-            return {"pr_link": pr_link, "summary": "-"}
+            evaluations = json.loads(content)["evaluations"]
+            answers = {evaluation["competency"]: (evaluation.get("summary") or "").strip() for evaluation in evaluations}
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return {}
+        return {
+            name: {"pr_link": pr_link, "summary": summary if summary and summary != pr_description else "-"}
+            for name, summary in answers.items() if name in self.competencies
+        }
+
+    def analyze_pr(self, pr_patch: str, pr_description: str, pr_link: str) -> Dict[str, Dict[str, Any]]:
+        started = time.monotonic()
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(pr_patch, pr_description, pr_link),
+            response_format=self.response_format(),
+            temperature=0.0
+        )
+        record_completion(self.model, response, time.monotonic() - started)
+        return self.parse_response(reply_content(response.choices[0]), pr_description, pr_link)
 
+    async def analyze_pr_async(self, pr_patch: str, pr_description: str, pr_link: str) -> Dict[str, Dict[str, Any]]:
+        started = time.monotonic()
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(pr_patch, pr_description, pr_link),
+            response_format=self.response_format(),
+            temperature=0.0
+        )
+        record_completion(self.model, response, time.monotonic() - started)
+        return self.parse_response(reply_content(response.choices[0]), pr_description, pr_link)
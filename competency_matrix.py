@@ -0,0 +1,10 @@
+# The competency matrix shown on the dashboard until a user saves their own
+DEFAULT_COMPETENCIES = {
+    "Writing_code": "Consistently writes production-ready code that is easily testable, easily understood by other developers, and accounts for edge cases and errors. Understands when it is appropriate to leave comments, but biases towards self-documenting code.",
+    "Testing": "Understands the testing pyramid, and writes unit tests as well as higher level tests in accordance with it. Always writes tests to handle expected edge cases and errors gracefully, as well as happy paths.",
+    "Debugging": "Proficient at using systematic debugging to diagnose all issues located to a single service. Uses systematic debugging to diagnose cross service issues, sometimes with help from more senior engineers.",
+    "Observability": "Is aware of the organization's monitoring philosophy. Helps tune and change the monitoring on their team accordingly. Is aware of the operational data for their team's domain and uses it as a basis for suggesting stability and performance improvements.",
+    "Understanding_Code": "Understands their team's domain at a high level and can gather sufficient context to work productively within it. Has expertise in a portion of their team's domain.",
+    "Software_Architecture": "Consistently designs code that is aligned with the overall service architecture. Utilizes abstractions and code isolation effectively.",
+    "Security": "Approaches all engineering work with a security lens. Actively looks for security vulnerabilities both in the code and when providing peer reviews."
+}
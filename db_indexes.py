@@ -0,0 +1,131 @@
+import argparse
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+from evaluation_cache import EVALUATION_CACHE_TTL_DAYS
+
+# Conditional-request cache entries not refetched for this long are dropped
+HTTP_CACHE_TTL_DAYS = int(os.getenv("HTTP_CACHE_TTL_DAYS", "14"))
+
+# Every index the app relies on, per collection, next to the query it serves.
+# The web and worker processes apply these at startup; `python db_indexes.py
+# --check` lists the ones missing from a database without creating them.
+REQUIRED_INDEXES: Dict[str, List[Dict]] = {
+    "pull_requests": [
+        # backend upserts, the $in lookups of a sync batch and summarize_prs --repo
+        {"keys": [("repo", 1), ("number", 1)], "unique": True},
+        # get_last_update_time: newest PR of a repo
+        {"keys": [("repo", 1), ("updated_at", -1)]},
+        # dashboard: a user's most recently updated PRs
+        {"keys": [("user", 1), ("updated_at", -1)]},
+        # summarize_prs: PR number ranges, in number order
+        {"keys": [("number", 1)]}
+    ],
+    "agent_logs": [
+        # /agent_logs/<call_id> and /agent_events/<call_id>, paged by _id
+        {"keys": [("call_id", 1), ("_id", 1)]},
+        {"keys": [("call_id", 1), ("timestamp", 1)]},
+        {"keys": [("review_id", 1)], "sparse": True}
+    ],
+    "agent_responses": [
+        # /agent_responses/<call_id>, paged by _id, and per-run review evidence
+        {"keys": [("call_id", 1), ("_id", 1)]},
+        # idempotent response writes of (retried) work items
+        {"keys": [("call_id", 1), ("repo", 1), ("pr_number", 1), ("competency_name", 1)]}
+    ],
+    "agent_runs": [
+        # at most one in-flight run per fingerprint, and queued runs oldest first
+        {"keys": [("active_fingerprint", 1)], "unique": True, "sparse": True},
+        {"keys": [("status", 1), ("created_at", 1)]}
+    ],
+    "work_items": [
+        # claims: pending items oldest first, or leases that ran out
+        {"keys": [("status", 1), ("created_at", 1), ("_id", 1)]},
+        {"keys": [("status", 1), ("lease_expires_at", 1)]},
+        # open items of a run, to tell when it is done
+        {"keys": [("call_id", 1), ("status", 1)]}
+    ],
+    "evaluation_cache": [
+        {"keys": [("last_used_at", 1)], "expireAfterSeconds": EVALUATION_CACHE_TTL_DAYS * 24 * 3600},
+        {"keys": [("competency_hash", 1)]}
+    ],
+    "http_cache": [
+        {"keys": [("fetched_at", 1)], "expireAfterSeconds": HTTP_CACHE_TTL_DAYS * 24 * 3600}
+    ],
+    "performance_reviews": [
+        # stored review lookup, and at most one active job per review key
+        {"keys": [("key", 1), ("status", 1), ("finished_at", -1)]},
+        {"keys": [("active_key", 1)], "unique": True, "sparse": True}
+    ],
+    "summaries": [
+        {"keys": [("pr_hash", 1)]}
+    ],
+    "competencies": [
+        {"keys": [("name", 1)]}
+    ],
+    "competency_matrices": [
+        {"keys": [("user_id", 1)]}
+    ]
+}
+
+def index_options(spec: Dict) -> Dict:
+    return {key: value for key, value in spec.items() if key != "keys"}
+
+def existing_keys(collection) -> List[List[Tuple[str, int]]]:
+    # The server may report directions as doubles (1.0)
+    return [
+        [(field, int(direction) if isinstance(direction, float) else direction) for field, direction in info["key"]]
+        for info in collection.index_information().values()
+    ]
+
+def missing_indexes(db, required: Optional[Dict[str, List[Dict]]] = None) -> List[Tuple[str, List[Tuple[str, int]]]]:
+    # Matched on keys only: an index with the right keys but other options
+    # (a changed TTL, say) still serves the query
+    missing = []
+    for collection_name, specs in (required or REQUIRED_INDEXES).items():
+        present = existing_keys(db[collection_name])
+        for spec in specs:
+            if list(spec["keys"]) not in present:
+                missing.append((collection_name, list(spec["keys"])))
+    return missing
+
+def ensure_indexes(db, required: Optional[Dict[str, List[Dict]]] = None) -> List[str]:
+    # create_index is a no-op for indexes that already exist, so this is
+    # safe to run from every process on every start
+    created = []
+    for collection_name, specs in (required or REQUIRED_INDEXES).items():
+        for spec in specs:
+            try:
+                created.append(f"{collection_name}.{db[collection_name].create_index(spec['keys'], **index_options(spec))}")
+            except OperationFailure as e:
+                # An index with the same keys but different options; keep it
+                print(f"Could not create index on {collection_name} {spec['keys']}: {e}")
+    return created
+
+def ensure_indexes_at_startup(db):
+    # For services starting up: report problems instead of failing to start
+    try:
+        ensure_indexes(db)
+        for collection_name, keys in missing_indexes(db):
+            print(f"Missing index on {collection_name}: {keys}")
+    except Exception as e:
+        print(f"Error ensuring indexes: {e}")
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Create or check the MongoDB indexes the app relies on.")
+    parser.add_argument("--check", action="store_true", help="only report missing indexes; exit 1 if any are missing")
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URI")).github_prs
+    if not args.check:
+        print(f"Ensured {len(ensure_indexes(db))} indexes.")
+    missing = missing_indexes(db)
+    for collection_name, keys in missing:
+        print(f"Missing index on {collection_name}: {keys}")
+    sys.exit(1 if missing else 0)
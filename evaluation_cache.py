@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+# Entries not read or written for this many days are dropped by a TTL index
+EVALUATION_CACHE_TTL_DAYS = int(os.getenv("EVALUATION_CACHE_TTL_DAYS", "30"))
+
+def text_hash(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+def evaluation_key(pr_patch: str, pr_description: str, competency_description: str, model: str, prompt_version: str) -> str:
+    # Everything that can change the model's answer is part of the key, so
+    # editing one competency only misses that competency's entries
+    parts = [text_hash(pr_patch), text_hash(pr_description), text_hash(competency_description), model, prompt_version]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+class EvaluationCache:
+    # The TTL and competency_hash indexes are declared in db_indexes
+    def __init__(self, collection):
+        self.collection = collection
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(keys)
+        found = {
+            entry["_id"]: entry["summary"]
+            for entry in self.collection.find({"_id": {"$in": keys}}, {"summary": 1})
+        }
+        if found:
+            # Reading an entry keeps it alive under the TTL policy
+            self.collection.update_many({"_id": {"$in": list(found)}}, {"$set": {"last_used_at": datetime.now(timezone.utc)}})
+        with self.lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+
+    def put(self, key: str, summary: str, competency_description: str, model: str, prompt_version: str):
+        now = datetime.now(timezone.utc)
+        self.collection.update_one(
+            {"_id": key},
+            {
+                "$set": {
+                    "summary": summary,
+                    "competency_hash": text_hash(competency_description),
+                    "model": model,
+                    "prompt_version": prompt_version,
+                    "last_used_at": now
+                },
+                "$setOnInsert": {"created_at": now}
+            },
+            upsert=True
+        )
+
+    def invalidate(self, competency_description: Optional[str] = None) -> int:
+        # Drop one competency's entries, or the whole cache
+        query = {} if competency_description is None else {"competency_hash": text_hash(competency_description)}
+        return self.collection.delete_many(query).deleted_count
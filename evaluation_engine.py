@@ -0,0 +1,111 @@
+import asyncio
+import os
+import random
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+import openai
+from openai import AsyncOpenAI
+
+from competency_agent import ResponseParseError
+from metrics import EVALUATION_FAILURES, record_retry
+
+# Number of model calls in flight at once, and how often a rate-limited or
+# failed call is retried before the pair is given up on
+EVALUATION_CONCURRENCY = int(os.getenv("EVALUATION_CONCURRENCY", "8"))
+EVALUATION_MAX_RETRIES = int(os.getenv("EVALUATION_MAX_RETRIES", "5"))
+
+_DONE = object()
+
+def is_retryable(error: Exception) -> bool:
+    # Truncated or empty replies are usually one-offs
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, ResponseParseError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class EvaluationEngine:
+    def __init__(self, client: Optional[AsyncOpenAI] = None, concurrency: int = EVALUATION_CONCURRENCY,
+                 max_retries: int = EVALUATION_MAX_RETRIES, base_backoff: float = 1.0, max_backoff: float = 60.0):
+        # One async client for the whole run; retries are handled here so
+        # they can be counted and share the backoff policy
+        self.client = client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.retries = 0
+        self.failures = 0
+
+    async def call_with_retries(self, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await make_call()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    # Exponential backoff with full jitter
+                    delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+                self.retries += 1
+                record_retry()
+                await asyncio.sleep(delay)
+
+    async def run(self, jobs: Iterable[Any], handle: Callable[[Any], Awaitable[None]],
+                  on_error: Optional[Callable[[Any, Exception], Awaitable[None]]] = None):
+        # Feed jobs to a fixed pool of workers through a bounded queue, so only
+        # a few jobs (and their patches) are held in memory at a time. The job
+        # iterator may block on MongoDB, so it is advanced off the event loop.
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                job = await queue.get()
+                if job is _DONE:
+                    return
+                try:
+                    await handle(job)
+                except Exception as e:
+                    self.failures += 1
+                    EVALUATION_FAILURES.inc()
+                    if on_error:
+                        try:
+                            await on_error(job, e)
+                        except Exception as report_error:
+                            # A failed report must not take the worker down
+                            print(f"Could not report failed job: {report_error}")
+
+        async def put(item) -> bool:
+            # Gives up, instead of waiting on a full queue forever, once no
+            # worker is left to take the item
+            putting = asyncio.ensure_future(queue.put(item))
+            while not putting.done():
+                alive = [task for task in workers if not task.done()]
+                if not alive:
+                    putting.cancel()
+                    return False
+                await asyncio.wait([putting, *alive], return_when=asyncio.FIRST_COMPLETED)
+            return True
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        iterator = iter(jobs)
+        try:
+            while True:
+                job = await asyncio.to_thread(next, iterator, _DONE)
+                if job is _DONE or not await put(job):
+                    break
+        finally:
+            for _ in workers:
+                if not await put(_DONE):
+                    break
+            # Raises the error of a worker that died, if any
+            await asyncio.gather(*workers)
@@ -0,0 +1,167 @@
+import json
+import os
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterator, Optional
+
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from response_store import HEAVY_FIELDS
+
+# Server-Sent Events for one agent run: new agent_logs entries and stored
+# agent_responses are pushed as they are written. Mongo change streams are
+# used when the deployment supports them (replica sets, Atlas); otherwise
+# both collections are polled with an _id cursor, so each tick only reads
+# new documents.
+
+AGENT_EVENTS_POLL_SECONDS = float(os.getenv("AGENT_EVENTS_POLL_SECONDS", "1.0"))
+AGENT_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("AGENT_EVENTS_HEARTBEAT_SECONDS", "15"))
+AGENT_EVENTS_CHANGE_STREAMS = os.getenv("AGENT_EVENTS_CHANGE_STREAMS", "true").lower() == "true"
+
+FINAL_STATUSES = ("completed", "error")
+
+# ObjectIds only order documents from one process: entries another agent
+# worker flushes late can get a lower _id than ones already read. Readers
+# therefore re-read this much before their cursor; the stream skips what it
+# has sent, and clients skip documents they already have by _id.
+CURSOR_OVERLAP_SECONDS = 5
+
+def parse_cursor(value: Optional[str]) -> Optional[ObjectId]:
+    # Raises bson.errors.InvalidId for anything that isn't an ObjectId
+    return ObjectId(value) if value else None
+
+def format_event(event: str, data: Any, event_id: Optional[str] = None) -> str:
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+def new_documents(collection, call_id: str, cursor: Optional[ObjectId], projection: Optional[Dict[str, int]] = None,
+                  limit: int = 0):
+    # ObjectIds are assigned at insert time, so "_id > cursor" picks up
+    # buffered log entries even when their timestamps are older
+    query = {"call_id": call_id}
+    if cursor is not None:
+        query["_id"] = {"$gt": cursor}
+    return list(collection.find(query, projection).sort("_id", 1).limit(limit))
+
+def overlap_start(cursor: Optional[ObjectId]) -> Optional[ObjectId]:
+    if cursor is None:
+        return None
+    return ObjectId.from_datetime(cursor.generation_time - timedelta(seconds=CURSOR_OVERLAP_SECONDS))
+
+def late_documents(collection, call_id: str, cursor: Optional[ObjectId], projection: Optional[Dict[str, int]] = None,
+                   limit: int = 0):
+    # The overlap window just before a cursor: documents written late by
+    # another process, along with ones the reader has already seen
+    if cursor is None:
+        return []
+    query = {"call_id": call_id, "_id": {"$gt": overlap_start(cursor), "$lte": cursor}}
+    return list(collection.find(query, projection).sort("_id", 1).limit(limit))
+
+class RunEventStream:
+    def __init__(self, logs, responses, call_id: str, log_cursor: Optional[ObjectId] = None,
+                 response_cursor: Optional[ObjectId] = None, poll_interval: float = AGENT_EVENTS_POLL_SECONDS,
+                 heartbeat_interval: float = AGENT_EVENTS_HEARTBEAT_SECONDS, use_change_streams: bool = AGENT_EVENTS_CHANGE_STREAMS,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.logs = logs
+        self.responses = responses
+        self.call_id = call_id
+        self.log_cursor = log_cursor
+        self.response_cursor = response_cursor
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.use_change_streams = use_change_streams
+        self.clock = clock
+        self.sleep = sleep
+        self.finished = False
+        self.last_sent = clock()
+        # After a resume this starts empty, so the overlap window before the
+        # cursors is sent again; the client skips what it already has
+        self.sent = set()
+
+    def event_id(self) -> str:
+        # Both cursors travel in the SSE id, so a reconnecting EventSource
+        # resumes from Last-Event-ID without replaying anything
+        return f"{self.log_cursor or ''}.{self.response_cursor or ''}"
+
+    def is_new(self, document: Dict[str, Any]) -> bool:
+        return document["_id"] not in self.sent
+
+    def emit_log(self, log: Dict[str, Any]) -> str:
+        self.sent.add(log["_id"])
+        self.log_cursor = max(self.log_cursor, log["_id"]) if self.log_cursor else log["_id"]
+        if log.get("status") in FINAL_STATUSES:
+            self.finished = True
+        self.last_sent = self.clock()
+        return format_event("log", {**log, "_id": str(log["_id"])}, self.event_id())
+
+    def emit_response(self, response: Dict[str, Any]) -> str:
+        self.sent.add(response["_id"])
+        self.response_cursor = max(self.response_cursor, response["_id"]) if self.response_cursor else response["_id"]
+        self.last_sent = self.clock()
+        response = {key: value for key, value in response.items() if key not in HEAVY_FIELDS}
+        return format_event("response", {**response, "_id": str(response["_id"])}, self.event_id())
+
+    def poll(self) -> Iterator[str]:
+        # Logs are read first: every response of a run is written before its
+        # final log entry, so seeing "completed" means the responses read
+        # next are complete too
+        logs = new_documents(self.logs, self.call_id, overlap_start(self.log_cursor))
+        responses = new_documents(self.responses, self.call_id, overlap_start(self.response_cursor), {field: 0 for field in HEAVY_FIELDS})
+        for response in responses:
+            if self.is_new(response):
+                yield self.emit_response(response)
+        for log in logs:
+            if self.is_new(log):
+                yield self.emit_log(log)
+
+    def heartbeat(self) -> Iterator[str]:
+        if self.clock() - self.last_sent >= self.heartbeat_interval:
+            self.last_sent = self.clock()
+            # An SSE comment; keeps proxies from closing an idle stream
+            yield ": keepalive\n\n"
+
+    def watch(self) -> Iterator[str]:
+        pipeline = [{"$match": {
+            "operationType": "insert",
+            "ns.coll": {"$in": [self.logs.name, self.responses.name]},
+            "fullDocument.call_id": self.call_id
+        }}]
+        # Open the stream before catching up, so nothing written in between is lost
+        with self.logs.database.watch(pipeline, max_await_time_ms=int(self.poll_interval * 1000)) as stream:
+            yield from self.poll()
+            while not self.finished and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    yield from self.heartbeat()
+                    continue
+                document = change["fullDocument"]
+                if change["ns"]["coll"] == self.logs.name:
+                    if self.is_new(document):
+                        yield self.emit_log(document)
+                elif self.is_new(document):
+                    yield self.emit_response(document)
+
+    def __iter__(self) -> Iterator[str]:
+        if self.log_cursor is not None and self.logs.find_one({
+            "call_id": self.call_id, "status": {"$in": list(FINAL_STATUSES)}, "_id": {"$lte": self.log_cursor}
+        }):
+            # Resumed after the final entry was already sent
+            self.finished = True
+        if self.use_change_streams and not self.finished:
+            try:
+                yield from self.watch()
+            except PyMongoError as e:
+                # Standalone servers have no change streams; poll instead
+                print(f"Change stream unavailable, polling agent events: {e}")
+        while not self.finished:
+            yield from self.poll()
+            if self.finished:
+                break
+            yield from self.heartbeat()
+            self.sleep(self.poll_interval)
+        yield format_event("end", {"call_id": self.call_id}, self.event_id())
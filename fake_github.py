@@ -0,0 +1,285 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+# A local stand-in for the parts of the GitHub REST API that backend.py
+# uses, serving a synthetic corpus of closed PRs:
+#
+#   GET /orgs/{org}/repos
+#   GET /repos/{owner}/{name}/pulls                 (page/per_page, Link)
+#   GET /repos/{owner}/{name}/pulls/{number}        (JSON, or the .patch media type)
+#   GET /repos/{owner}/{name}/pulls/{number}/comments
+#
+# Responses carry ETags and answer a matching If-None-Match with a 304,
+# which like on GitHub doesn't count against the rate limit. Every other
+# response spends one call of the X-RateLimit-* budget; once it is gone,
+# requests get a 403 until the window resets. Point backend.py at it with
+# GITHUB_API_URL.
+
+PATCH_MEDIA_TYPE = "application/vnd.github.v3.patch"
+
+def github_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def synthetic_patch(rng: random.Random, files: int, size: int) -> str:
+    # Roughly `size` bytes of format-patch output spread over `files` files
+    lines = max(1, size // (files * 48))
+    chunks = [f"From {rng.getrandbits(160):040x} Mon Sep 17 00:00:00 2001\nSubject: [PATCH] Synthetic change\n"]
+    for index in range(files):
+        path = f"src/module_{rng.randrange(100)}/file_{index}.py"
+        body = "\n".join(f"+    value_{line} = compute({line}, {rng.randrange(10 ** 6):>7})" for line in range(lines))
+        chunks.append(f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,0 +1,{lines} @@\n{body}")
+    return "\n".join(chunks) + "\n-- \n2.40.0\n"
+
+class FakeGitHub:
+    def __init__(self, repos: Optional[List[str]] = None, prs_per_repo: int = 100, patch_size: int = 4000,
+                 comments_per_pr: int = 5, rate_limit: int = 5000, rate_window: float = 3600.0, latency: float = 0.0,
+                 seed: int = 1, host: str = "127.0.0.1", port: int = 0):
+        self.repos = repos or ["acme/api"]
+        self.patch_size = patch_size
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.rate_remaining = rate_limit
+        self.rate_reset_at = time.time() + rate_window
+        self.pulls = {repo: self.synthetic_pulls(repo, prs_per_repo, comments_per_pr) for repo in self.repos}
+        self.reset_stats()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def synthetic_pulls(self, repo: str, count: int, comments_per_pr: int) -> Dict[int, Dict[str, Any]]:
+        # Updated over the last week, newest first by number
+        now = datetime.now(timezone.utc)
+        spacing = timedelta(days=7) / max(count, 1)
+        pulls = {}
+        for number in range(1, count + 1):
+            updated = now - spacing * (count - number + 1)
+            pulls[number] = {
+                "number": number,
+                "title": f"Synthetic change {number} in {repo}",
+                "body": f"Refactors module {self.random.randrange(100)} and adds tests for the new behaviour.",
+                "user": {"login": f"dev{self.random.randrange(5)}", "type": "User"},
+                "state": "closed",
+                "created_at": github_time(updated - timedelta(hours=6)),
+                "merged_at": github_time(updated),
+                "updated_at": github_time(updated),
+                "files": self.random.randint(1, 4),
+                "seed": self.random.getrandbits(32),
+                "comments": [
+                    {
+                        "id": number * 1000 + index,
+                        "body": f"Review comment {index} on change {number}.",
+                        "path": "src/module/file.py",
+                        "user": {"login": f"reviewer{index % 3}"},
+                        "created_at": github_time(updated - timedelta(minutes=index)),
+                        "updated_at": github_time(updated - timedelta(minutes=index))
+                    }
+                    for index in range(comments_per_pr)
+                ]
+            }
+        return pulls
+
+    def touch(self, repo: str, count: int) -> List[int]:
+        # Update `count` random PRs of a repo now, as a new review or edit would
+        with self.lock:
+            numbers = self.random.sample(sorted(self.pulls[repo]), min(count, len(self.pulls[repo])))
+            now = datetime.now(timezone.utc)
+            for number in numbers:
+                pull = self.pulls[repo][number]
+                pull["updated_at"] = github_time(now)
+                pull["body"] += " (edited)"
+        return numbers
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "not_modified": 0, "rate_limited": 0, "bytes_sent": 0, "by_kind": {}}
+
+    def count_request(self, kind: str, status: int, size: int):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_sent"] += size
+            self.stats["by_kind"][kind] = self.stats["by_kind"].get(kind, 0) + 1
+            if status == 304:
+                self.stats["not_modified"] += 1
+            if status == 403:
+                self.stats["rate_limited"] += 1
+
+    def spend(self) -> Tuple[bool, Dict[str, str]]:
+        # Charges one call; False once the budget of the window is spent
+        with self.lock:
+            now = time.time()
+            if now >= self.rate_reset_at:
+                self.rate_remaining = self.rate_limit
+                self.rate_reset_at = now + self.rate_window
+            allowed = self.rate_remaining > 0
+            if allowed:
+                self.rate_remaining -= 1
+            return allowed, self.rate_headers()
+
+    def rate_headers(self) -> Dict[str, str]:
+        return {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(self.rate_remaining),
+            "X-RateLimit-Reset": str(int(self.rate_reset_at)),
+            "X-RateLimit-Used": str(self.rate_limit - self.rate_remaining),
+            "X-RateLimit-Resource": "core"
+        }
+
+    def page(self, items: List[Any], query: Dict[str, str], path: str, default_per_page: int = 30):
+        per_page = min(int(query.get("per_page", default_per_page)), 100)
+        page = max(int(query.get("page", 1)), 1)
+        last = max(1, -(-len(items) // per_page))
+        links = []
+        for rel, number in (("next", page + 1), ("last", last)) if page < last else ():
+            links.append(f'<{self.base_url}{path}?{urlencode({**query, "page": number})}>; rel="{rel}"')
+        if page > 1:
+            links.append(f'<{self.base_url}{path}?{urlencode({**query, "page": 1})}>; rel="first"')
+            links.append(f'<{self.base_url}{path}?{urlencode({**query, "page": page - 1})}>; rel="prev"')
+        return items[(page - 1) * per_page:page * per_page], ", ".join(links)
+
+    def pull_summary(self, repo: str, pull: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"{self.base_url}/repos/{repo}/pulls/{pull['number']}"
+        return {
+            "url": url,
+            "html_url": f"https://github.com/{repo}/pull/{pull['number']}",
+            "number": pull["number"],
+            "state": pull["state"],
+            "title": pull["title"],
+            "user": pull["user"],
+            "body": pull["body"],
+            "created_at": pull["created_at"],
+            "updated_at": pull["updated_at"],
+            "closed_at": pull["merged_at"],
+            "merged_at": pull["merged_at"],
+            "comments_url": f"{url}/comments",
+            "base": {"ref": "main", "repo": {"full_name": repo}},
+            "head": {"ref": f"change-{pull['number']}", "repo": {"full_name": repo}}
+        }
+
+    def patch(self, pull: Dict[str, Any]) -> str:
+        return synthetic_patch(random.Random(pull["seed"]), pull["files"], self.patch_size)
+
+    def resolve(self, path: str, query: Dict[str, str], accept: str):
+        # (kind, status, body, content type, extra headers) for a GET
+        match = re.fullmatch(r"/orgs/([^/]+)/repos", path)
+        if match:
+            repos = [{"full_name": repo, "archived": False} for repo in self.repos if repo.split("/")[0] == match.group(1)]
+            items, link = self.page(repos, query, path)
+            return "repos", 200, json.dumps(items), "application/json", {"Link": link} if link else {}
+
+        match = re.fullmatch(r"/repos/([^/]+/[^/]+)/pulls(?:/(\d+))?(/comments)?", path)
+        if not match or match.group(1) not in self.pulls:
+            return "unknown", 404, json.dumps({"message": "Not Found"}), "application/json", {}
+        repo, number, comments = match.group(1), match.group(2), match.group(3)
+        with self.lock:
+            pulls = self.pulls[repo]
+            if number is None:
+                ordered = sorted(pulls.values(), key=lambda pull: pull["updated_at"], reverse=query.get("direction", "desc") == "desc")
+                items, link = self.page([self.pull_summary(repo, pull) for pull in ordered], query, path)
+                return "pulls", 200, json.dumps(items), "application/json", {"Link": link} if link else {}
+            pull = pulls.get(int(number))
+            if pull is None:
+                return "unknown", 404, json.dumps({"message": "Not Found"}), "application/json", {}
+            if comments:
+                items, link = self.page(pull["comments"], query, path)
+                return "comments", 200, json.dumps(items), "application/json", {"Link": link} if link else {}
+            if PATCH_MEDIA_TYPE in accept:
+                return "patch", 200, self.patch(pull), "text/x-patch; charset=utf-8", {}
+            patch = self.patch(pull)
+            details = {
+                **self.pull_summary(repo, pull),
+                "additions": patch.count("\n+") - pull["files"],
+                "deletions": 0,
+                "changed_files": pull["files"],
+                "comments": len(pull["comments"])
+            }
+            return "details", 200, json.dumps(details), "application/json", {}
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def reply(self, kind: str, status: int, body: bytes, content_type: str, headers: Dict[str, str]):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                fake.count_request(kind, status, len(body))
+
+            def do_GET(self):
+                time.sleep(fake.latency)
+                url = urlsplit(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                kind, status, body, content_type, headers = fake.resolve(url.path, query, self.headers.get("Accept", ""))
+                body = body.encode("utf-8")
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    with fake.lock:
+                        rate_headers = fake.rate_headers()
+                    return self.reply(kind, 304, b"", content_type, {"ETag": etag, **rate_headers})
+                allowed, rate_headers = fake.spend()
+                if not allowed:
+                    body = json.dumps({"message": "API rate limit exceeded"}).encode("utf-8")
+                    return self.reply(kind, 403, body, "application/json", rate_headers)
+                if status == 200:
+                    headers = {"ETag": etag, **headers}
+                self.reply(kind, status, body, content_type, {**headers, **rate_headers})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeGitHub":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a synthetic GitHub REST API.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--repo", action="append", help="repository to serve as owner/name (repeatable)")
+    parser.add_argument("--prs", type=int, default=100, help="closed PRs per repository")
+    parser.add_argument("--patch-size", type=int, default=4000, help="approximate patch size in bytes")
+    parser.add_argument("--comments", type=int, default=5, help="review comments per PR")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="calls per rate-limit window")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    args = parser.parse_args()
+
+    fake = FakeGitHub(args.repo, args.prs, args.patch_size, args.comments, args.rate_limit, latency=args.latency, port=args.port)
+    print(f"Fake GitHub API at {fake.base_url} (set GITHUB_API_URL to use it)")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,201 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# A local stand-in for the OpenAI chat completions API, for benchmarks and
+# offline tests. Point a client at it with base_url (or OPENAI_BASE_URL) and
+# it answers every request after a configurable latency, fails a share of
+# them with 500s or 429s, and fills in structured outputs from the request's
+# JSON schema: response_format for structured-output calls, or the schema a
+# LangChain output parser puts in the prompt.
+
+CANNED_SUMMARY = "Synthetic summary of the relevant changes in this pull request."
+CANNED_TEXT = "Synthetic review: consistent, well-tested work with clear descriptions."
+
+def sample(schema: Dict[str, Any], root: Optional[Dict[str, Any]] = None) -> Any:
+    # The smallest value that satisfies the schema; an array of objects
+    # keyed by an enum gets one item per enum value, so every competency of
+    # a multi-competency call is answered
+    root = root or schema
+    if "$ref" in schema:
+        name = schema["$ref"].split("/")[-1]
+        return sample((root.get("$defs") or root.get("definitions") or {})[name], root)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "allOf" in schema:
+        return sample(schema["allOf"][0], root)
+    kind = schema.get("type")
+    if kind == "object" or "properties" in schema:
+        return {name: sample(spec, root) for name, spec in schema.get("properties", {}).items()}
+    if kind == "array":
+        items = schema.get("items", {})
+        if "$ref" in items:
+            items = (root.get("$defs") or root.get("definitions") or {})[items["$ref"].split("/")[-1]]
+        for name, spec in items.get("properties", {}).items():
+            if "enum" in spec:
+                return [{**sample(items, root), name: value} for value in spec["enum"]]
+        return [sample(items, root)]
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    return CANNED_SUMMARY
+
+def prompt_schema(prompt: str) -> Optional[Dict[str, Any]]:
+    # PydanticOutputParser format instructions end with the schema in a
+    # fenced block
+    for block in re.findall(r"```(?:json)?\s*(\{.*?\})\s*```", prompt, re.S):
+        try:
+            schema = json.loads(block)
+        except ValueError:
+            continue
+        if "properties" in schema:
+            return schema
+    return None
+
+def canned_content(body: Dict[str, Any]) -> str:
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return json.dumps(sample(response_format["json_schema"]["schema"]))
+    prompt = "\n".join(
+        message["content"] if isinstance(message.get("content"), str) else json.dumps(message.get("content"))
+        for message in body.get("messages", [])
+    )
+    schema = prompt_schema(prompt)
+    if schema:
+        return json.dumps(sample(schema))
+    if '"summary"' in prompt:
+        # CompetencyAgent's "Response format" example
+        return json.dumps({"summary": CANNED_SUMMARY})
+    return CANNED_TEXT
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 0.1, seed: Optional[int] = None,
+                 respond: Optional[Callable[[Dict[str, Any]], str]] = None, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.respond = respond or canned_content
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reset(self):
+        with self.lock:
+            self.stats = {"requests": 0, "completed": 0, "rate_limited": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def count(self, **increments):
+        with self.lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def outcome(self) -> Tuple[str, float]:
+        with self.lock:
+            roll = self.random.random()
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if roll < self.rate_limit_rate:
+            return "rate_limited", 0
+        if roll < self.rate_limit_rate + self.error_rate:
+            return "error", delay
+        return "ok", delay
+
+    def completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        content = self.respond(body)
+        # Roughly four characters per token, enough for throughput numbers
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        self.count(completed=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def reply(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self.reply(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                fake.count(requests=1)
+                outcome, delay = fake.outcome()
+                time.sleep(delay)
+                if outcome == "rate_limited":
+                    fake.count(rate_limited=1)
+                    return self.reply(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                                      {"retry-after": str(fake.retry_after)})
+                if outcome == "error":
+                    fake.count(errors=1)
+                    return self.reply(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+                self.reply(200, fake.completion(body))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeOpenAI":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="retry-after seconds sent with 429s")
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.retry_after, port=args.port)
+    print(f"Fake OpenAI API at {fake.base_url} (set OPENAI_BASE_URL to use it)")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
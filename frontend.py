@@ -1,15 +1,29 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
 import random
 from bson import ObjectId
+from bson.errors import InvalidId
 import requests
 import json
 from datetime import datetime, timedelta, timezone
-from competency_agent import CompetencyAgent  # Ensure this import
+from evaluation_engine import EvaluationEngine
+from evaluation_cache import EvaluationCache
+from log_sink import BufferedLogWriter
+from response_store import HEAVY_FIELDS, expand_responses
+from agent_evaluation import EVALUATION_MODE, EVALUATION_MODES, RunEvaluator
+from work_queue import enqueue_run, run_progress
+from event_stream import RunEventStream, late_documents, new_documents, parse_cursor
+from db_indexes import ensure_indexes_at_startup
+from metrics import HTTP_REQUEST_SECONDS, metrics_reply, run_usage
+from competency_matrix import DEFAULT_COMPETENCIES
+from sync_status import sync_status
+from performance_review import REVIEW_MODEL, latest_call_id, competency_evidence, review_competencies, run_finished, start_review, finish_review
 import uuid
 import threading
+import asyncio
+import time
 from openai import OpenAI
 
 load_dotenv()
@@ -17,9 +31,7 @@ load_dotenv()
 app = Flask(__name__)
 
 # GitHub API settings
-GITHUB_API_URL = "https://api.github.com"
-REPO_OWNER = "openai"
-REPO_NAME = "openai-python"
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
 
 # Get the tokens from the .env file
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
@@ -29,6 +41,10 @@ headers = {}
 if GITHUB_TOKEN:
     headers["Authorization"] = f"token {GITHUB_TOKEN}"
 
+# "queue" hands agent runs to the agent_worker processes through the work
+# queue; "inline" evaluates them in a thread of this web process
+AGENT_RUNNER = os.getenv("AGENT_RUNNER", "queue")
+
 # MongoDB connection
 client = MongoClient(MONGO_URI)
 db = client.github_prs
@@ -36,10 +52,39 @@ pr_collection = db.pull_requests
 competencies_collection = db.competencies
 agent_responses_collection = db.agent_responses
 agent_logs_collection = db.agent_logs
+evaluation_cache_collection = db.evaluation_cache
+performance_reviews_collection = db.performance_reviews
 
 # Add this near the top of your file, after other imports
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Page size for /agent_logs and /agent_responses; ?limit= can ask for up to AGENT_API_MAX_PAGE_SIZE
+AGENT_API_PAGE_SIZE = int(os.getenv("AGENT_API_PAGE_SIZE", "500"))
+AGENT_API_MAX_PAGE_SIZE = int(os.getenv("AGENT_API_MAX_PAGE_SIZE", "5000"))
+
+# Each /agent_events stream holds a gunicorn thread for as long as the run
+# lasts (the Procfile starts one gthread worker with 16 threads). Streams past
+# this many per process get a 503, and the dashboard polls /agent_logs instead.
+AGENT_EVENTS_MAX_STREAMS = int(os.getenv("AGENT_EVENTS_MAX_STREAMS", "8"))
+agent_event_streams = threading.BoundedSemaphore(AGENT_EVENTS_MAX_STREAMS)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    # Labelled by route pattern, not path, to keep the label set small;
+    # for streamed responses this is the time to the first byte
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUEST_SECONDS.labels(request.method, route, str(response.status_code)).observe(time.perf_counter() - g.request_started)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = metrics_reply()
+    return Response(body, content_type=content_type)
+
 @app.route('/')
 def index():
     if pr_collection is None or db is None:
@@ -66,15 +111,7 @@ def index():
             competencies = user_matrix["competencies"]
         else:
             # Use default competencies if no user-specific competencies are found
-            competencies = {
-                "Writing_code": "Consistently writes production-ready code that is easily testable, easily understood by other developers, and accounts for edge cases and errors. Understands when it is appropriate to leave comments, but biases towards self-documenting code.",
-                "Testing": "Understands the testing pyramid, and writes unit tests as well as higher level tests in accordance with it. Always writes tests to handle expected edge cases and errors gracefully, as well as happy paths.",
-                "Debugging": "Proficient at using systematic debugging to diagnose all issues located to a single service. Uses systematic debugging to diagnose cross service issues, sometimes with help from more senior engineers.",
-                "Observability": "Is aware of the organization's monitoring philosophy. Helps tune and change the monitoring on their team accordingly. Is aware of the operational data for their team's domain and uses it as a basis for suggesting stability and performance improvements.",
-                "Understanding_Code": "Understands their team's domain at a high level and can gather sufficient context to work productively within it. Has expertise in a portion of their team's domain.",
-                "Software_Architecture": "Consistently designs code that is aligned with the overall service architecture. Utilizes abstractions and code isolation effectively.",
-                "Security": "Approaches all engineering work with a security lens. Actively looks for security vulnerabilities both in the code and when providing peer reviews."
-            }
+            competencies = DEFAULT_COMPETENCIES
         
         return render_template('dashboard.html', prs=list(prs), competencies=competencies)
     except Exception as e:
@@ -85,7 +122,18 @@ def index():
 
 @app.route('/run_agents', methods=['POST'])
 def run_agents():
+    mode = (request.get_json(silent=True) or {}).get("mode", EVALUATION_MODE)
+    if mode not in EVALUATION_MODES:
+        return jsonify({"success": False, "error": f"Unknown evaluation mode '{mode}'."}), 400
+
     call_id = str(uuid.uuid4())
+    if AGENT_RUNNER == "queue":
+        run, created = enqueue_run(db, call_id, mode, list(competencies_collection.find()))
+        if not created:
+            # The same run is already in flight; follow that one instead
+            return jsonify({"success": True, "call_id": run["_id"], "deduplicated": True,
+                            "message": "An identical agent run is already in progress."}), 202
+
     agent_logs_collection.insert_one({
         "call_id": call_id,
         "timestamp": datetime.utcnow(),
@@ -93,103 +141,187 @@ def run_agents():
         "message": "Agent run initiated."
     })
 
-    # Start the agent processing in a background thread
-    threading.Thread(target=process_agents, args=(call_id,)).start()
+    if AGENT_RUNNER != "queue":
+        # Start the agent processing in a background thread
+        threading.Thread(target=process_agents, args=(call_id, mode)).start()
 
     return jsonify({"success": True, "call_id": call_id, "message": "Agents processing started."}), 202
 
-def process_agents(call_id):
-    try:
-        total_prs = pr_collection.count_documents({})
-        total_competencies = competencies_collection.count_documents({})
-        
-        agent_logs_collection.insert_one({
-            "call_id": call_id,
-            "timestamp": datetime.utcnow(),
-            "status": "info",
-            "message": f"Processing {total_prs} PRs and {total_competencies} competencies."
-        })
-
-        prs = pr_collection.find()
-        competencies = competencies_collection.find()
-
-        for pr in prs:
-            pr_number = pr.get('number')
-            pr_description = pr.get('body', '')
-            pr_patch = pr.get('patch', '')
-            pr_link = f"https://github.com/{REPO_OWNER}/{REPO_NAME}/pull/{pr_number}"
-
-            agent_logs_collection.insert_one({
-                "call_id": call_id,
-                "timestamp": datetime.utcnow(),
-                "status": "info",
-                "message": f"Analyzing PR #{pr_number}."
-            })
-
-            competencies.rewind()
+@app.route('/agent_runs/<call_id>', methods=['GET'])
+def get_agent_run(call_id):
+    # Progress of a queued run: status and done/failed/total work items
+    run = run_progress(db, call_id)
+    if not run:
+        return jsonify({"error": f"Unknown agent run '{call_id}'."}), 404
+    return jsonify(run), 200
+
+def process_agents(call_id, mode=EVALUATION_MODE):
+    # Log entries are buffered and written in batches; leaving the block
+    # flushes whatever is left, including the final status
+    with BufferedLogWriter(agent_logs_collection) as logs:
+        def log_agent_event(status, message, **fields):
+            logs.log(status, message, call_id=call_id, **fields)
+
+        try:
+            total_prs = pr_collection.count_documents({})
+            total_competencies = competencies_collection.count_documents({})
+
+            log_agent_event("info", f"Processing {total_prs} PRs and {total_competencies} competencies ({mode} mode).")
+
+            start = time.monotonic()
+            # Model calls, tokens and cost of the run end up in usage
+            with run_usage() as usage:
+                evaluator = asyncio.run(evaluate_run(call_id, mode, log_agent_event))
+            engine = evaluator.engine
+            elapsed = time.monotonic() - start
+
+            log_agent_event("info", f"Evaluated {total_prs * total_competencies} PR/competency pairs in {elapsed:.1f}s "
+                                    f"with concurrency {engine.concurrency} ({engine.retries} retries, {engine.failures} failed).")
+            log_agent_event("info", f"Evaluation cache: {evaluator.cache.hits} hits, {evaluator.cache.misses} misses.")
+            log_agent_event("info", f"Patch reducer: sent {evaluator.patch_tokens['reduced']} of {evaluator.patch_tokens['original']} patch tokens.")
+            if evaluator.describe_relevance():
+                log_agent_event("info", f"Relevance filter: {evaluator.describe_relevance()}.")
+            log_agent_event("info", f"Model usage: {usage.describe()}.")
+            # Per-run totals go on the final log entry
+            log_agent_event("completed", "All agents have been processed successfully.", usage=usage.totals())
+        except Exception as e:
+            log_agent_event("error", f"Error during agent processing: {str(e)}")
+
+async def evaluate_run(call_id, mode, log_agent_event):
+    # One shared async client for the run, with bounded concurrency; each
+    # result is stored as soon as its model call completes
+    engine = EvaluationEngine()
+    competencies = list(competencies_collection.find())
+    evaluator = await asyncio.to_thread(RunEvaluator, db, call_id, mode, competencies, engine, log_agent_event)
+
+    def prs_with_patches():
+        # Patches are loaded one PR at a time
+        for pr in pr_collection.find({}, {"patch": 0}):
+            yield pr, evaluator.reduce(pr)
+
+    def pairs():
+        for pr, reduction in prs_with_patches():
             for competency in competencies:
-                competency_name = competency.get('name')
-                competency_description = competency.get('description')
-
-                agent_logs_collection.insert_one({
-                    "call_id": call_id,
-                    "timestamp": datetime.utcnow(),
-                    "status": "info",
-                    "message": f"Evaluating competency '{competency_name}' for PR #{pr_number}."
-                })
-
-                # Create CompetencyAgent with the API key
-                agent = CompetencyAgent(competency_description, os.getenv("OPENAI_API_KEY"))
-                prompt = agent.generate_prompt(pr_patch, pr_description, pr_link)
-                result = agent.analyze_pr(pr_patch, pr_description, pr_link)
-
-                agent_responses_collection.insert_one({
-                    "call_id": call_id,
-                    "pr_number": pr_number,
-                    "competency_name": competency_name,
-                    "summary": result.get("summary"),
-                    "pr_link": pr_link,
-                    "pr_description": pr_description,
-                    "pr_patch": pr_patch,
-                    "competency_description": competency_description,
-                    "prompt": prompt,
-                    "timestamp": datetime.utcnow()
-                })
-
-                agent_logs_collection.insert_one({
-                    "call_id": call_id,
-                    "timestamp": datetime.utcnow(),
-                    "status": "info",
-                    "message": f"Stored response for competency '{competency_name}' and PR #{pr_number}."
-                })
-
-        agent_logs_collection.insert_one({
-            "call_id": call_id,
-            "timestamp": datetime.utcnow(),
-            "status": "completed",
-            "message": "All agents have been processed successfully."
-        })
-    except Exception as e:
-        agent_logs_collection.insert_one({
-            "call_id": call_id,
-            "timestamp": datetime.utcnow(),
-            "status": "error",
-            "message": f"Error during agent processing: {str(e)}"
-        })
+                yield pr, reduction, competency
+
+    async def evaluate_pair(job):
+        await evaluator.evaluate_pair(*job)
+
+    async def evaluate_pr(job):
+        await evaluator.evaluate_pr(*job)
+
+    async def report_failure(job, error):
+        await evaluator.report_failure(job[0], job[2].get('name') if len(job) == 3 else None, error)
+
+    try:
+        if mode == "multi":
+            if competencies:
+                await engine.run(prs_with_patches(), evaluate_pr, on_error=report_failure)
+        else:
+            await engine.run(pairs(), evaluate_pair, on_error=report_failure)
+    finally:
+        await engine.client.close()
+    return evaluator
+
+def page_args():
+    # ?since=<cursor>&limit=<n>&fields=a,b: pages in write (_id) order, and
+    # "cursor" in the reply is the since value for the next page
+    cursor = parse_cursor(request.args.get("since"))
+    limit = min(max(int(request.args.get("limit", AGENT_API_PAGE_SIZE)), 1), AGENT_API_MAX_PAGE_SIZE)
+    fields = [field for field in request.args.get("fields", "").split(",") if field]
+    return cursor, limit, fields
+
+def is_tail_page(documents, limit):
+    # The overlap window before the cursor is only sent with the last page,
+    # so catching up on a long run doesn't repeat it on every page
+    return len(documents) <= limit
+
+def page_reply(key, documents, cursor, limit, late=()):
+    # late: the overlap window before the cursor (at most limit entries), sent
+    # again so entries other workers wrote late aren't skipped; clients drop
+    # the ones they have by _id
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    if documents:
+        cursor = documents[-1]["_id"]
+    documents = list(late) + documents
+    for document in documents:
+        document["_id"] = str(document["_id"])
+    return jsonify({key: documents, "cursor": str(cursor) if cursor else None, "has_more": has_more}), 200
 
 @app.route('/agent_logs/<call_id>', methods=['GET'])
 def get_agent_logs(call_id):
-    logs = list(agent_logs_collection.find({"call_id": call_id}).sort("timestamp", 1))
-    for log in logs:
-        log["_id"] = str(log["_id"])
-    return jsonify({"logs": logs}), 200
+    try:
+        cursor, limit, fields = page_args()
+    except (InvalidId, ValueError) as e:
+        return jsonify({"error": f"Invalid paging arguments: {e}"}), 400
+    projection = {field: 1 for field in fields} or None
+    # One extra document tells whether there is another page
+    logs = new_documents(agent_logs_collection, call_id, cursor, projection, limit + 1)
+    late = late_documents(agent_logs_collection, call_id, cursor, projection, limit) if is_tail_page(logs, limit) else []
+    return page_reply("logs", logs, cursor, limit, late)
+
+@app.route('/agent_events/<call_id>', methods=['GET'])
+def stream_agent_events(call_id):
+    # Server-Sent Events: "log" and "response" events as they are written,
+    # then "end". A reconnecting EventSource resumes from Last-Event-ID.
+    resume = request.headers.get("Last-Event-ID") or request.args.get("since") or "."
+    log_since, _, response_since = resume.partition(".")
+    try:
+        log_cursor, response_cursor = parse_cursor(log_since), parse_cursor(response_since)
+    except InvalidId:
+        return jsonify({"error": f"Invalid cursor '{resume}'."}), 400
+    if not agent_event_streams.acquire(blocking=False):
+        return jsonify({"error": "Too many open event streams, poll /agent_logs instead."}), 503, {"Retry-After": "5"}
+    events = RunEventStream(agent_logs_collection, agent_responses_collection, call_id, log_cursor, response_cursor)
+    response = Response(stream_with_context(iter(events)), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Called once the server is done with the response, disconnects included
+    response.call_on_close(agent_event_streams.release)
+    return response
 
 @app.route('/agent_responses/<call_id>', methods=['GET'])
 def get_agent_responses(call_id):
-    responses = list(agent_responses_collection.find({"call_id": call_id}))
-    for response in responses:
-        response["_id"] = str(response["_id"])
-    return jsonify({"responses": responses}), 200
+    try:
+        cursor, limit, fields = page_args()
+    except (InvalidId, ValueError) as e:
+        return jsonify({"error": f"Invalid paging arguments: {e}"}), 400
+    # Heavy fields are only sent when asked for with ?expand=1
+    expand = request.args.get("expand") in ("1", "true")
+    if expand:
+        responses = expand_responses(db, new_documents(agent_responses_collection, call_id, cursor, None, limit + 1))
+        late = expand_responses(db, late_documents(agent_responses_collection, call_id, cursor, None, limit)) \
+            if is_tail_page(responses, limit) else []
+        if fields:
+            responses, late = [
+                [{key: value for key, value in response.items() if key in fields or key == "_id"} for response in documents]
+                for documents in (responses, late)
+            ]
+    else:
+        projection = {field: 1 for field in fields if field not in HEAVY_FIELDS} or {field: 0 for field in HEAVY_FIELDS}
+        responses = new_documents(agent_responses_collection, call_id, cursor, projection, limit + 1)
+        late = late_documents(agent_responses_collection, call_id, cursor, projection, limit) \
+            if is_tail_page(responses, limit) else []
+    return page_reply("responses", responses, cursor, limit, late)
+
+@app.route('/evaluation_cache/invalidate', methods=['POST'])
+def invalidate_evaluation_cache():
+    # Drop cached evaluations for one competency (by name), or all of them
+    competency_name = (request.get_json(silent=True) or {}).get("competency_name")
+    cache = EvaluationCache(evaluation_cache_collection)
+    if competency_name:
+        competency = competencies_collection.find_one({"name": competency_name})
+        if not competency:
+            return jsonify({"success": False, "error": f"Unknown competency '{competency_name}'."}), 404
+        deleted = cache.invalidate(competency.get('description'))
+    else:
+        deleted = cache.invalidate()
+    return jsonify({"success": True, "deleted": deleted}), 200
+
+@app.route('/sync_status', methods=['GET'])
+def get_sync_status():
+    # Freshness of the PR data written by the backend sync worker, per repository
+    return jsonify(sync_status(db.sync_state)), 200
 
 @app.route('/save-competencies', methods=['POST'])
 def save_competencies():
@@ -217,97 +349,71 @@ def generate_github_user_id():
     return 'oa6xgic4mf'
 
 # Add this new route
-@app.route('/generate_performance_review', methods=['GET'])
+@app.route('/generate_performance_review', methods=['GET', 'POST'])
 def generate_performance_review():
-    review_id = str(uuid.uuid4())
-    competencies = competencies_collection.find()
-    agent_responses = agent_responses_collection.find()
-
-    review = ""
-    for competency in competencies:
-        competency_name = competency['name']
-        competency_description = competency['description']
-        
-        # Log and insert: Starting competency review
-        log_message = f"Starting review for competency: {competency_name}"
-        print(log_message)
-        agent_logs_collection.insert_one({
-            "review_id": review_id,
-            "timestamp": datetime.utcnow(),
-            "status": "info",
-            "message": log_message
-        })
-        
-        relevant_responses = [
-            response['summary'] 
-            for response in agent_responses 
-            if response['competency_name'] == competency_name
-        ]
-        
-        combined_summary = " ".join(relevant_responses)
-        
-        # Log and insert: Prepared summary
-        log_message = f"Prepared summary for competency: {competency_name}"
-        print(log_message)
-        agent_logs_collection.insert_one({
-            "review_id": review_id,
-            "timestamp": datetime.utcnow(),
-            "status": "info",
-            "message": log_message
-        })
-        
-        prompt = f"""
-        Competency: {competency_name}
-        Description: {competency_description}
-        
-        Summary of agent responses:
-        {combined_summary}
-        
-        Based on the above information, provide a brief performance review. Start with a single paragraph of the developer's impact and top competencies.
-        """
-        
-        # Log and insert: Sending request to OpenAI
-        log_message = f"Sending request to OpenAI for competency: {competency_name}"
-        print(log_message)
-        agent_logs_collection.insert_one({
-            "review_id": review_id,
-            "timestamp": datetime.utcnow(),
-            "status": "info",
-            "message": log_message
-        })
-        
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates performance reviews based on competency evaluations."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=150
-        )
-        
-        # Log and insert: Received response from OpenAI
-        log_message = f"Received response from OpenAI for competency: {competency_name}"
-        print(log_message)
-        agent_logs_collection.insert_one({
-            "review_id": review_id,
-            "timestamp": datetime.utcnow(),
-            "status": "info",
-            "message": log_message
-        })
-        
-        review += f"## {competency_name}\n\n{response.choices[0].message.content}\n\n"
+    # Starts a background review job, or answers straight away with a stored
+    # review for the same run, competency matrix and model (unless force=1)
+    args = request.get_json(silent=True) or request.args
+    # Reviews cover one agent run: call_id, or the most recent run
+    call_id = args.get("call_id") or latest_call_id(agent_responses_collection)
+    if call_id is None:
+        return jsonify({"error": "No agent run to review yet."}), 404
+    if not run_finished(agent_logs_collection, call_id):
+        return jsonify({"error": f"Agent run {call_id} is still being evaluated; review it once it has completed."}), 409
+    force = str(args.get("force", "")).lower() in ("1", "true")
+    competencies = list(competencies_collection.find({}, {"_id": 0, "name": 1, "description": 1}))
 
-    # Log and insert: Completed performance review
-    log_message = "Completed generating performance review"
-    print(log_message)
-    agent_logs_collection.insert_one({
-        "review_id": review_id,
-        "timestamp": datetime.utcnow(),
-        "status": "completed",
-        "message": log_message
-    })
+    job, created = start_review(performance_reviews_collection, str(uuid.uuid4()), call_id, competencies, REVIEW_MODEL, force)
+    if created:
+        threading.Thread(target=process_review, args=(job["_id"], call_id, competencies)).start()
+    return review_reply(job)
+
+@app.route('/performance_reviews/<review_id>', methods=['GET'])
+def get_performance_review(review_id):
+    job = performance_reviews_collection.find_one({"_id": review_id})
+    if not job:
+        return jsonify({"error": f"Unknown review '{review_id}'."}), 404
+    return review_reply(job)
+
+def review_reply(job):
+    reply = {
+        "review_id": job["_id"],
+        "call_id": job["call_id"],
+        "model": job["model"],
+        "status": job["status"],
+        "review": job.get("review"),
+        "error": job.get("error"),
+        "finished_at": job.get("finished_at")
+    }
+    return jsonify(reply), 202 if job["status"] == "running" else 200
+
+def process_review(review_id, call_id, competencies):
+    with BufferedLogWriter(agent_logs_collection) as logs:
+        def log_review_event(status, message, **fields):
+            print(message)
+            logs.log(status, message, review_id=review_id, reviewed_call_id=call_id, **fields)
+
+        async def run_review():
+            engine = EvaluationEngine()
+            try:
+                return await review_competencies(engine, competencies, evidence, REVIEW_MODEL, log_review_event)
+            finally:
+                await engine.client.close()
 
-    return jsonify({"review": review, "review_id": review_id})
+        try:
+            evidence = competency_evidence(agent_responses_collection, call_id)
+            log_review_event("info", f"Prepared evidence for {len(evidence)} of {len(competencies)} competencies from run {call_id}")
+            with run_usage() as usage:
+                review = asyncio.run(run_review())
+            finish_review(performance_reviews_collection, review_id, review=review)
+            log_review_event("info", f"Model usage: {usage.describe()}.")
+            # Log and insert: Completed performance review
+            log_review_event("completed", "Completed generating performance review", usage=usage.totals())
+        except Exception as e:
+            finish_review(performance_reviews_collection, review_id, error=str(e))
+            log_review_event("error", f"Error generating performance review: {str(e)}")
 
 if __name__ == '__main__':
+    # Under gunicorn, gunicorn.conf.py does this once for the whole server
+    ensure_indexes_at_startup(db)
     app.run(debug=True)
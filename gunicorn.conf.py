@@ -0,0 +1,18 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from db_indexes import ensure_indexes_at_startup
+
+# Read by gunicorn from the working directory (the Procfile and render.yaml
+# start it from the repository root)
+
+def on_starting(server):
+    # Once per server, in the master process, rather than on every import of
+    # frontend.py; off the startup path, so a slow or unreachable database
+    # doesn't hold up the workers
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI")).github_prs
+    threading.Thread(target=ensure_indexes_at_startup, args=(db,), daemon=True).start()
@@ -0,0 +1,124 @@
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List
+
+from pymongo.errors import BulkWriteError
+
+# Buffered log entries are written once this many are pending, or after this
+# many seconds, whichever comes first
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "1.0"))
+# Failed flushes in a row before the pending entries are given up on
+LOG_FLUSH_ATTEMPTS = int(os.getenv("LOG_FLUSH_ATTEMPTS", "5"))
+
+DUPLICATE_KEY = 11000
+
+class BufferedLogWriter:
+    def __init__(self, collection, max_batch: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_SECONDS,
+                 max_attempts: int = LOG_FLUSH_ATTEMPTS):
+        # Callers only append to an in-memory buffer; a background thread
+        # turns the buffer into insert_many calls
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.failed_attempts = 0
+        self.dropped = 0
+        self.buffer: List[Dict[str, Any]] = []
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.closed = False
+        self.written = 0
+        self.batches = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, entry: Dict[str, Any]):
+        # The timestamp is taken when the event happens, not when it is
+        # flushed, so /agent_logs keeps sorting entries in event order
+        entry.setdefault("timestamp", datetime.utcnow())
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Log writer is closed")
+            self.buffer.append(entry)
+            if len(self.buffer) >= self.max_batch:
+                self.condition.notify()
+
+    def log(self, status: str, message: str, **fields):
+        self.write({**fields, "status": status, "message": message})
+
+    def _take(self) -> List[Dict[str, Any]]:
+        with self.condition:
+            entries, self.buffer = self.buffer, []
+            return entries
+
+    def flush(self):
+        # Serialised so batches reach MongoDB in the order they were taken
+        with self.flush_lock:
+            entries = self._take()
+            if not entries:
+                return
+            try:
+                # Unordered, so one bad entry doesn't hold back the rest
+                self.collection.insert_many(entries, ordered=False)
+            except Exception as e:
+                # insert_many has given every entry an _id; entries stored by
+                # an earlier attempt come back as duplicate keys and count as
+                # written. Anything else is put back for the next flush (or
+                # close), unless the entries keep failing.
+                failed = entries
+                if isinstance(e, BulkWriteError):
+                    indexes = {error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY}
+                    failed = [entry for index, entry in enumerate(entries) if index in indexes]
+                self.written += len(entries) - len(failed)
+                if not failed:
+                    self.failed_attempts = 0
+                    self.batches += 1
+                    return
+                self.failed_attempts += 1
+                if self.failed_attempts >= self.max_attempts:
+                    self.dropped += len(failed)
+                    self.failed_attempts = 0
+                    print(f"Dropped {len(failed)} log entries after {self.max_attempts} failed writes.")
+                else:
+                    with self.condition:
+                        self.buffer[:0] = failed
+                raise
+            self.failed_attempts = 0
+            self.written += len(entries)
+            self.batches += 1
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.closed and len(self.buffer) < self.max_batch:
+                    self.condition.wait(self.flush_interval)
+                if self.closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing agent logs: {e}")
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        # Final flush on the caller's thread, so it returns only once every
+        # entry (including a "completed" or "error" status) is stored
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Losing log entries shouldn't fail the run that wrote them, nor
+        # hide the error that ended it
+        try:
+            self.close()
+        except Exception as e:
+            print(f"Error writing agent logs: {e}")
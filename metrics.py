@@ -0,0 +1,134 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+
+# Prometheus metrics shared by the web app (served on /metrics) and the
+# worker processes (served on METRICS_PORT when it is set). Model usage is
+# also added up per run: code evaluating a run sets a RunUsage with
+# run_usage(), and every model call made in that context (threads and
+# asyncio tasks started from it included) is counted towards it.
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# USD per million input and output tokens, matched on the longest model
+# name prefix; models not listed are counted without a cost
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50)
+}
+
+HTTP_REQUEST_SECONDS = Histogram("perfwriter_http_request_seconds", "Flask request latency", ["method", "route", "status"])
+STAGE_SECONDS = Histogram("perfwriter_stage_seconds", "Time spent per pipeline stage", ["stage"])
+LLM_CALLS = Counter("perfwriter_llm_calls_total", "Completed model calls", ["model"])
+LLM_CALL_SECONDS = Histogram("perfwriter_llm_call_seconds", "Model call latency", ["model"])
+LLM_TOKENS = Counter("perfwriter_llm_tokens_total", "Model tokens, by direction (in/out)", ["model", "direction"])
+LLM_COST = Counter("perfwriter_llm_cost_dollars_total", "Estimated model cost in USD", ["model"])
+LLM_RETRIES = Counter("perfwriter_llm_retries_total", "Model calls retried after a rate limit or server error")
+RELEVANCE_DECISIONS = Counter("perfwriter_relevance_decisions_total", "Uncached PR/competency pairs by relevance filter decision", ["decision"])
+EVALUATION_FAILURES = Counter("perfwriter_evaluation_failures_total", "Evaluation jobs given up on")
+GITHUB_REQUESTS = Counter("perfwriter_github_requests_total", "GitHub API responses", ["api", "status"])
+GITHUB_RATE_REMAINING = Gauge("perfwriter_github_rate_limit_remaining", "GitHub calls left in the rate-limit window", ["api"])
+GITHUB_RATE_LIMIT = Gauge("perfwriter_github_rate_limit", "GitHub calls per rate-limit window", ["api"])
+
+def model_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prefixes = [prefix for prefix in MODEL_PRICES if model.startswith(prefix)]
+    if not prefixes:
+        return 0.0
+    input_price, output_price = MODEL_PRICES[max(prefixes, key=len)]
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+class RunUsage:
+    # Totals for one run; stored on the run's "completed" log entry
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values: Dict[str, float] = {
+            "llm_calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cost_usd": 0.0,
+            "retries": 0,
+            "llm_seconds": 0.0
+        }
+
+    def add(self, **values: float):
+        with self.lock:
+            for key, value in values.items():
+                self.values[key] = self.values.get(key, 0) + value
+
+    def totals(self) -> Dict[str, float]:
+        with self.lock:
+            return {key: round(value, 6) if isinstance(value, float) else value for key, value in self.values.items()}
+
+    def describe(self) -> str:
+        totals = self.totals()
+        return (f"{totals['llm_calls']} model calls, {totals['prompt_tokens']} tokens in, {totals['completion_tokens']} out, "
+                f"{totals['retries']} retries, ${totals['cost_usd']:.4f} estimated")
+
+current_usage: contextvars.ContextVar[Optional[RunUsage]] = contextvars.ContextVar("current_usage", default=None)
+
+@contextmanager
+def run_usage(usage: Optional[RunUsage] = None):
+    usage = usage or RunUsage()
+    token = current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        current_usage.reset(token)
+
+def add_usage(**values: float):
+    usage = current_usage.get()
+    if usage is not None:
+        usage.add(**values)
+
+def record_completion(model: str, response: Any, seconds: float):
+    # response is a chat completion; its usage block is optional on
+    # OpenAI-compatible servers
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cost = model_cost(model, prompt_tokens, completion_tokens)
+    LLM_CALLS.labels(model).inc()
+    LLM_CALL_SECONDS.labels(model).observe(seconds)
+    LLM_TOKENS.labels(model, "in").inc(prompt_tokens)
+    LLM_TOKENS.labels(model, "out").inc(completion_tokens)
+    LLM_COST.labels(model).inc(cost)
+    add_usage(llm_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cost_usd=cost, llm_seconds=seconds)
+
+def record_retry():
+    LLM_RETRIES.inc()
+    add_usage(retries=1)
+
+def record_github_response(api: str, response):
+    GITHUB_REQUESTS.labels(api, str(response.status_code)).inc()
+    if "X-RateLimit-Remaining" in response.headers:
+        GITHUB_RATE_REMAINING.labels(api).set(int(response.headers["X-RateLimit-Remaining"]))
+    if "X-RateLimit-Limit" in response.headers:
+        GITHUB_RATE_LIMIT.labels(api).set(int(response.headers["X-RateLimit-Limit"]))
+
+@contextmanager
+def timed(stage: str):
+    # Also usable as a decorator on plain (not async) functions
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(seconds)
+        add_usage(**{f"{stage}_seconds": seconds})
+
+def metrics_reply() -> Tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def serve_metrics(port: Optional[str] = METRICS_PORT):
+    # Worker processes have no web server of their own
+    if port:
+        start_http_server(int(port))
+        print(f"Serving metrics on port {port}")
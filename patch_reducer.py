@@ -0,0 +1,170 @@
+import fnmatch
+import os
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character-based estimate
+    tiktoken = None
+
+from patch_store import parse_patch
+
+# Files that say little about how a PR was written: dropped entirely
+DEFAULT_DROP_PATTERNS = [
+    "*.lock", "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+    "Cargo.lock", "go.sum", "composer.lock", "*.min.js", "*.min.css", "*.map",
+    "vendor/*", "*/vendor/*", "node_modules/*", "*/node_modules/*", "third_party/*",
+    "*.snap", "*/__snapshots__/*", "*.png", "*.jpg", "*.gif", "*.ico", "*.pdf"
+]
+# Generated code: kept as a one-line summary so the model knows it changed
+DEFAULT_COLLAPSE_PATTERNS = [
+    "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.generated.*", "*/generated/*", "*/gen/*",
+    "dist/*", "build/*", "*.ipynb", "*.csv", "*.svg"
+]
+
+# Token budget for the patch part of a prompt, per model. PATCH_TOKEN_BUDGET
+# overrides every model; unknown models get DEFAULT_PATCH_TOKEN_BUDGET.
+MODEL_PATCH_TOKEN_BUDGETS = {
+    "gpt-4": 5000,
+    "gpt-4-turbo-preview": 60000,
+    "gpt-4o": 60000,
+    "gpt-4o-2024-08-06": 60000
+}
+DEFAULT_PATCH_TOKEN_BUDGET = 5000
+
+def env_patterns(name: str, default: List[str]) -> List[str]:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return [pattern.strip() for pattern in value.split(",") if pattern.strip()]
+
+DROP_PATTERNS = env_patterns("PATCH_DROP_PATTERNS", DEFAULT_DROP_PATTERNS)
+COLLAPSE_PATTERNS = env_patterns("PATCH_COLLAPSE_PATTERNS", DEFAULT_COLLAPSE_PATTERNS)
+
+_encodings = {}
+
+def load_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken downloads its vocabularies on first use, which fails offline
+        return None
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    if not text:
+        return 0
+    if model not in _encodings:
+        _encodings[model] = load_encoding(model)
+    if _encodings[model] is None:
+        return len(text) // 4 + 1
+    return len(_encodings[model].encode(text, disallowed_special=()))
+
+def token_budget(model: str) -> int:
+    if os.getenv("PATCH_TOKEN_BUDGET"):
+        return int(os.getenv("PATCH_TOKEN_BUDGET"))
+    return MODEL_PATCH_TOKEN_BUDGETS.get(model, DEFAULT_PATCH_TOKEN_BUDGET)
+
+def matches(filename: str, patterns: List[str]) -> bool:
+    return any(fnmatch.fnmatch(filename, pattern) for pattern in patterns)
+
+def reduce_patch(patch: str, model: str = "gpt-4", budget: Optional[int] = None,
+                 drop_patterns: Optional[List[str]] = None, collapse_patterns: Optional[List[str]] = None) -> Dict[str, Any]:
+    budget = token_budget(model) if budget is None else budget
+    drop_patterns = DROP_PATTERNS if drop_patterns is None else drop_patterns
+    collapse_patterns = COLLAPSE_PATTERNS if collapse_patterns is None else collapse_patterns
+    original_tokens = count_tokens(patch, model)
+    report = {"dropped_files": [], "collapsed_files": [], "truncated_files": []}
+
+    # Rule pass: each section becomes a list of chunks; a chunk is only kept whole
+    sections = []
+    for section in parse_patch(patch):
+        if section["type"] == "text":
+            sections.append({"filename": None, "chunks": ["".join(section["lines"])]})
+            continue
+        filename = section["filename"]
+        additions, deletions = section["additions"], section["deletions"]
+        if matches(filename, drop_patterns):
+            report["dropped_files"].append(filename)
+            sections.append({"filename": filename, "chunks": [f"[dropped {filename}: +{additions} -{deletions}]\n"]})
+        elif matches(filename, collapse_patterns):
+            report["collapsed_files"].append(filename)
+            sections.append({"filename": filename, "chunks": [
+                section["header"][0] + f"[collapsed {len(section['hunks'])} hunks: +{additions} -{deletions}]\n"
+            ]})
+        else:
+            sections.append({"filename": filename, "chunks": ["".join(section["header"])] + ["".join(hunk) for hunk in section["hunks"]]})
+
+    if original_tokens <= budget and not report["dropped_files"] and not report["collapsed_files"]:
+        report.update({"patch": patch, "original_tokens": original_tokens, "tokens": original_tokens, "budget": budget})
+        return report
+
+    for section in sections:
+        section["tokens"] = [count_tokens(chunk, model) for chunk in section["chunks"]]
+
+    # Budget pass: smallest sections first, each getting an equal share of
+    # what is left, so small files survive whole and only the largest ones
+    # lose their trailing hunks
+    remaining = budget
+    order = sorted(range(len(sections)), key=lambda index: sum(sections[index]["tokens"]))
+    kept = {}
+    for position, index in enumerate(order):
+        section = sections[index]
+        share = remaining // (len(order) - position)
+        used = 0
+        count = 0
+        for tokens in section["tokens"]:
+            if used + tokens > share and count > 0:
+                break
+            used += tokens
+            count += 1
+        if used > share and section["filename"] is None:
+            # A commit message bigger than its share is dropped rather than cut
+            count, used = 0, 0
+        kept[index] = count
+        remaining -= used
+
+    output = []
+    for index, section in enumerate(sections):
+        count = kept[index]
+        output.extend(section["chunks"][:count])
+        omitted = len(section["chunks"]) - count
+        if omitted and section["filename"] is not None:
+            report["truncated_files"].append(section["filename"])
+            output.append(f"[truncated {section['filename']}: {omitted} more hunks omitted]\n")
+
+    reduced = "".join(output)
+    report.update({
+        "patch": reduced,
+        "original_tokens": original_tokens,
+        "tokens": count_tokens(reduced, model),
+        "budget": budget
+    })
+    return report
+
+def describe_reduction(reduction: Dict[str, Any]) -> str:
+    return (f"{reduction['original_tokens']} -> {reduction['tokens']} tokens "
+            f"(dropped {len(reduction['dropped_files'])}, collapsed {len(reduction['collapsed_files'])}, "
+            f"truncated {len(reduction['truncated_files'])} files)")
+
+def fit_text(text: str, max_tokens: int, model: str = "gpt-4") -> str:
+    # Plain-text counterpart of reduce_patch for descriptions, comments and
+    # evidence: keep whole lines from the start until the budget is spent
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    kept = []
+    used = 0
+    for line in (text or "").splitlines(keepends=True):
+        tokens = count_tokens(line, model)
+        if used + tokens > max_tokens:
+            break
+        kept.append(line)
+        used += tokens
+    if not kept:
+        # A single oversized line: cut it at a rough character estimate
+        kept.append(text[:max_tokens * 4])
+    return "".join(kept) + "\n[truncated]\n"
@@ -0,0 +1,105 @@
+import hashlib
+import re
+import zlib
+from bson import Binary
+
+# Patches are stored once per distinct content in db.patch_blobs, zlib
+# compressed and keyed by their sha256. PR documents keep only "patch_ref"
+# plus per-file stats, and consumers load the text lazily with load_patch.
+
+DIFF_HEADER = re.compile(r"^diff --git a/(.+?) b/(.+)$")
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+COMMIT_HEADER = re.compile(r"^From [0-9a-f]{7,40} ")
+
+def patch_hash(patch: str) -> str:
+    return hashlib.sha256(patch.encode("utf-8")).hexdigest()
+
+def store_patch(db, patch: str) -> str:
+    data = patch.encode("utf-8")
+    patch_ref = patch_hash(patch)
+    # Identical patches (re-synced PRs, cherry-picks) share one blob
+    db.patch_blobs.update_one(
+        {"_id": patch_ref},
+        {"$setOnInsert": {
+            "data": Binary(zlib.compress(data, 6)),
+            "size": len(data)
+        }},
+        upsert=True
+    )
+    return patch_ref
+
+def load_patch(db, pr) -> str:
+    # Documents written before patches moved out still carry them inline
+    if pr.get("patch"):
+        return pr["patch"]
+    patch_ref = pr.get("patch_ref")
+    if not patch_ref:
+        if "_id" in pr:
+            legacy = db.pull_requests.find_one({"_id": pr["_id"]}, {"patch": 1})
+            if legacy and legacy.get("patch"):
+                return legacy["patch"]
+        return ""
+    blob = db.patch_blobs.find_one({"_id": patch_ref})
+    if not blob:
+        return ""
+    return zlib.decompress(blob["data"]).decode("utf-8")
+
+def parse_patch(patch: str):
+    # Split a diff (or a multi-commit format-patch) into text sections such
+    # as commit messages, and file sections made of a header plus hunks.
+    # Hunk headers give each hunk's length, so changed lines that look like
+    # "---"/"+++" file headers or the "-- " signature stay in their hunk.
+    sections = []
+    current = None
+    old_left = new_left = 0
+    for line in patch.splitlines(keepends=True):
+        text = line.rstrip("\r\n")
+        if (old_left > 0 or new_left > 0) and (text == "" or text[0] in "+- \\"):
+            current["hunks"][-1].append(line)
+            if text.startswith("+"):
+                current["additions"] += 1
+                new_left -= 1
+            elif text.startswith("-"):
+                current["deletions"] += 1
+                old_left -= 1
+            elif not text.startswith("\\"):
+                # Context line ("\ No newline at end of file" is neither)
+                old_left -= 1
+                new_left -= 1
+            continue
+        # Anything else ends the hunk, even one cut short
+        old_left = new_left = 0
+        header = DIFF_HEADER.match(text)
+        hunk = HUNK_HEADER.match(text)
+        if header:
+            current = {"type": "file", "filename": header.group(2), "header": [line], "hunks": [],
+                       "additions": 0, "deletions": 0}
+            sections.append(current)
+        elif current is None or COMMIT_HEADER.match(text) or text == "-- ":
+            # Next commit header or the format-patch signature
+            if current is None or current["type"] != "text":
+                current = {"type": "text", "lines": []}
+                sections.append(current)
+            current["lines"].append(line)
+        elif current["type"] == "text":
+            current["lines"].append(line)
+        elif hunk:
+            current["hunks"].append([line])
+            old_left = int(hunk.group(1) or 1)
+            new_left = int(hunk.group(2) or 1)
+        elif current["hunks"]:
+            current["hunks"][-1].append(line)
+        else:
+            current["header"].append(line)
+    return sections
+
+def patch_file_stats(patch: str):
+    # Per-file additions/deletions, summed over every commit in the patch
+    stats = {}
+    for section in parse_patch(patch):
+        if section["type"] != "file":
+            continue
+        file_stats = stats.setdefault(section["filename"], {"filename": section["filename"], "additions": 0, "deletions": 0})
+        file_stats["additions"] += section["additions"]
+        file_stats["deletions"] += section["deletions"]
+    return list(stats.values())
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from evaluation_engine import EvaluationEngine
+from metrics import record_completion
+from patch_reducer import fit_text
+
+REVIEW_MODEL = os.getenv("REVIEW_MODEL", "gpt-4")
+REVIEW_MAX_TOKENS = int(os.getenv("REVIEW_MAX_TOKENS", "150"))
+REVIEW_EVIDENCE_TOKEN_BUDGET = int(os.getenv("REVIEW_EVIDENCE_TOKEN_BUDGET", "6000"))
+
+# A running review job older than this is assumed to have died with its process
+REVIEW_JOB_TIMEOUT_SECONDS = int(os.getenv("REVIEW_JOB_TIMEOUT_SECONDS", "900"))
+
+# Bump when the review prompt changes so stored reviews are regenerated
+REVIEW_PROMPT_VERSION = "review-v1"
+
+NO_EVIDENCE = "No PRs in this run relate to this competency."
+
+def latest_call_id(responses) -> Optional[str]:
+    latest = responses.find_one({}, {"call_id": 1}, sort=[("_id", -1)])
+    return latest["call_id"] if latest else None
+
+def run_finished(logs, call_id: str) -> bool:
+    # Every agent run, inline or queued, ends with a "completed" log entry;
+    # until then its evidence is partial and a review would be stored for good
+    return logs.find_one({"call_id": call_id, "status": "completed"}, {"_id": 1}) is not None
+
+def competency_evidence(responses, call_id: str) -> Dict[str, List[str]]:
+    # Grouped in MongoDB: only one run's relevant summaries leave the server
+    pipeline = [
+        {"$match": {"call_id": call_id, "summary": {"$nin": ["-", "", None]}}},
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": "$competency_name", "summaries": {"$push": "$summary"}}}
+    ]
+    return {group["_id"]: group["summaries"] for group in responses.aggregate(pipeline)}
+
+def review_prompt(competency_name: str, competency_description: str, combined_summary: str) -> str:
+    return f"""
+        Competency: {competency_name}
+        Description: {competency_description}
+
+        Summary of agent responses:
+        {combined_summary}
+
+        Based on the above information, provide a brief performance review. Start with a single paragraph of the developer's impact and top competencies.
+        """
+
+async def review_competencies(engine: EvaluationEngine, competencies: List[Dict[str, Any]], evidence: Dict[str, List[str]],
+                              model: str = REVIEW_MODEL, log: Callable[[str, str], None] = lambda status, message: None) -> str:
+    # One model call per competency, all in flight at once (bounded by the
+    # engine's concurrency), so the review takes about as long as one call
+    semaphore = asyncio.Semaphore(engine.concurrency)
+
+    async def complete(prompt):
+        started = time.monotonic()
+        response = await engine.client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant that generates performance reviews based on competency evaluations."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=REVIEW_MAX_TOKENS
+        )
+        record_completion(model, response, time.monotonic() - started)
+        return response
+
+    async def review(competency):
+        competency_name = competency['name']
+        summaries = evidence.get(competency_name)
+        if not summaries:
+            log("info", f"No relevant responses for competency: {competency_name}")
+            return NO_EVIDENCE
+        # Keep the evidence within the review model's context window
+        combined_summary = fit_text("\n".join(summaries), REVIEW_EVIDENCE_TOKEN_BUDGET, model)
+        prompt = review_prompt(competency_name, competency['description'], combined_summary)
+        async with semaphore:
+            log("info", f"Sending request to OpenAI for competency: {competency_name}")
+            response = await engine.call_with_retries(lambda: complete(prompt))
+        log("info", f"Received response from OpenAI for competency: {competency_name}")
+        return response.choices[0].message.content
+
+    sections = await asyncio.gather(*(review(competency) for competency in competencies))
+    return "".join(
+        f"## {competency['name']}\n\n{section}\n\n" for competency, section in zip(competencies, sections)
+    )
+
+# Finished reviews are stored in db.performance_reviews, one document per
+# job, and reused while the run, the competency matrix and the model are
+# unchanged. "active_key" is only set while a job is running; a
+# unique index on it keeps concurrent requests from starting the same review
+# twice.
+
+def matrix_version(competencies: List[Dict[str, Any]]) -> str:
+    matrix = sorted((competency['name'], competency['description']) for competency in competencies)
+    return hashlib.sha256(json.dumps(matrix).encode("utf-8")).hexdigest()
+
+def review_key(call_id: str, matrix: str, model: str) -> str:
+    parts = [call_id, matrix, model, REVIEW_PROMPT_VERSION]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+def expire_stale_job(reviews, key: str, now: datetime):
+    reviews.update_one(
+        {"active_key": key, "started_at": {"$lt": now - timedelta(seconds=REVIEW_JOB_TIMEOUT_SECONDS)}},
+        {"$set": {"status": "error", "error": "Review job timed out.", "finished_at": now}, "$unset": {"active_key": ""}}
+    )
+
+def start_review(reviews, review_id: str, call_id: str, competencies: List[Dict[str, Any]], model: str = REVIEW_MODEL,
+                 force: bool = False) -> Tuple[Dict[str, Any], bool]:
+    # Returns the job to report and whether the caller should run it: a
+    # stored review (unless forced), a job already in progress, or a new one
+    matrix = matrix_version(competencies)
+    key = review_key(call_id, matrix, model)
+    now = datetime.now(timezone.utc)
+    if not force:
+        finished = reviews.find_one({"key": key, "status": "completed"}, sort=[("finished_at", -1)])
+        if finished:
+            return finished, False
+    expire_stale_job(reviews, key, now)
+    job = {
+        "_id": review_id,
+        "key": key,
+        "active_key": key,
+        "call_id": call_id,
+        "matrix_version": matrix,
+        "model": model,
+        "prompt_version": REVIEW_PROMPT_VERSION,
+        "status": "running",
+        "created_at": now,
+        "started_at": now
+    }
+    try:
+        reviews.insert_one(job)
+    except DuplicateKeyError:
+        active = reviews.find_one({"active_key": key})
+        if active:
+            return active, False
+        # The other job finished in between; its result is now stored
+        return start_review(reviews, review_id, call_id, competencies, model, force=False)
+    return job, True
+
+def finish_review(reviews, review_id: str, review: Optional[str] = None, error: Optional[str] = None):
+    reviews.update_one(
+        {"_id": review_id},
+        {
+            "$set": {
+                "status": "error" if error else "completed",
+                "review": review,
+                "error": error,
+                "finished_at": datetime.now(timezone.utc)
+            },
+            "$unset": {"active_key": ""}
+        }
+    )
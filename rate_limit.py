@@ -0,0 +1,126 @@
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Request priorities: list/metadata calls keep going when the budget runs
+# low, bulky patch downloads wait for the next reset window instead.
+PRIORITY_HIGH = "high"
+PRIORITY_LOW = "low"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class RateLimitScheduler:
+    def __init__(self, low_budget: int = 100, pace_below: float = 0.2, max_retries: int = 5,
+                 base_backoff: float = 1.0, max_backoff: float = 60.0, clock=time.time, sleep=time.sleep):
+        self.low_budget = low_budget
+        self.pace_below = pace_below
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self.paused_until = 0.0
+        self.next_slot = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = 0
+            self.consumed = 0
+            self.retries = 0
+            self.waited_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "consumed": self.consumed,
+                "retries": self.retries,
+                "waited_seconds": round(self.waited_seconds, 3),
+                "limit": self.limit,
+                "remaining": self.remaining,
+                "reset_at": self.reset_at
+            }
+
+    def _delay(self, priority: str, now: float) -> float:
+        if self.reset_at is not None and now >= self.reset_at:
+            # The window has rolled over; trust the next response's headers
+            self.remaining = None
+            self.reset_at = None
+        if self.paused_until > now:
+            return self.paused_until - now
+        if self.remaining is None or self.reset_at is None:
+            return 0.0
+        if self.remaining <= 0:
+            return self.reset_at - now
+        if priority == PRIORITY_LOW and self.remaining <= self.low_budget:
+            return self.reset_at - now
+        if self.limit and self.remaining < self.limit * self.pace_below:
+            # Spread what is left of the budget evenly until the reset
+            interval = (self.reset_at - now) / self.remaining
+            slot = max(now, self.next_slot)
+            if slot > now:
+                return slot - now
+            self.next_slot = slot + interval
+        return 0.0
+
+    def wait_turn(self, priority: str = PRIORITY_HIGH):
+        # Block until a request of this priority fits in the budget
+        while True:
+            with self.lock:
+                now = self.clock()
+                delay = self._delay(priority, now)
+                if delay <= 0:
+                    self.requests += 1
+                    if self.remaining is not None:
+                        # Reserve the call so concurrent threads see it
+                        self.remaining -= 1
+                    return
+                self.waited_seconds += delay
+            self.sleep(delay)
+
+    def record(self, response):
+        response_headers = response.headers
+        with self.lock:
+            # GitHub doesn't charge conditional requests answered with a 304
+            if response.status_code != 304:
+                self.consumed += 1
+            if "X-RateLimit-Remaining" in response_headers:
+                self.remaining = int(response_headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Limit" in response_headers:
+                self.limit = int(response_headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Reset" in response_headers:
+                self.reset_at = float(response_headers["X-RateLimit-Reset"])
+
+    def should_retry(self, response) -> bool:
+        if response.status_code in RETRY_STATUSES:
+            return True
+        if response.status_code == 403:
+            # Primary limit exhausted, or a secondary (abuse) rate limit
+            return (
+                response.headers.get("X-RateLimit-Remaining") == "0"
+                or "Retry-After" in response.headers
+                or "rate limit" in response.text.lower()
+            )
+        return False
+
+    def retry_delay(self, response, attempt: int) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                return float(retry_after)
+            if response.headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in response.headers:
+                return max(float(response.headers["X-RateLimit-Reset"]) - self.clock(), 0.0) + 1.0
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def pause(self, seconds: float):
+        # Hold back every thread sharing this scheduler, not just the caller
+        with self.lock:
+            self.retries += 1
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
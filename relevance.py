@@ -0,0 +1,200 @@
+import argparse
+import math
+import os
+import random
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from patch_store import patch_file_stats
+
+# A cheap local relevance score for a PR and competency, used to skip model
+# calls for pairs that almost certainly come back as "-". Three signals:
+#
+#   - TF-IDF cosine similarity between the PR (title, body, touched paths,
+#     changed lines) and the competency name and description
+#   - the share of touched paths matching the competency's path patterns
+#     (tests/, docs/, ...)
+#   - keywords in the changed lines (assert, password, logger, ...)
+#
+# Signals apply to a competency when its name mentions one of their terms;
+# descriptions mention too much in passing ("... suggesting performance
+# improvements") to tell what a competency is about. Pairs scoring below RELEVANCE_THRESHOLD skip the model,
+# but only for competencies at least one signal applies to: the others are
+# scored on their own wording alone, which says too little to rule a PR out.
+# RELEVANCE_AUDIT_RATE of the skips are evaluated anyway so the threshold
+# can be tuned against what the model says (python relevance.py reports on
+# them). The filter is off (threshold 0) until it has been tuned that way.
+
+RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0"))
+RELEVANCE_AUDIT_RATE = float(os.getenv("RELEVANCE_AUDIT_RATE", "0.05"))
+
+PATH_WEIGHT = 0.5
+KEYWORD_WEIGHT = 0.25
+
+# name: (competency terms, path patterns, diff keywords)
+SIGNALS: Dict[str, Tuple[set, List[str], set]] = {
+    "testing": (
+        {"test", "tests", "testing", "qa", "coverage", "quality"},
+        [r"(^|/)tests?/", r"(^|/)test_[^/]*$", r"_test\.\w+$", r"\.(spec|test)\.\w+$", r"(^|/)conftest\.py$"],
+        {"assert", "pytest", "unittest", "mock", "fixture", "expect", "coverage"}
+    ),
+    "documentation": (
+        {"doc", "docs", "documentation", "readme"},
+        [r"(^|/)docs?/", r"\.(md|rst|txt)$", r"(^|/)readme"],
+        {"docstring", "example", "readme", "documentation"}
+    ),
+    "security": (
+        {"security", "secure", "auth", "authentication", "vulnerability", "privacy"},
+        [r"auth", r"secur", r"crypt", r"permission"],
+        {"password", "token", "secret", "sanitize", "escape", "csrf", "xss", "encrypt", "permission", "credential"}
+    ),
+    "performance": (
+        {"performance", "latency", "efficient", "efficiency", "scalability", "optimization"},
+        [r"bench", r"perf"],
+        {"cache", "async", "latency", "batch", "concurrency", "profile", "throughput"}
+    ),
+    "observability": (
+        {"observability", "monitoring", "logging", "metrics", "tracing"},
+        [r"metric", r"(^|/)log", r"trac"],
+        {"logger", "logging", "metric", "metrics", "trace", "span", "prometheus", "alert"}
+    ),
+    "operations": (
+        {"deployment", "infrastructure", "ci", "devops", "release", "operations"},
+        [r"^\.github/", r"dockerfile", r"\.ya?ml$", r"(^|/)deploy"],
+        {"docker", "workflow", "deploy", "helm", "terraform", "pipeline"}
+    )
+}
+
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "are", "was", "were", "not", "but", "has", "have", "had",
+    "into", "onto", "its", "it's", "their", "them", "they", "you", "your", "our", "can", "will", "would", "should",
+    "all", "any", "each", "when", "than", "then", "also", "such", "how", "what", "which", "who", "use", "uses",
+    "used", "using", "new", "add", "adds", "added", "via", "per", "none", "true", "false", "self", "return",
+    "def", "import", "diff", "git", "index", "file", "files", "line", "lines"
+}
+
+def tokenize(text: str) -> List[str]:
+    # Splits identifiers (camelCase, snake_case, paths) into lowercase words
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text or "")
+    tokens = []
+    for token in re.findall(r"[a-z][a-z0-9]+", text.lower()):
+        if len(token) < 3 or token in STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def changed_lines(patch: str) -> str:
+    return "\n".join(
+        line[1:] for line in patch.splitlines()
+        if line[:1] in ("+", "-") and not line.startswith(("+++", "---"))
+    )
+
+class RelevanceScorer:
+    def __init__(self, competencies: Dict[str, str], threshold: float = RELEVANCE_THRESHOLD,
+                 audit_rate: float = RELEVANCE_AUDIT_RATE, rng: Optional[random.Random] = None):
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.random = rng or random.Random()
+        documents = {name: Counter(tokenize(f"{name} {description}")) for name, description in competencies.items()}
+        # Terms shared by every competency ("code", "developer") say little
+        # about which one a PR relates to
+        document_frequency = Counter(term for counts in documents.values() for term in counts)
+        self.idf = {term: math.log((1 + len(documents)) / (1 + count)) + 1 for term, count in document_frequency.items()}
+        self.default_idf = math.log(1 + len(documents)) + 1
+        self.vectors = {name: self.weigh(counts) for name, counts in documents.items()}
+        self.signals = {
+            name: [signal for signal, (terms, _, _) in SIGNALS.items() if set(tokenize(" ".join(terms))) & set(tokenize(name))]
+            for name in documents
+        }
+
+    def weigh(self, counts: Counter) -> Dict[str, float]:
+        vector = {term: (1 + math.log(count)) * self.idf.get(term, self.default_idf) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {term: weight / norm for term, weight in vector.items()}
+
+    def features(self, pr: Dict[str, Any], patch: str) -> Dict[str, Any]:
+        # Computed once per PR and shared by all its competencies
+        paths = [stats["filename"] for stats in patch_file_stats(patch)]
+        changes = changed_lines(patch)
+        counts = Counter(tokenize(" ".join([pr.get("title") or "", pr.get("body") or "", " ".join(paths), changes])))
+        return {
+            "paths": paths,
+            "vector": self.weigh(counts),
+            "change_terms": set(tokenize(changes))
+        }
+
+    def score(self, features: Dict[str, Any], competency_name: str) -> float:
+        vector = self.vectors.get(competency_name, {})
+        similarity = sum(weight * features["vector"].get(term, 0.0) for term, weight in vector.items())
+        path_share = 0.0
+        keyword_hits = 0
+        for signal in self.signals.get(competency_name, []):
+            _, patterns, keywords = SIGNALS[signal]
+            paths = features["paths"]
+            if paths:
+                matching = sum(1 for path in paths if any(re.search(pattern, path, re.I) for pattern in patterns))
+                path_share = max(path_share, matching / len(paths))
+            keyword_hits = max(keyword_hits, len(set(tokenize(" ".join(keywords))) & features["change_terms"]))
+        return min(1.0, similarity + PATH_WEIGHT * path_share + KEYWORD_WEIGHT * min(keyword_hits, 3) / 3)
+
+    def decide(self, score: float, competency_name: str) -> str:
+        # "evaluate", "skip", or "audit" for a skipped pair sampled for review
+        if score >= self.threshold or not self.signals.get(competency_name):
+            return "evaluate"
+        if self.random.random() < self.audit_rate:
+            return "audit"
+        return "skip"
+
+def audit_report(responses: Iterable[Dict[str, Any]], buckets: int = 10) -> Dict[str, Any]:
+    # How often the model found a pair relevant, by relevance score, for the
+    # pairs the model actually evaluated (audited pairs included). Relevant
+    # audited pairs are the ones the threshold would have wrongly skipped.
+    by_bucket = {}
+    audited = {"total": 0, "relevant": 0, "max_relevant_score": None}
+    skipped = 0
+    for response in responses:
+        score = response.get("relevance")
+        if response.get("skipped"):
+            skipped += 1
+            continue
+        if score is None:
+            continue
+        relevant = response.get("summary") not in (None, "-")
+        bucket = by_bucket.setdefault(min(int(score * buckets), buckets - 1), {"total": 0, "relevant": 0})
+        bucket["total"] += 1
+        bucket["relevant"] += relevant
+        if response.get("audit"):
+            audited["total"] += 1
+            audited["relevant"] += relevant
+            if relevant:
+                audited["max_relevant_score"] = max(score, audited["max_relevant_score"] or 0.0)
+    return {
+        "skipped": skipped,
+        "audited": audited,
+        "buckets": [
+            {"from": index / buckets, "to": (index + 1) / buckets, **by_bucket[index]}
+            for index in sorted(by_bucket)
+        ]
+    }
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Report how the relevance filter's scores compare with the model's answers.")
+    parser.add_argument("--call-id", help="only the responses of this agent run")
+    parser.add_argument("--buckets", type=int, default=10)
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URI")).github_prs
+    query = {"relevance": {"$ne": None}, **({"call_id": args.call_id} if args.call_id else {})}
+    report = audit_report(db.agent_responses.find(query, {"summary": 1, "relevance": 1, "skipped": 1, "audit": 1}), args.buckets)
+    audited = report["audited"]
+    print(f"Skipped {report['skipped']} pairs; {audited['relevant']} of {audited['total']} audited pairs were relevant"
+          + (f" (highest score {audited['max_relevant_score']:.3f})." if audited["relevant"] else "."))
+    for bucket in report["buckets"]:
+        print(f"  {bucket['from']:.2f}-{bucket['to']:.2f}: {bucket['relevant']} of {bucket['total']} relevant")
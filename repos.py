@@ -0,0 +1,3 @@
+# The repository ingested by default, and the one PR documents from before
+# multi-repository ingestion (stored without a "repo" field) belong to
+DEFAULT_REPO = "openai/openai-python"
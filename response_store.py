@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from competency_agent import CompetencyAgent, MultiCompetencyAgent
+from evaluation_cache import text_hash
+from patch_reducer import reduce_patch
+from patch_store import load_patch
+from repos import DEFAULT_REPO
+
+# agent_responses documents hold references instead of copies: the PR by
+# (repo, number), the competency by the hash of its description (kept in
+# db.competency_versions), and hashes of the patch, description and prompt
+# that were sent. expand_responses rebuilds the heavy fields on demand.
+
+# Fields older documents stored inline; never returned unless expanded
+HEAVY_FIELDS = ["pr_patch", "pr_description", "competency_description", "prompt"]
+
+def record_competency_version(db, name: str, description: str) -> str:
+    # Descriptions are immutable per version, so editing a competency adds a
+    # new version and older responses can still be expanded
+    version = text_hash(description)
+    db.competency_versions.update_one(
+        {"_id": version},
+        {"$setOnInsert": {"name": name, "description": description, "created_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    return version
+
+def response_refs(pr: Dict[str, Any], reduction: Dict[str, Any], model: str, prompt_version: str,
+                  prompt: Optional[str] = None) -> Dict[str, Any]:
+    # The part of a response document shared by every competency of one PR.
+    # prompt is what the model was sent for the response; None when the
+    # answer didn't come from this call (a cache hit or a skipped pair).
+    refs = {
+        "repo": pr.get("repo", DEFAULT_REPO),
+        "pr_number": pr.get("number"),
+        "patch_ref": pr.get("patch_ref"),
+        "patch_hash": text_hash(reduction["patch"]),
+        "patch_budget": reduction["budget"],
+        "description_hash": text_hash(pr.get("body", "")),
+        "prompt_version": prompt_version,
+        "model": model
+    }
+    if prompt is not None:
+        refs["prompt_hash"] = text_hash(prompt)
+    return refs
+
+def render_prompt(response: Dict[str, Any], versions: Dict[str, Dict[str, Any]], pr_patch: str,
+                  pr_description: str) -> Optional[str]:
+    if response.get("prompt_version") == MultiCompetencyAgent.PROMPT_VERSION:
+        if not all(version in versions for version in response.get("prompt_competencies", [])):
+            return None
+        competencies = {versions[version]["name"]: versions[version]["description"] for version in response["prompt_competencies"]}
+        return MultiCompetencyAgent.format_prompt(competencies, pr_patch, pr_description, response["pr_link"])
+    version = versions.get(response.get("competency_version"))
+    if version is None:
+        return None
+    return CompetencyAgent.format_prompt(version["description"], pr_patch, pr_description, response["pr_link"])
+
+def expand_responses(db, responses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Fill in pr_patch, pr_description, competency_description and prompt.
+    # "expanded_exact" is False when the PR or reducer settings changed since
+    # the evaluation, so the rebuilt text differs from what the model saw.
+    slim = [response for response in responses if "patch_hash" in response]
+    if not slim:
+        return responses
+
+    version_ids = set()
+    for response in slim:
+        version_ids.add(response.get("competency_version"))
+        version_ids.update(response.get("prompt_competencies", []))
+    versions = {version["_id"]: version for version in db.competency_versions.find({"_id": {"$in": list(version_ids)}})}
+
+    prs = {}
+    for repo in {response["repo"] for response in slim}:
+        numbers = [response["pr_number"] for response in slim if response["repo"] == repo]
+        # Documents from before multi-repo ingestion may lack "repo"
+        repo_query = {"$in": [repo, None]} if repo == DEFAULT_REPO else repo
+        for pr in db.pull_requests.find({"repo": repo_query, "number": {"$in": numbers}}, {"patch": 0}):
+            prs[(repo, pr["number"])] = pr
+
+    # Many responses share a PR, so each patch is loaded and reduced once
+    patches = {}
+    for response in slim:
+        pr = prs.get((response["repo"], response["pr_number"]))
+        version = versions.get(response.get("competency_version"))
+        response["competency_description"] = version["description"] if version else None
+        if pr is None:
+            response.update({"pr_description": None, "pr_patch": None, "prompt": None, "expanded_exact": False})
+            continue
+        patch_key = (response["repo"], response["pr_number"], response["model"], response["patch_budget"])
+        if patch_key not in patches:
+            patches[patch_key] = reduce_patch(load_patch(db, pr), model=response["model"], budget=response["patch_budget"])["patch"]
+        response["pr_patch"] = patches[patch_key]
+        response["pr_description"] = pr.get("body", "")
+        # Responses without a prompt_hash were not answered by a model call
+        # of their own, so there is no prompt to rebuild
+        sent_prompt = "prompt_hash" in response
+        response["prompt"] = render_prompt(response, versions, response["pr_patch"], response["pr_description"]) if sent_prompt else None
+        response["expanded_exact"] = (
+            text_hash(response["pr_patch"]) == response["patch_hash"]
+            and text_hash(response["pr_description"]) == response["description_hash"]
+            and (not sent_prompt or (response["prompt"] is not None and text_hash(response["prompt"]) == response["prompt_hash"]))
+        )
+    return responses
@@ -1,3 +1,4 @@
+import argparse
 import os
 import hashlib
 import json
@@ -8,8 +9,10 @@ from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
 from pymongo import MongoClient
 from bson import ObjectId
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 import logging
+from patch_reducer import fit_text
+from repos import DEFAULT_REPO
 
 load_dotenv()
 
@@ -23,6 +26,18 @@ summary_collection = db.summaries
 # OpenAI API key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Bump when the prompt or output format changes, so stored summaries are regenerated
+SUMMARY_PROMPT_VERSION = "summary-v1"
+SUMMARY_MODEL = "gpt-4"
+
+# Token budgets for the PR body and the review comments in the prompt
+BODY_TOKEN_BUDGET = int(os.getenv("SUMMARY_BODY_TOKEN_BUDGET", "1500"))
+COMMENTS_TOKEN_BUDGET = int(os.getenv("SUMMARY_COMMENTS_TOKEN_BUDGET", "3000"))
+
+# PRs summarized per batch, and model calls in flight within a batch
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "50"))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "8"))
+
 # Define the Pydantic model for the output
 class PRSummary(BaseModel):
     summary: str = Field(description="A concise summary of the pull request")
@@ -33,7 +48,7 @@ class PRSummary(BaseModel):
 output_parser = PydanticOutputParser(pydantic_object=PRSummary)
 
 # Create the ChatOpenAI model
-model = ChatOpenAI(temperature=0.7, model="gpt-4")
+model = ChatOpenAI(temperature=0.7, model=SUMMARY_MODEL)
 
 # Prompt template
 prompt_template = ChatPromptTemplate.from_template("""
@@ -50,67 +65,172 @@ Comments: {comments}
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_pr_summary(pr: Dict[str, Any]) -> Dict[str, Any]:
-    # Convert ObjectId to string
-    pr = {k: str(v) if isinstance(v, ObjectId) else v for k, v in pr.items()}
-
-    pr_hash = hashlib.sha256(json.dumps(pr, sort_keys=True).encode()).hexdigest()
-    existing_summary = summary_collection.find_one({"pr_hash": pr_hash})
-
-    if existing_summary:
-        logger.info(f"Found existing summary for PR #{pr['number']}")
-        # Convert ObjectId to string in existing_summary
-        existing_summary = {k: str(v) if isinstance(v, ObjectId) else v for k, v in existing_summary.items()}
-        return existing_summary
-
+def summary_fingerprint(pr: Dict[str, Any]) -> str:
+    # Only what the prompt is built from; ids, stats, the patch and sync
+    # timestamps don't change the summary and aren't worth hashing
+    parts = [
+        SUMMARY_PROMPT_VERSION,
+        SUMMARY_MODEL,
+        pr.get("title") or "",
+        pr.get("body") or "",
+        [comment.get("body") or "" for comment in pr.get("comments") or []]
+    ]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+def stored_summaries(pr_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+    # One indexed $in query for a whole batch of PRs instead of a find_one each
+    return {
+        summary["pr_hash"]: {k: str(v) if isinstance(v, ObjectId) else v for k, v in summary.items()}
+        for summary in summary_collection.find({"pr_hash": {"$in": list(pr_hashes)}})
+    }
+
+def summary_messages(pr: Dict[str, Any]):
     comments = [comment["body"] for comment in pr["comments"]]
     
     # Create the prompt
     prompt = prompt_template.format_prompt(
         title=pr["title"],
-        body=pr["body"],
-        comments=comments,
+        body=fit_text(pr["body"] or "", BODY_TOKEN_BUDGET, "gpt-4"),
+        comments=fit_text("\n".join(comments), COMMENTS_TOKEN_BUDGET, "gpt-4"),
         format_instructions=output_parser.get_format_instructions()
     )
-    
+    return prompt.to_messages()
+
+def pr_repo(pr: Dict[str, Any]) -> str:
+    # PR documents from before multi-repository ingestion have no "repo"
+    return pr.get("repo") or DEFAULT_REPO
+
+def summary_document(pr: Dict[str, Any], pr_hash: str, content: str) -> Dict[str, Any]:
+    summary_dict = output_parser.parse(content)
+    return {
+        "pr_hash": pr_hash,
+        "repo": pr_repo(pr),
+        "pr_number": pr["number"],
+        "prompt_version": SUMMARY_PROMPT_VERSION,
+        "summary": summary_dict.summary,
+        "key_points": summary_dict.key_points,
+        "sentiment": summary_dict.sentiment
+    }
+
+def generate_pr_summary(pr: Dict[str, Any], pr_hash: Optional[str] = None, lookup: bool = True) -> Dict[str, Any]:
+    # summarize_prs looks stored summaries up in bulk and passes lookup=False
+    pr_hash = pr_hash or summary_fingerprint(pr)
+    existing_summary = stored_summaries([pr_hash]).get(pr_hash) if lookup else None
+
+    if existing_summary:
+        logger.info(f"Found existing summary for PR {pr_repo(pr)}#{pr['number']}")
+        return existing_summary
+
     try:
         # Generate the summary using the LangChain model
-        output = model(prompt.to_messages())
-        summary_dict = output_parser.parse(output.content)
-        
-        summary = {
-            "pr_hash": pr_hash,
-            "pr_number": pr["number"],
-            "summary": summary_dict.summary,
-            "key_points": summary_dict.key_points,
-            "sentiment": summary_dict.sentiment
-        }
+        output = model(summary_messages(pr))
+        summary = summary_document(pr, pr_hash, output.content)
         summary_collection.insert_one(summary)
         
-        logger.info(f"Generated and stored summary for PR #{pr['number']}")
+        logger.info(f"Generated and stored summary for PR {pr_repo(pr)}#{pr['number']}")
         return summary
     except Exception as e:
-        logger.error(f"Error generating summary for PR #{pr['number']}: {str(e)}")
+        logger.error(f"Error generating summary for PR {pr_repo(pr)}#{pr['number']}: {str(e)}")
         return None
 
-def summarize_prs() -> List[Dict[str, Any]]:
-    prs = pr_collection.find()
-    summaries = []
-    for pr in prs:
-        summary = generate_pr_summary(pr)
+def pr_filter(min_number: Optional[int] = None, max_number: Optional[int] = None,
+              since: Optional[str] = None, until: Optional[str] = None,
+              repo: Optional[str] = None) -> Dict[str, Any]:
+    # Repository, PR number range and creation date window; PR numbers are
+    # only unique within a repository. created_at is stored as the ISO 8601
+    # string from GitHub, so dates compare as strings
+    query = {}
+    if repo:
+        query["repo"] = repo
+    if min_number is not None or max_number is not None:
+        query["number"] = {}
+        if min_number is not None:
+            query["number"]["$gte"] = min_number
+        if max_number is not None:
+            query["number"]["$lte"] = max_number
+    if since or until:
+        query["created_at"] = {}
+        if since:
+            query["created_at"]["$gte"] = since
+        if until:
+            query["created_at"]["$lt"] = until
+    return query
+
+def summarize_batch(prs: List[Dict[str, Any]], max_concurrency: int) -> Iterator[Dict[str, Any]]:
+    pr_hashes = [summary_fingerprint(pr) for pr in prs]
+    existing = stored_summaries(pr_hashes)
+    missing = [(pr, pr_hash) for pr, pr_hash in zip(prs, pr_hashes) if pr_hash not in existing]
+
+    generated = {}
+    if missing:
+        # The model's batch API runs up to max_concurrency requests at once;
+        # a failed PR comes back as its exception instead of failing the batch
+        outputs = model.batch(
+            [summary_messages(pr) for pr, _ in missing],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True
+        )
+        for (pr, pr_hash), output in zip(missing, outputs):
+            try:
+                if isinstance(output, Exception):
+                    raise output
+                generated[pr_hash] = summary_document(pr, pr_hash, output.content)
+            except Exception as e:
+                logger.error(f"Error generating summary for PR {pr_repo(pr)}#{pr['number']}: {str(e)}")
+        if generated:
+            summary_collection.insert_many(list(generated.values()), ordered=False)
+            logger.info(f"Generated and stored {len(generated)} summaries")
+
+    for pr, pr_hash in zip(prs, pr_hashes):
+        summary = existing.get(pr_hash) or generated.get(pr_hash)
         if summary:
-            pr_summary = {
+            yield {
+                "repo": pr_repo(pr),
                 "pr_number": pr["number"],
                 "summary": summary.get("summary", "No summary available"),
                 "key_points": summary.get("key_points", []),
                 "sentiment": summary.get("sentiment", "Unknown")
             }
-            summaries.append(pr_summary)
         else:
-            logger.warning(f"No summary generated for PR #{pr['number']}")
-    
-    return summaries
+            logger.warning(f"No summary generated for PR {pr_repo(pr)}#{pr['number']}")
+
+def iter_summaries(min_number: Optional[int] = None, max_number: Optional[int] = None,
+                   since: Optional[str] = None, until: Optional[str] = None,
+                   max_concurrency: int = SUMMARY_MAX_CONCURRENCY,
+                   batch_size: int = SUMMARY_BATCH_SIZE,
+                   repo: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    # Yields summaries batch by batch as they are looked up or generated,
+    # so a full-collection run never holds every result in memory
+    # Only the fields the prompt and the fingerprint use are read
+    prs = pr_collection.find(
+        pr_filter(min_number, max_number, since, until, repo),
+        {"repo": 1, "number": 1, "title": 1, "body": 1, "comments.body": 1}
+    ).sort("number", 1)
+    batch = []
+    for pr in prs:
+        batch.append(pr)
+        if len(batch) >= batch_size:
+            yield from summarize_batch(batch, max_concurrency)
+            batch = []
+    if batch:
+        yield from summarize_batch(batch, max_concurrency)
+
+def summarize_prs(**filters) -> List[Dict[str, Any]]:
+    return list(iter_summaries(**filters))
 
 if __name__ == "__main__":
-    results = summarize_prs()
-    # print(json.dumps(results, indent=2))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Summarize stored pull requests.")
+    parser.add_argument("--repo", help="only PRs of this repository (owner/name); default: every repository")
+    parser.add_argument("--from-number", type=int, help="lowest PR number to summarize")
+    parser.add_argument("--to-number", type=int, help="highest PR number to summarize")
+    parser.add_argument("--since", help="only PRs created on or after this ISO date")
+    parser.add_argument("--until", help="only PRs created before this ISO date")
+    parser.add_argument("--max-concurrency", type=int, default=SUMMARY_MAX_CONCURRENCY, help="model calls in flight")
+    args = parser.parse_args()
+
+    count = 0
+    for result in iter_summaries(args.from_number, args.to_number, args.since, args.until, args.max_concurrency,
+                                 repo=args.repo):
+        count += 1
+        logger.info(f"PR {result['repo']}#{result['pr_number']}: {result['summary']}")
+    logger.info(f"Summarized {count} PRs")
@@ -0,0 +1,36 @@
+from datetime import datetime, timezone
+
+# Per-repository sync state lives in db.sync_state under sync_state_id(repo),
+# next to one document for the last sweep over all repositories
+
+SWEEP_STATE_ID = "sweep"
+
+def sync_state_id(repo):
+    return f"pull_requests:{repo}"
+
+def parse_github_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def freshness(last_success_at, watermark, now):
+    # lag: since the last complete sync; data age: since the newest PR update.
+    # A quiet repository is up to date even though its newest PR is old.
+    if last_success_at is not None and last_success_at.tzinfo is None:
+        last_success_at = last_success_at.replace(tzinfo=timezone.utc)
+    return {
+        "lag_seconds": (now - last_success_at).total_seconds() if last_success_at else None,
+        "data_age_seconds": (now - parse_github_time(watermark)).total_seconds()
+    }
+
+def sync_status(sync_state_collection, now=None):
+    # Freshness of the synced PR data as of now, per repository
+    now = now or datetime.now(timezone.utc)
+    repos = list(sync_state_collection.find({"repo": {"$exists": True}}, {"_id": 0}))
+    for state in repos:
+        state.update(freshness(state.get("last_success_at"), state["watermark"], now))
+    return {
+        "synced": bool(repos),
+        "max_lag_seconds": max((state["lag_seconds"] for state in repos if state["lag_seconds"] is not None), default=None),
+        "max_data_age_seconds": max((state["data_age_seconds"] for state in repos), default=None),
+        "repos": repos,
+        "sweep": sync_state_collection.find_one({"_id": SWEEP_STATE_ID}, {"_id": 0})
+    }
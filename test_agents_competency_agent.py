@@ -1,5 +1,7 @@
+from types import SimpleNamespace
+
 import pytest
-from competency_agent import CompetencyAgent
+from competency_agent import CompetencyAgent, MultiCompetencyAgent, ResponseParseError, reply_content
 
 @pytest.fixture
 def competency_description():
@@ -46,3 +48,24 @@ def test_competency_agent_edge_case(competency_description):
     result = agent.analyze_pr(pr_patch, pr_description, pr_link)
     assert result["pr_link"] == pr_link
     assert result["summary"] == "-"
+
+def test_only_truncated_or_empty_replies_are_retried(competency_description):
+    agent = CompetencyAgent(competency_description, async_client=object())
+    pr_link = "https://github.com/example/repo/pull/4"
+
+    def choice(content, finish_reason="stop"):
+        return SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)
+
+    fenced = reply_content(choice('```json\n{"summary": "Adds tests"}\n```'))
+    assert agent.parse_response(fenced, "Fix typo", pr_link)["summary"] == "Adds tests"
+    prose = reply_content(choice("This PR does not relate to the competency."))
+    assert agent.parse_response(prose, "Fix typo", pr_link) == {"pr_link": pr_link, "summary": "-"}
+    for truncated in [choice('{"summary": "Added te', "length"), choice(""), choice(None)]:
+        with pytest.raises(ResponseParseError):
+            reply_content(truncated)
+
+    multi_agent = MultiCompetencyAgent({"Testing": competency_description, "Docs": "Writes docs."}, async_client=object())
+    # Competencies left out of the reply have no answer, rather than "-"
+    results = multi_agent.parse_response('{"evaluations": [{"competency": "Testing", "summary": "-"}]}', "Fix typo", pr_link)
+    assert results == {"Testing": {"pr_link": pr_link, "summary": "-"}}
+    assert multi_agent.parse_response("not json", "Fix typo", pr_link) == {}
@@ -0,0 +1,138 @@
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import backend
+
+
+def make_node(number, updated_at, comment_overflow=False):
+    return {
+        "number": number,
+        "title": f"PR {number}",
+        "body": f"Body of PR {number}",
+        "createdAt": "2024-05-01T10:00:00Z",
+        "mergedAt": "2024-05-02T10:00:00Z",
+        "updatedAt": updated_at,
+        "author": {"login": "octocat"},
+        "additions": 10,
+        "deletions": 2,
+        "changedFiles": 3,
+        "reviewThreads": {
+            "pageInfo": {"hasNextPage": False},
+            "nodes": [
+                {
+                    "comments": {
+                        "pageInfo": {"hasNextPage": comment_overflow},
+                        "nodes": [
+                            {
+                                "databaseId": number * 10 + 2,
+                                "body": "Second comment",
+                                "path": "src/app.py",
+                                "createdAt": "2024-05-01T12:00:00Z",
+                                "updatedAt": "2024-05-01T12:00:00Z",
+                                "url": f"https://github.com/example/repo/pull/{number}#r2",
+                                "author": {"login": "reviewer"}
+                            },
+                            {
+                                "databaseId": number * 10 + 1,
+                                "body": "First comment",
+                                "path": "src/app.py",
+                                "createdAt": "2024-05-01T11:00:00Z",
+                                "updatedAt": "2024-05-01T11:00:00Z",
+                                "url": f"https://github.com/example/repo/pull/{number}#r1",
+                                "author": None
+                            }
+                        ]
+                    }
+                }
+            ]
+        }
+    }
+
+
+# Two pages of PRs, newest first; the second page is older than the sync window
+PAGES = {
+    None: {
+        "pageInfo": {"hasNextPage": True, "endCursor": "page2"},
+        "nodes": [
+            make_node(3, "2024-05-10T00:00:00Z"),
+            make_node(2, "2024-05-09T00:00:00Z", comment_overflow=True)
+        ]
+    },
+    "page2": {
+        "pageInfo": {"hasNextPage": True, "endCursor": "page3"},
+        "nodes": [make_node(1, "2024-04-01T00:00:00Z")]
+    }
+}
+
+
+@pytest.fixture
+def graphql_server(monkeypatch):
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            requests_seen.append(payload["variables"])
+            assert (payload["variables"]["owner"], payload["variables"]["name"]) == ("example", "repo")
+            body = json.dumps({"data": {"repository": {"pullRequests": PAGES[payload["variables"]["after"]]}}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(backend, "GITHUB_GRAPHQL_URL", f"http://127.0.0.1:{server.server_port}/graphql")
+    yield requests_seen
+    server.shutdown()
+
+
+def test_graphql_backend_matches_rest_document_shape(graphql_server, monkeypatch):
+    monkeypatch.setattr(backend, "fetch_pr_comments", lambda repo, number: [{"id": 1, "body": "from REST"}])
+    from_date = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    to_date = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+    prs = backend.fetch_recent_merged_prs_graphql("example/repo", from_date, to_date)
+
+    # Paging stops once a page crosses from_date, like the REST path
+    assert [variables["after"] for variables in graphql_server] == [None, "page2"]
+    assert [pr["number"] for pr in prs] == [3, 2, 1]
+
+    rest_keys = {
+        "repo", "number", "title", "created_at", "merged_at", "updated_at", "user", "body",
+        "comments", "additions", "deletions", "changed_files", "state"
+    }
+    pr = prs[0]
+    assert set(pr) == rest_keys
+    assert pr["repo"] == "example/repo"
+    assert pr["user"] == "octocat"
+    assert pr["state"] == "closed"
+    assert (pr["additions"], pr["deletions"], pr["changed_files"]) == (10, 2, 3)
+    assert [comment["body"] for comment in pr["comments"]] == ["First comment", "Second comment"]
+    assert pr["comments"][0]["user"] == {"login": None}
+
+
+def test_graphql_backend_falls_back_to_rest_for_overflowing_comments(graphql_server, monkeypatch):
+    rest_calls = []
+    monkeypatch.setattr(backend, "fetch_pr_comments",
+                        lambda repo, number: rest_calls.append(number) or [{"id": 1, "body": f"REST comments for {repo}#{number}"}])
+    monkeypatch.setattr(backend, "fetch_pr_patch_fields", lambda repo, number: {})
+    from_date = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    to_date = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+    prs = backend.fetch_recent_merged_prs_graphql("example/repo", from_date, to_date)
+
+    # Listing doesn't page comments; only enriching a (changed) PR does
+    assert prs[1]["comments"] is None
+    assert rest_calls == []
+    assert backend.enrich_pr_graphql("example/repo", prs[1])["comments"] == [{"id": 1, "body": "REST comments for example/repo#2"}]
+    assert backend.enrich_pr_graphql("example/repo", prs[0])["comments"] == prs[0]["comments"]
+    assert rest_calls == [2]
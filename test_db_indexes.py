@@ -0,0 +1,27 @@
+import mongomock
+import pytest
+
+from db_indexes import REQUIRED_INDEXES, ensure_indexes, missing_indexes
+
+
+def test_ensure_creates_every_required_index_and_check_reports_drops():
+    db = mongomock.MongoClient().github_prs
+    assert len(missing_indexes(db)) == sum(len(specs) for specs in REQUIRED_INDEXES.values())
+
+    ensure_indexes(db)
+    assert missing_indexes(db) == []
+    # Running it again is harmless
+    ensure_indexes(db)
+
+    db.agent_logs.drop_index("call_id_1__id_1")
+    assert missing_indexes(db) == [("agent_logs", [("call_id", 1), ("_id", 1)])]
+
+
+def test_unique_pr_index_is_enforced():
+    db = mongomock.MongoClient().github_prs
+    ensure_indexes(db, {"pull_requests": REQUIRED_INDEXES["pull_requests"]})
+    db.pull_requests.insert_one({"repo": "acme/api", "number": 1})
+    db.pull_requests.insert_one({"repo": "acme/web", "number": 1})
+
+    with pytest.raises(mongomock.DuplicateKeyError):
+        db.pull_requests.insert_one({"repo": "acme/api", "number": 1})
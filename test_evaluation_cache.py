@@ -0,0 +1,30 @@
+import mongomock
+
+from evaluation_cache import EvaluationCache, evaluation_key
+
+
+def test_key_changes_only_with_inputs_that_affect_the_answer():
+    key = evaluation_key("patch", "description", "Testing", "gpt-4", "competency-v1")
+
+    assert key == evaluation_key("patch", "description", "Testing", "gpt-4", "competency-v1")
+    assert key != evaluation_key("patch", "description", "Testing, edited", "gpt-4", "competency-v1")
+    assert key != evaluation_key("patch", "description", "Testing", "gpt-4o", "competency-v1")
+    assert key != evaluation_key("patch", "description", "Testing", "gpt-4", "competency-v2")
+    assert key != evaluation_key("patch 2", "description", "Testing", "gpt-4", "competency-v1")
+
+
+def test_hits_misses_and_competency_invalidation():
+    cache = EvaluationCache(mongomock.MongoClient().github_prs.evaluation_cache)
+    testing_key = evaluation_key("patch", "description", "Testing", "gpt-4", "competency-v1")
+    security_key = evaluation_key("patch", "description", "Security", "gpt-4", "competency-v1")
+
+    assert cache.get(testing_key) is None
+    cache.put(testing_key, "Adds unit tests", "Testing", "gpt-4", "competency-v1")
+    cache.put(security_key, "-", "Security", "gpt-4", "competency-v1")
+
+    assert cache.get_many([testing_key, security_key]) == {testing_key: "Adds unit tests", security_key: "-"}
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    assert cache.invalidate("Testing") == 1
+    assert cache.get(testing_key) is None
+    assert cache.get(security_key) == "-"
@@ -0,0 +1,104 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from competency_agent import ResponseParseError
+from evaluation_engine import EvaluationEngine
+
+
+def rate_limit_error(retry_after="0"):
+    request = httpx.Request("POST", "http://localhost/v1/chat/completions")
+    response = httpx.Response(429, request=request, headers={"retry-after": retry_after})
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_run_bounds_concurrency_and_handles_every_job():
+    engine = EvaluationEngine(client=object(), concurrency=3)
+    in_flight = 0
+    peak = 0
+    handled = []
+
+    async def handle(job):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        handled.append(job)
+
+    asyncio.run(engine.run(range(20), handle))
+
+    assert sorted(handled) == list(range(20))
+    assert peak == 3
+
+
+def test_call_with_retries_retries_rate_limits():
+    engine = EvaluationEngine(client=object(), max_retries=3)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise rate_limit_error()
+        return "ok"
+
+    assert asyncio.run(engine.call_with_retries(call)) == "ok"
+    assert engine.retries == 2
+
+
+def test_call_with_retries_retries_unparseable_replies():
+    engine = EvaluationEngine(client=object(), max_retries=3, base_backoff=0)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise ResponseParseError("truncated reply")
+        return "ok"
+
+    assert asyncio.run(engine.call_with_retries(call)) == "ok"
+    assert engine.retries == 1
+
+
+def test_call_with_retries_does_not_retry_client_errors():
+    engine = EvaluationEngine(client=object(), max_retries=3)
+
+    async def call():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(engine.call_with_retries(call))
+    assert engine.retries == 0
+
+
+def test_run_reports_failed_jobs_and_keeps_going():
+    engine = EvaluationEngine(client=object(), concurrency=2)
+    failed = []
+
+    async def handle(job):
+        if job % 2:
+            raise RuntimeError(f"job {job} failed")
+
+    async def on_error(job, error):
+        failed.append(job)
+
+    asyncio.run(engine.run(range(6), handle, on_error=on_error))
+
+    assert sorted(failed) == [1, 3, 5]
+    assert engine.failures == 3
+
+
+def test_run_finishes_when_the_error_handler_fails():
+    engine = EvaluationEngine(client=object(), concurrency=2)
+
+    async def handle(job):
+        raise RuntimeError(f"job {job} failed")
+
+    async def on_error(job, error):
+        raise RuntimeError("could not record the failure")
+
+    asyncio.run(asyncio.wait_for(engine.run(range(20), handle, on_error=on_error), timeout=5))
+
+    assert engine.failures == 20
@@ -0,0 +1,64 @@
+import json
+from datetime import timedelta
+
+import mongomock
+from bson import ObjectId
+
+from event_stream import RunEventStream, late_documents, new_documents
+
+
+def parse(chunks):
+    events = []
+    for chunk in chunks:
+        if chunk.startswith(":"):
+            continue
+        fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+        events.append((fields["event"], json.loads(fields["data"]), fields.get("id")))
+    return events
+
+
+def test_polling_stream_sends_only_new_documents_until_the_run_ends():
+    db = mongomock.MongoClient().github_prs
+    db.agent_logs.insert_one({"call_id": "run-1", "status": "started", "message": "Agent run initiated."})
+    db.agent_logs.insert_one({"call_id": "other", "status": "info", "message": "Another run."})
+    written = []
+
+    def sleep(seconds):
+        # The run makes progress while the stream waits for the next tick
+        if not written:
+            db.agent_responses.insert_one({"call_id": "run-1", "competency_name": "Testing", "summary": "-", "prompt": "big"})
+            db.agent_logs.insert_one({"call_id": "run-1", "status": "completed", "message": "Done."})
+            written.append(seconds)
+
+    stream = RunEventStream(db.agent_logs, db.agent_responses, "run-1", use_change_streams=False, sleep=sleep)
+    events = parse(stream)
+
+    assert [(event, data.get("message") or data.get("competency_name")) for event, data, _ in events] == [
+        ("log", "Agent run initiated."), ("response", "Testing"), ("log", "Done."), ("end", None)
+    ]
+    assert "prompt" not in events[1][1]
+    assert written == [stream.poll_interval]
+
+    # Resuming from the last event id replays nothing
+    log_cursor, response_cursor = events[-1][2].split(".")
+    resumed = RunEventStream(db.agent_logs, db.agent_responses, "run-1", stream.log_cursor, stream.response_cursor,
+                             use_change_streams=False)
+    assert [event for event, _, _ in parse(resumed)] == ["end"]
+    assert (log_cursor, response_cursor) == (str(stream.log_cursor), str(stream.response_cursor))
+
+
+def test_entries_written_late_by_another_worker_are_not_skipped():
+    db = mongomock.MongoClient().github_prs
+    db.agent_logs.insert_one({"call_id": "run-2", "status": "info", "message": "Seen."})
+    cursor = db.agent_logs.find_one({"call_id": "run-2"})["_id"]
+    # Flushed after the cursor was handed out, by a process whose clock put
+    # its _id a second earlier
+    late_id = ObjectId.from_datetime(cursor.generation_time - timedelta(seconds=1))
+    db.agent_logs.insert_one({"_id": late_id, "call_id": "run-2", "status": "info", "message": "Late."})
+    db.agent_logs.insert_one({"call_id": "run-2", "status": "completed", "message": "Done."})
+
+    assert [log["message"] for log in new_documents(db.agent_logs, "run-2", cursor)] == ["Done."]
+    assert [log["message"] for log in late_documents(db.agent_logs, "run-2", cursor)] == ["Late.", "Seen."]
+
+    resumed = RunEventStream(db.agent_logs, db.agent_responses, "run-2", cursor, use_change_streams=False)
+    assert [data.get("message") for _, data, _ in parse(resumed)] == ["Late.", "Seen.", "Done.", None]
@@ -0,0 +1,34 @@
+import requests
+
+from fake_github import PATCH_MEDIA_TYPE, FakeGitHub
+
+
+def test_pull_lists_are_paginated_with_link_headers_and_etags():
+    with FakeGitHub(["acme/api"], prs_per_repo=5, comments_per_pr=0) as fake:
+        url = f"{fake.base_url}/repos/acme/api/pulls"
+        first = requests.get(url, params={"per_page": 2})
+        numbers = [pr["number"] for pr in first.json()]
+        while "next" in first.links:
+            first = requests.get(first.links["next"]["url"])
+            numbers += [pr["number"] for pr in first.json()]
+        assert numbers == [5, 4, 3, 2, 1]
+
+        page = requests.get(url, params={"per_page": 2})
+        remaining = int(page.headers["X-RateLimit-Remaining"])
+        again = requests.get(url, params={"per_page": 2}, headers={"If-None-Match": page.headers["ETag"]})
+        assert again.status_code == 304
+        assert int(again.headers["X-RateLimit-Remaining"]) == remaining
+
+        # An update changes the content, so the old ETag no longer matches
+        fake.touch("acme/api", 5)
+        assert requests.get(url, params={"per_page": 2}, headers={"If-None-Match": page.headers["ETag"]}).status_code == 200
+
+        patch = requests.get(f"{url}/1", headers={"Accept": PATCH_MEDIA_TYPE})
+        assert patch.text.startswith("From ") and "diff --git" in patch.text
+
+
+def test_requests_beyond_the_budget_are_rate_limited():
+    with FakeGitHub(["acme/api"], prs_per_repo=1, rate_limit=2) as fake:
+        url = f"{fake.base_url}/repos/acme/api/pulls/1"
+        assert [requests.get(url).status_code for _ in range(3)] == [200, 200, 403]
+        assert fake.stats["rate_limited"] == 1
@@ -0,0 +1,53 @@
+import asyncio
+
+from openai import AsyncOpenAI
+
+from competency_agent import CompetencyAgent, MultiCompetencyAgent
+from evaluation_engine import EvaluationEngine
+from fake_openai import CANNED_SUMMARY, FakeOpenAI, prompt_schema, sample
+
+
+def test_structured_outputs_answer_every_competency():
+    with FakeOpenAI(latency=0) as fake:
+        client = AsyncOpenAI(api_key="test", base_url=fake.base_url, max_retries=0)
+        agent = MultiCompetencyAgent({"Testing": "Writes tests", "Security": "Thinks about security"}, async_client=client)
+        single = CompetencyAgent("Writes tests", async_client=client)
+
+        async def evaluate():
+            try:
+                return (await agent.analyze_pr_async("diff", "Adds tests", "link"),
+                        await single.analyze_pr_async("diff", "Adds tests", "link"))
+            finally:
+                await client.close()
+
+        results, result = asyncio.run(evaluate())
+
+    assert {name: result["summary"] for name, result in results.items()} == {"Testing": CANNED_SUMMARY, "Security": CANNED_SUMMARY}
+    assert result["summary"] == CANNED_SUMMARY
+    assert fake.stats["completed"] == 2
+
+
+def test_output_parser_schemas_in_the_prompt_are_filled_in():
+    prompt = 'Answer as JSON.\n```\n{"properties": {"summary": {"type": "string"}, "key_points": {"type": "array", "items": {"type": "string"}}}}\n```'
+    assert sample(prompt_schema(prompt)) == {"summary": CANNED_SUMMARY, "key_points": [CANNED_SUMMARY]}
+
+
+def test_rate_limited_calls_are_retried_after_the_retry_after_delay():
+    with FakeOpenAI(latency=0, rate_limit_rate=0.5, retry_after=0.01, seed=1) as fake:
+        client = AsyncOpenAI(api_key="test", base_url=fake.base_url, max_retries=0)
+        engine = EvaluationEngine(client=client, concurrency=4, max_retries=20)
+        agent = CompetencyAgent("Writes tests", async_client=client)
+
+        async def evaluate():
+            try:
+                return await asyncio.gather(*[
+                    engine.call_with_retries(lambda: agent.analyze_pr_async("diff", "Adds tests", "link")) for _ in range(10)
+                ])
+            finally:
+                await client.close()
+
+        results = asyncio.run(evaluate())
+
+    assert len(results) == 10
+    assert fake.stats["rate_limited"] == engine.retries > 0
+    assert fake.stats["completed"] == 10
@@ -0,0 +1,102 @@
+import time
+
+import mongomock
+import pytest
+
+from log_sink import BufferedLogWriter
+
+
+class CountingCollection:
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = []
+
+    def insert_many(self, entries, ordered=True):
+        self.calls.append(len(entries))
+        return self.collection.insert_many(entries, ordered=ordered)
+
+
+def test_entries_are_written_in_batches_and_flushed_on_close():
+    collection = mongomock.MongoClient().github_prs.agent_logs
+    counting = CountingCollection(collection)
+
+    with BufferedLogWriter(counting, max_batch=50, flush_interval=60) as logs:
+        for i in range(120):
+            logs.log("info", f"event {i}", call_id="run-1")
+        logs.log("completed", "done", call_id="run-1")
+
+    stored = list(collection.find({"call_id": "run-1"}).sort("timestamp", 1))
+    assert [entry["message"] for entry in stored] == [f"event {i}" for i in range(120)] + ["done"]
+    assert sum(counting.calls) == 121
+    assert len(counting.calls) < 121
+
+
+def test_timer_flushes_a_partial_batch():
+    collection = mongomock.MongoClient().github_prs.agent_logs
+    logs = BufferedLogWriter(collection, max_batch=1000, flush_interval=0.05)
+    logs.log("info", "started", call_id="run-2")
+    time.sleep(0.3)
+
+    assert collection.count_documents({"call_id": "run-2"}) == 1
+    logs.close()
+
+
+def test_failed_batch_is_kept_for_the_next_flush():
+    collection = mongomock.MongoClient().github_prs.agent_logs
+
+    class FlakyCollection:
+        failures = 1
+
+        def insert_many(self, entries, ordered=True):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("primary stepped down")
+            return collection.insert_many(entries, ordered=ordered)
+
+    logs = BufferedLogWriter(FlakyCollection(), max_batch=1000, flush_interval=60)
+    logs.log("info", "event", call_id="run-3")
+    with pytest.raises(RuntimeError):
+        logs.flush()
+    logs.close()
+
+    assert collection.count_documents({"call_id": "run-3"}) == 1
+    with pytest.raises(RuntimeError):
+        logs.log("info", "too late", call_id="run-3")
+
+
+def test_entries_stored_before_a_failure_are_not_written_twice():
+    collection = mongomock.MongoClient().github_prs.agent_logs
+
+    class PartialCollection:
+        failures = 1
+
+        def insert_many(self, entries, ordered=True):
+            if self.failures:
+                # The first entry lands, then the connection drops
+                self.failures -= 1
+                collection.insert_one(entries[0])
+                raise RuntimeError("connection reset")
+            return collection.insert_many(entries, ordered=ordered)
+
+    with BufferedLogWriter(PartialCollection(), max_batch=1000, flush_interval=60) as logs:
+        for i in range(4):
+            logs.log("info", f"event {i}", call_id="run-4")
+        with pytest.raises(RuntimeError):
+            logs.flush()
+
+    assert collection.count_documents({"call_id": "run-4"}) == 4
+    assert logs.written == 4
+
+
+def test_entries_are_dropped_after_repeated_failures_and_exit_does_not_raise():
+    class DownCollection:
+        def insert_many(self, entries, ordered=True):
+            raise RuntimeError("no primary")
+
+    with BufferedLogWriter(DownCollection(), max_batch=1000, flush_interval=60, max_attempts=2) as logs:
+        logs.log("info", "event", call_id="run-5")
+        with pytest.raises(RuntimeError):
+            logs.flush()
+
+    assert logs.dropped == 1
+    assert logs.buffer == []
@@ -0,0 +1,32 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from metrics import model_cost, record_completion, record_retry, run_usage
+
+
+def test_cost_uses_the_longest_matching_model_prefix():
+    assert model_cost("gpt-4o-2024-08-06", 1_000_000, 0) == pytest.approx(2.50)
+    assert model_cost("gpt-4", 1_000, 1_000) == pytest.approx(0.09)
+    assert model_cost("local-model", 1_000, 1_000) == 0.0
+
+
+def test_usage_is_added_up_per_run_across_tasks_and_threads():
+    response = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=10))
+
+    async def call():
+        await asyncio.to_thread(record_completion, "gpt-4", response, 0.5)
+
+    async def run():
+        await asyncio.gather(*(asyncio.create_task(call()) for _ in range(3)))
+        record_retry()
+
+    with run_usage() as usage:
+        asyncio.run(run())
+    with run_usage() as other:
+        record_completion("gpt-4", SimpleNamespace(), 0.1)
+
+    assert usage.totals() == {"llm_calls": 3, "prompt_tokens": 300, "completion_tokens": 30, "cost_usd": 0.0108,
+                              "retries": 1, "llm_seconds": 1.5}
+    assert other.totals()["llm_calls"] == 1 and other.totals()["prompt_tokens"] == 0
@@ -0,0 +1,89 @@
+from patch_reducer import count_tokens, fit_text, parse_patch, reduce_patch
+
+
+def file_diff(filename, hunks=1, lines_per_hunk=3):
+    diff = f"diff --git a/{filename} b/{filename}\nindex 1111111..2222222 100644\n--- a/{filename}\n+++ b/{filename}\n"
+    for hunk in range(hunks):
+        diff += f"@@ -{hunk * 10 + 1},0 +{hunk * 10 + 1},{lines_per_hunk} @@\n"
+        diff += "".join(f"+line {hunk}-{line} of {filename}\n" for line in range(lines_per_hunk))
+    return diff
+
+
+PATCH = (
+    "From 0123456789abcdef0123456789abcdef01234567 Mon Sep 17 00:00:00 2001\n"
+    "Subject: [PATCH] Add retry logic\n\n---\n"
+    + file_diff("src/client.py", hunks=2)
+    + file_diff("poetry.lock", hunks=5, lines_per_hunk=50)
+    + file_diff("api/service_pb2.py", hunks=3)
+    + file_diff("tests/test_client.py")
+    + "-- \n2.42.0\n"
+)
+
+
+def test_parse_patch_splits_commit_text_files_and_hunks():
+    sections = parse_patch(PATCH)
+
+    assert [section.get("filename") for section in sections] == [
+        None, "src/client.py", "poetry.lock", "api/service_pb2.py", "tests/test_client.py", None
+    ]
+    assert len(sections[1]["hunks"]) == 2
+
+
+def test_parse_patch_keeps_removed_signature_lines_in_their_hunk():
+    patch = (
+        "diff --git a/schema.sql b/schema.sql\n--- a/schema.sql\n+++ b/schema.sql\n"
+        "@@ -1,2 +1,1 @@\n-- \n CREATE TABLE users (id int);\n"
+        "-- \n2.42.0\n"
+    )
+
+    sections = parse_patch(patch)
+
+    assert [section["type"] for section in sections] == ["file", "text"]
+    assert sections[0]["hunks"] == [["@@ -1,2 +1,1 @@\n", "-- \n", " CREATE TABLE users (id int);\n"]]
+    assert sections[0]["deletions"] == 1
+    assert sections[1]["lines"] == ["-- \n", "2.42.0\n"]
+
+
+def test_small_clean_patch_is_returned_unchanged():
+    patch = file_diff("src/client.py")
+
+    reduction = reduce_patch(patch, budget=10000)
+
+    assert reduction["patch"] == patch
+    assert reduction["tokens"] == reduction["original_tokens"]
+
+
+def test_low_signal_files_are_dropped_or_collapsed():
+    reduction = reduce_patch(PATCH, budget=10000)
+
+    assert reduction["dropped_files"] == ["poetry.lock"]
+    assert reduction["collapsed_files"] == ["api/service_pb2.py"]
+    assert "line 0-0 of poetry.lock" not in reduction["patch"]
+    assert "[dropped poetry.lock: +250 -0]" in reduction["patch"]
+    assert "[collapsed 3 hunks: +9 -0]" in reduction["patch"]
+    assert "line 1-2 of src/client.py" in reduction["patch"]
+    assert "Subject: [PATCH] Add retry logic" in reduction["patch"]
+    assert reduction["tokens"] < reduction["original_tokens"]
+
+
+def test_large_files_are_truncated_to_fit_the_budget():
+    patch = file_diff("src/small.py") + file_diff("src/huge.py", hunks=40, lines_per_hunk=20)
+
+    reduction = reduce_patch(patch, budget=800, drop_patterns=[], collapse_patterns=[])
+
+    assert reduction["truncated_files"] == ["src/huge.py"]
+    assert "line 0-2 of src/small.py" in reduction["patch"]
+    assert "line 0-0 of src/huge.py" in reduction["patch"]
+    assert "line 39-0 of src/huge.py" not in reduction["patch"]
+    assert reduction["tokens"] <= 800 + count_tokens("[truncated src/huge.py: 99 more hunks omitted]\n")
+
+
+def test_fit_text_keeps_whole_lines_within_budget():
+    text = "".join(f"comment number {i}\n" for i in range(500))
+
+    fitted = fit_text(text, 100)
+
+    assert fitted.startswith("comment number 0\n")
+    assert fitted.endswith("[truncated]\n")
+    assert count_tokens(fitted) <= 110
+    assert fit_text("short", 100) == "short"
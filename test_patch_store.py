@@ -0,0 +1,81 @@
+import mongomock
+
+from patch_store import load_patch, patch_file_stats, store_patch
+
+PATCH = """From 1234567890abcdef Mon Sep 17 00:00:00 2001
+From: Octo Cat <octocat@example.com>
+Subject: [PATCH 1/2] Add helper
+
+---
+ src/app.py | 3 ++-
+ 1 file changed, 2 insertions(+), 1 deletion(-)
+
+diff --git a/src/app.py b/src/app.py
+index 1111111..2222222 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -1,2 +1,3 @@
+ import os
+-print("old")
++print("new")
++print("more")
+-- 
+2.42.0
+
+From abcdef1234567890 Mon Sep 17 00:00:00 2001
+From: Octo Cat <octocat@example.com>
+Subject: [PATCH 2/2] Add test
+
+---
+diff --git a/tests/test_app.py b/tests/test_app.py
+new file mode 100644
+--- /dev/null
++++ b/tests/test_app.py
+@@ -0,0 +1 @@
++def test_app(): pass
+diff --git a/src/app.py b/src/app.py
+--- a/src/app.py
++++ b/src/app.py
+@@ -3 +3 @@
+-print("more")
++print("even more")
+-- 
+2.42.0
+"""
+
+
+def test_patch_file_stats_sums_every_commit():
+    assert patch_file_stats(PATCH) == [
+        {"filename": "src/app.py", "additions": 3, "deletions": 2},
+        {"filename": "tests/test_app.py", "additions": 1, "deletions": 0}
+    ]
+
+
+def test_patch_file_stats_counts_removed_lines_that_look_like_headers():
+    patch = (
+        "diff --git a/schema.sql b/schema.sql\n"
+        "--- a/schema.sql\n"
+        "+++ b/schema.sql\n"
+        "@@ -1,4 +1,2 @@\n"
+        "--- drop the old table\n"
+        "-- \n"
+        " CREATE TABLE users (id int);\n"
+        "-DROP TABLE legacy;\n"
+        "+++ counter\n"
+        "-- \n"
+        "2.42.0\n"
+    )
+
+    assert patch_file_stats(patch) == [{"filename": "schema.sql", "additions": 1, "deletions": 3}]
+
+
+def test_store_patch_is_content_addressed_and_round_trips():
+    db = mongomock.MongoClient().github_prs
+
+    patch_ref = store_patch(db, PATCH)
+    assert store_patch(db, PATCH) == patch_ref
+    assert db.patch_blobs.count_documents({}) == 1
+
+    assert load_patch(db, {"number": 1, "patch_ref": patch_ref}) == PATCH
+    assert load_patch(db, {"number": 2, "patch": "inline"}) == "inline"
+    assert load_patch(db, {"number": 3}) == ""
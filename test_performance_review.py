@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+import mongomock
+
+from db_indexes import REQUIRED_INDEXES, ensure_indexes
+from evaluation_engine import EvaluationEngine
+from performance_review import (NO_EVIDENCE, competency_evidence, finish_review, latest_call_id, review_competencies,
+                                run_finished, start_review)
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prompts = []
+
+    async def create(self, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.prompts.append(kwargs["messages"][1]["content"])
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Strong work."))])
+
+
+def test_evidence_is_grouped_per_competency_for_one_run():
+    responses = mongomock.MongoClient().github_prs.agent_responses
+    responses.insert_many([
+        {"call_id": "old", "competency_name": "Testing", "summary": "Old run"},
+        {"call_id": "new", "competency_name": "Testing", "summary": "Adds tests"},
+        {"call_id": "new", "competency_name": "Testing", "summary": "-"},
+        {"call_id": "new", "competency_name": "Security", "summary": "-"},
+        {"call_id": "new", "competency_name": "Testing", "summary": "Fixes flaky test"}
+    ])
+
+    assert latest_call_id(responses) == "new"
+    assert competency_evidence(responses, "new") == {"Testing": ["Adds tests", "Fixes flaky test"]}
+
+
+def test_competencies_are_reviewed_concurrently_in_matrix_order():
+    completions = FakeCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    engine = EvaluationEngine(client=client, concurrency=8)
+    competencies = [{"name": name, "description": f"{name} skills"} for name in ("Writing_code", "Testing", "Security")]
+    evidence = {"Writing_code": ["Refactors parser"], "Testing": ["Adds tests"]}
+
+    review = asyncio.run(review_competencies(engine, competencies, evidence))
+
+    assert review == (
+        "## Writing_code\n\nStrong work.\n\n"
+        "## Testing\n\nStrong work.\n\n"
+        f"## Security\n\n{NO_EVIDENCE}\n\n"
+    )
+    assert completions.max_in_flight == 2
+    assert any("Adds tests" in prompt for prompt in completions.prompts)
+
+
+def test_review_jobs_are_deduplicated_and_stored_results_reused():
+    db = mongomock.MongoClient().github_prs
+    ensure_indexes(db, {"performance_reviews": REQUIRED_INDEXES["performance_reviews"]})
+    reviews = db.performance_reviews
+    matrix = [{"name": "Testing", "description": "Writes tests"}]
+
+    job, created = start_review(reviews, "job-1", "run-1", matrix, "gpt-4")
+    assert created and job["status"] == "running"
+
+    # A second request while the first is running joins it
+    job, created = start_review(reviews, "job-2", "run-1", matrix, "gpt-4")
+    assert (job["_id"], created) == ("job-1", False)
+
+    finish_review(reviews, "job-1", review="## Testing\n\nGood.\n\n")
+    job, created = start_review(reviews, "job-3", "run-1", matrix, "gpt-4")
+    assert (job["_id"], job["status"], created) == ("job-1", "completed", False)
+
+    # A changed matrix, another model or force=True start a new job
+    assert start_review(reviews, "job-4", "run-1", [{"name": "Testing", "description": "Writes good tests"}], "gpt-4")[1]
+    assert start_review(reviews, "job-5", "run-1", matrix, "gpt-4o")[1]
+    job, created = start_review(reviews, "job-6", "run-1", matrix, "gpt-4", force=True)
+    assert (job["_id"], created) == ("job-6", True)
+
+
+def test_runs_are_only_reviewable_once_completed():
+    logs = mongomock.MongoClient().github_prs.agent_logs
+    logs.insert_many([
+        {"call_id": "run-1", "status": "started", "message": "Agent run initiated."},
+        {"call_id": "run-2", "status": "completed", "message": "All agents have been processed successfully."},
+        {"reviewed_call_id": "run-1", "status": "completed", "message": "Completed generating performance review"}
+    ])
+
+    assert not run_finished(logs, "run-1")
+    assert run_finished(logs, "run-2")
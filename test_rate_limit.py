@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+from rate_limit import PRIORITY_HIGH, PRIORITY_LOW, RateLimitScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_response(status_code=200, text="", **response_headers):
+    return SimpleNamespace(status_code=status_code, text=text, headers=response_headers)
+
+
+def make_scheduler(clock, **kwargs):
+    return RateLimitScheduler(clock=clock.time, sleep=clock.sleep, **kwargs)
+
+
+def test_waits_for_reset_when_budget_is_exhausted():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.record(make_response(**{"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1060"}))
+
+    scheduler.wait_turn(PRIORITY_HIGH)
+
+    assert clock.sleeps == [60.0]
+    assert scheduler.stats()["requests"] == 1
+
+
+def test_patch_downloads_yield_to_list_calls_when_budget_is_low():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, low_budget=100, pace_below=0)
+    scheduler.record(make_response(**{"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "50", "X-RateLimit-Reset": "1300"}))
+
+    scheduler.wait_turn(PRIORITY_HIGH)
+    assert clock.sleeps == []
+
+    scheduler.wait_turn(PRIORITY_LOW)
+    assert clock.sleeps == [300.0]
+
+
+def test_spaces_requests_once_budget_falls_below_threshold():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, low_budget=0, pace_below=0.2)
+    scheduler.record(make_response(**{"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "100", "X-RateLimit-Reset": "1200"}))
+
+    scheduler.wait_turn()
+    scheduler.wait_turn()
+
+    # 200 seconds left for 100 calls: one call every 2 seconds
+    assert clock.sleeps == [2.0]
+
+
+def test_retry_decisions_and_delays():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+
+    assert scheduler.should_retry(make_response(502))
+    assert scheduler.should_retry(make_response(403, text="You have exceeded a secondary rate limit"))
+    assert not scheduler.should_retry(make_response(403, text="Resource not accessible by integration"))
+    assert not scheduler.should_retry(make_response(404))
+
+    assert scheduler.retry_delay(make_response(429, **{"Retry-After": "30"}), 0) == 30.0
+    assert scheduler.retry_delay(make_response(403, **{"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1100"}), 0) == 101.0
+    assert 0 <= scheduler.retry_delay(make_response(500), 3) <= 8.0
+
+
+def test_304_responses_are_not_charged():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+
+    scheduler.record(make_response(200))
+    scheduler.record(make_response(304))
+
+    assert scheduler.stats()["consumed"] == 1
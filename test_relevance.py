@@ -0,0 +1,77 @@
+import random
+
+from competency_matrix import DEFAULT_COMPETENCIES
+from relevance import RelevanceScorer, audit_report
+
+
+COMPETENCIES = {
+    "Testing": "Writes thorough unit and integration tests and keeps test coverage high.",
+    "Documentation": "Keeps READMEs and docs up to date and explains changes clearly.",
+    "Security": "Handles authentication, secrets and user input securely.",
+    "Observability": "Adds logging, metrics and tracing so problems can be diagnosed."
+}
+
+
+def file_diff(filename, lines):
+    body = "".join(f"+{line}\n" for line in lines)
+    return f"diff --git a/{filename} b/{filename}\n--- a/{filename}\n+++ b/{filename}\n@@ -1,0 +1,{len(lines)} @@\n{body}"
+
+
+TYPO_PR = {"title": "Fix typo in error message", "body": ""}
+TYPO_PATCH = file_diff("src/billing/invoice.py", ['raise ValueError("Invoice amount must be positive")'])
+TEST_PR = {"title": "Cover invoice rounding", "body": "Adds unit tests for the rounding rules."}
+TEST_PATCH = file_diff("tests/test_invoice.py", ["def test_rounding():", "    assert round_amount(1.005) == 1.01"])
+
+
+def test_unrelated_pairs_score_below_the_threshold_and_related_ones_above():
+    scorer = RelevanceScorer(COMPETENCIES, threshold=0.1, audit_rate=0)
+    typo = scorer.features(TYPO_PR, TYPO_PATCH)
+    tests = scorer.features(TEST_PR, TEST_PATCH)
+
+    assert all(scorer.score(typo, name) < 0.1 for name in COMPETENCIES)
+    assert scorer.score(tests, "Testing") > 0.5
+    assert scorer.score(tests, "Testing") > max(scorer.score(tests, name) for name in COMPETENCIES if name != "Testing")
+
+
+def test_decide_samples_skipped_pairs_for_audit():
+    scorer = RelevanceScorer(COMPETENCIES, threshold=0.1, audit_rate=0.2, rng=random.Random(1))
+
+    assert scorer.decide(0.5, "Testing") == "evaluate"
+    decisions = [scorer.decide(0.0, "Testing") for _ in range(1000)]
+    assert set(decisions) == {"skip", "audit"}
+    assert 150 < decisions.count("audit") < 250
+    assert RelevanceScorer(COMPETENCIES, threshold=0).decide(0.0, "Testing") == "evaluate"
+
+
+def test_competencies_no_signal_applies_to_are_never_skipped():
+    scorer = RelevanceScorer({**COMPETENCIES, "Leadership": "Mentors others and drives decisions across teams."},
+                             threshold=0.1, audit_rate=0)
+    typo = scorer.features(TYPO_PR, TYPO_PATCH)
+
+    assert scorer.score(typo, "Leadership") < 0.1
+    assert scorer.decide(scorer.score(typo, "Leadership"), "Leadership") == "evaluate"
+    assert scorer.decide(scorer.score(typo, "Testing"), "Testing") == "skip"
+
+
+def test_default_competencies_only_get_signals_their_names_ask_for():
+    scorer = RelevanceScorer(DEFAULT_COMPETENCIES, threshold=0.1, audit_rate=0)
+    change = scorer.features({"title": "Retry failed requests", "body": ""},
+                             file_diff("src/client.py", ["for attempt in range(3):", "    response = session.get(url)"]))
+
+    assert scorer.signals["Writing_code"] == []
+    assert scorer.signals["Observability"] == ["observability"]
+    assert scorer.decide(scorer.score(change, "Writing_code"), "Writing_code") == "evaluate"
+
+
+def test_audit_report_counts_relevant_answers_per_score_bucket():
+    report = audit_report([
+        {"relevance": 0.01, "skipped": True, "summary": "-"},
+        {"relevance": 0.015, "audit": True, "summary": "Added tests."},
+        {"relevance": 0.01, "audit": True, "summary": "-"},
+        {"relevance": 0.8, "summary": "Added tests."},
+        {"relevance": None, "summary": "From the cache."}
+    ])
+
+    assert report["skipped"] == 1
+    assert report["audited"] == {"total": 2, "relevant": 1, "max_relevant_score": 0.015}
+    assert [(bucket["from"], bucket["total"], bucket["relevant"]) for bucket in report["buckets"]] == [(0.0, 2, 1), (0.8, 1, 1)]
@@ -0,0 +1,85 @@
+import mongomock
+
+from competency_agent import CompetencyAgent, MultiCompetencyAgent
+from patch_reducer import reduce_patch
+from patch_store import store_patch
+from response_store import expand_responses, record_competency_version, response_refs
+
+PATCH = """diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -1,2 +1,3 @@
+ import os
++import sys
+ print(os.getcwd())
+"""
+PR_LINK = "https://github.com/acme/api/pull/7"
+
+
+def make_db():
+    db = mongomock.MongoClient().github_prs
+    db.pull_requests.insert_one({
+        "repo": "acme/api", "number": 7, "body": "Import sys", "patch_ref": store_patch(db, PATCH)
+    })
+    return db
+
+
+def test_per_competency_response_expands_to_what_was_sent():
+    db = make_db()
+    pr = db.pull_requests.find_one()
+    version = record_competency_version(db, "Testing", "Writes tests")
+    agent = CompetencyAgent("Writes tests", async_client=object())
+    reduction = reduce_patch(PATCH, model=agent.model)
+    prompt = agent.generate_prompt(reduction["patch"], "Import sys", PR_LINK)
+    response = {
+        "competency_name": "Testing", "competency_version": version, "summary": "-", "pr_link": PR_LINK,
+        **response_refs(pr, reduction, agent.model, agent.PROMPT_VERSION, prompt)
+    }
+
+    [expanded] = expand_responses(db, [dict(response)])
+
+    assert expanded["expanded_exact"] is True
+    assert expanded["prompt"] == prompt
+    assert expanded["pr_patch"] == PATCH
+    assert expanded["competency_description"] == "Writes tests"
+
+
+def test_multi_response_and_edited_pr_are_reported_as_inexact():
+    db = make_db()
+    pr = db.pull_requests.find_one()
+    versions = [record_competency_version(db, "Testing", "Writes tests"), record_competency_version(db, "Docs", "Writes docs")]
+    agent = MultiCompetencyAgent({"Testing": "Writes tests", "Docs": "Writes docs"}, async_client=object())
+    reduction = reduce_patch(PATCH, model=agent.model)
+    prompt = agent.generate_prompt(reduction["patch"], "Import sys", PR_LINK)
+    response = {
+        "competency_name": "Docs", "competency_version": versions[1], "prompt_competencies": versions,
+        "summary": "-", "pr_link": PR_LINK, **response_refs(pr, reduction, agent.model, agent.PROMPT_VERSION, prompt)
+    }
+
+    [expanded] = expand_responses(db, [dict(response)])
+    assert expanded["expanded_exact"] is True
+    assert expanded["prompt"] == prompt
+
+    db.pull_requests.update_one({"number": 7}, {"$set": {"body": "Import sys (edited)"}})
+    [expanded] = expand_responses(db, [dict(response)])
+    assert expanded["expanded_exact"] is False
+    assert expanded["pr_description"] == "Import sys (edited)"
+
+
+def test_cached_response_expands_without_a_prompt():
+    db = make_db()
+    pr = db.pull_requests.find_one()
+    version = record_competency_version(db, "Testing", "Writes tests")
+    agent = CompetencyAgent("Writes tests", async_client=object())
+    reduction = reduce_patch(PATCH, model=agent.model)
+    response = {
+        "competency_name": "Testing", "competency_version": version, "summary": "-", "pr_link": PR_LINK, "cached": True,
+        **response_refs(pr, reduction, agent.model, agent.PROMPT_VERSION)
+    }
+
+    [expanded] = expand_responses(db, [dict(response)])
+
+    assert "prompt_hash" not in response
+    assert expanded["prompt"] is None
+    assert expanded["pr_patch"] == PATCH
+    assert expanded["expanded_exact"] is True
@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+
+import mongomock
+
+from sync_status import SWEEP_STATE_ID, sync_state_id, sync_status
+
+
+def test_sync_status_reports_lag_and_data_age_as_of_now():
+    collection = mongomock.MongoClient().github_prs.sync_state
+    now = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+    collection.insert_many([
+        {"_id": sync_state_id("acme/api"), "repo": "acme/api", "watermark": "2024-06-01T10:00:00Z",
+         "last_success_at": datetime(2024, 6, 1, 11, 0)},
+        {"_id": sync_state_id("acme/web"), "repo": "acme/web", "watermark": "2024-05-31T12:00:00Z",
+         "last_success_at": None},
+        {"_id": SWEEP_STATE_ID, "records": 3}
+    ])
+
+    status = sync_status(collection, now)
+
+    assert status["synced"] is True
+    assert [(state["lag_seconds"], state["data_age_seconds"]) for state in status["repos"]] == [(3600, 7200), (None, 86400)]
+    assert (status["max_lag_seconds"], status["max_data_age_seconds"]) == (3600, 86400)
+    assert status["sweep"] == {"records": 3}
+    assert sync_status(mongomock.MongoClient().github_prs.sync_state)["synced"] is False
@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+import mongomock
+
+import work_queue
+from db_indexes import ensure_indexes
+from work_queue import claim_item, claim_run, complete_item, enqueue_run, expand_run, fail_item
+
+COMPETENCIES = [{"_id": "c1", "name": "Testing", "description": "Writes tests"},
+                {"_id": "c2", "name": "Security", "description": "Thinks about security"}]
+
+
+def make_db():
+    db = mongomock.MongoClient().github_prs
+    ensure_indexes(db)
+    db.pull_requests.insert_many([
+        {"repo": "acme/api", "number": 1, "updated_at": "2024-05-01T00:00:00Z"},
+        {"repo": "acme/api", "number": 2, "updated_at": "2024-05-02T00:00:00Z"}
+    ])
+    return db
+
+
+def test_identical_runs_are_deduplicated_while_in_flight():
+    db = make_db()
+    run, created = enqueue_run(db, "run-1", "per_competency", COMPETENCIES)
+    assert created
+
+    run, created = enqueue_run(db, "run-2", "per_competency", COMPETENCIES)
+    assert (run["_id"], created) == ("run-1", False)
+
+    # Other inputs are a different run
+    assert enqueue_run(db, "run-3", "multi", COMPETENCIES)[1]
+    db.pull_requests.insert_one({"repo": "acme/api", "number": 3, "updated_at": "2024-05-03T00:00:00Z"})
+    assert enqueue_run(db, "run-4", "per_competency", COMPETENCIES)[1]
+
+
+def test_expired_leases_are_reclaimed_and_the_run_completes_once():
+    db = make_db()
+    enqueue_run(db, "run-1", "per_competency", COMPETENCIES)
+    run = claim_run(db, "worker-a")
+    assert expand_run(db, run, "acme/api") is None
+    assert db.agent_runs.find_one({"_id": "run-1"})["total"] == 4
+
+    items = [claim_item(db, "worker-a") for _ in range(4)]
+    assert claim_item(db, "worker-b") is None
+
+    # worker-a dies holding the last item; its lease runs out
+    db.work_items.update_one({"_id": items[3]["_id"]}, {"$set": {"lease_expires_at": work_queue.now_utc() - timedelta(seconds=1)}})
+    for item in items[:3]:
+        assert complete_item(db, item, "worker-a") is None
+    reclaimed = claim_item(db, "worker-b")
+    assert (reclaimed["_id"], reclaimed["attempts"]) == (items[3]["_id"], 2)
+
+    # The old holder can no longer finish it
+    assert complete_item(db, items[3], "worker-a") is None
+    finished = complete_item(db, reclaimed, "worker-b", cached=True)
+    assert (finished["status"], finished["done"], finished["cached"]) == ("completed", 4, 1)
+    assert complete_item(db, reclaimed, "worker-b") is None
+
+    # Once finished, the same inputs can be run again
+    assert enqueue_run(db, "run-2", "per_competency", COMPETENCIES)[1]
+
+
+def test_failed_items_are_retried_then_given_up():
+    db = make_db()
+    db.pull_requests.delete_many({"number": 2})
+    enqueue_run(db, "run-1", "multi", COMPETENCIES)
+    expand_run(db, claim_run(db, "worker-a"), "acme/api")
+
+    for attempt in range(1, work_queue.WORK_MAX_ATTEMPTS + 1):
+        item = claim_item(db, "worker-a")
+        assert item["attempts"] == attempt
+        run = fail_item(db, item, "worker-a", "model unavailable")
+
+    assert claim_item(db, "worker-a") is None
+    assert (run["status"], run["done"], run["failed"]) == ("completed", 0, 1)
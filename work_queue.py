@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from agent_evaluation import mode_model
+from competency_agent import CompetencyAgent, MultiCompetencyAgent
+from evaluation_cache import text_hash
+
+# Agent runs as durable work in MongoDB. A run (db.agent_runs) is expanded
+# into one work item per PR and competency (per PR in multi mode) in
+# db.work_items. Workers claim runs and items with find_one_and_update and
+# hold them under a lease they keep extending; when a worker dies its
+# leases expire and other workers pick the work up again. Finished items
+# are the run's checkpoints, so a restarted run only redoes what was in
+# flight.
+
+WORK_LEASE_SECONDS = int(os.getenv("WORK_LEASE_SECONDS", "120"))
+WORK_MAX_ATTEMPTS = int(os.getenv("WORK_MAX_ATTEMPTS", "3"))
+EXPAND_BATCH_SIZE = int(os.getenv("EXPAND_BATCH_SIZE", "1000"))
+
+OPEN_ITEM_STATUSES = ["pending", "leased"]
+
+def now_utc() -> datetime:
+    return datetime.now(timezone.utc)
+
+def run_fingerprint(db, mode: str, competencies: List[Dict[str, Any]]) -> str:
+    # Two requests with the same inputs while a run is in flight would do
+    # the same work: same mode, model and prompt, same competencies, and no
+    # PR synced in between
+    newest = db.pull_requests.find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    prompt_version = MultiCompetencyAgent.PROMPT_VERSION if mode == "multi" else CompetencyAgent.PROMPT_VERSION
+    parts = [
+        mode,
+        mode_model(mode),
+        prompt_version,
+        sorted((competency.get('name'), text_hash(competency.get('description'))) for competency in competencies),
+        db.pull_requests.count_documents({}),
+        newest.get("updated_at") if newest else None
+    ]
+    return hashlib.sha256(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+def enqueue_run(db, call_id: str, mode: str, competencies: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+    # Returns the run and whether it is new; an identical run still in
+    # flight is returned instead of queueing a duplicate. "active_fingerprint"
+    # is only set until the run finishes and has a unique index.
+    fingerprint = run_fingerprint(db, mode, competencies)
+    run = {
+        "_id": call_id,
+        "fingerprint": fingerprint,
+        "active_fingerprint": fingerprint,
+        "mode": mode,
+        # The competencies as they were when the run was requested, so every
+        # worker evaluates the same matrix
+        "competencies": [
+            {"_id": str(competency.get('_id')), "name": competency.get('name'), "description": competency.get('description')}
+            for competency in competencies
+        ],
+        "status": "queued",
+        "total": None,
+        "done": 0,
+        "failed": 0,
+        "cached": 0,
+        "created_at": now_utc()
+    }
+    try:
+        db.agent_runs.insert_one(run)
+    except DuplicateKeyError:
+        active = db.agent_runs.find_one({"active_fingerprint": fingerprint})
+        if active:
+            return active, False
+        return enqueue_run(db, call_id, mode, competencies)
+    return run, True
+
+def lease_fields(owner: str, now: datetime) -> Dict[str, Any]:
+    return {"lease_owner": owner, "lease_expires_at": now + timedelta(seconds=WORK_LEASE_SECONDS)}
+
+def claim_run(db, owner: str) -> Optional[Dict[str, Any]]:
+    # A queued run, or one whose expansion was cut short by a dead worker
+    now = now_utc()
+    return db.agent_runs.find_one_and_update(
+        {"$or": [
+            {"status": "queued"},
+            {"status": "expanding", "lease_expires_at": {"$lt": now}}
+        ]},
+        {"$set": {"status": "expanding", "started_at": now, **lease_fields(owner, now)}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def work_item_id(call_id: str, repo: str, pr_number: int, competency_name: Optional[str]) -> str:
+    return f"{call_id}:{repo}#{pr_number}:{competency_name or '*'}"
+
+def insert_items(db, items: List[Dict[str, Any]]):
+    # Item ids are deterministic, so re-expanding a run only adds what is missing
+    if not items:
+        return
+    try:
+        db.work_items.insert_many(items, ordered=False)
+    except BulkWriteError as e:
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+def expand_run(db, run: Dict[str, Any], default_repo: str) -> Optional[Dict[str, Any]]:
+    call_id = run["_id"]
+    competency_names = [None] if run["mode"] == "multi" else [competency["name"] for competency in run["competencies"]]
+    now = now_utc()
+    batch = []
+    for pr in db.pull_requests.find({}, {"repo": 1, "number": 1}):
+        for competency_name in competency_names:
+            repo = pr.get("repo", default_repo)
+            batch.append({
+                "_id": work_item_id(call_id, repo, pr["number"], competency_name),
+                "call_id": call_id,
+                "repo": repo,
+                "pr_number": pr["number"],
+                "competency_name": competency_name,
+                "status": "pending",
+                "attempts": 0,
+                "created_at": now
+            })
+        if len(batch) >= EXPAND_BATCH_SIZE:
+            insert_items(db, batch)
+            batch = []
+    insert_items(db, batch)
+    total = db.work_items.count_documents({"call_id": call_id})
+    db.agent_runs.update_one(
+        {"_id": call_id, "status": "expanding"},
+        {"$set": {"status": "running", "total": total}, "$unset": {"lease_owner": "", "lease_expires_at": ""}}
+    )
+    # A run with nothing to do (or whose items all finished during a slow
+    # expansion) is completed right away
+    return complete_run_if_done(db, call_id)
+
+def claim_item(db, owner: str) -> Optional[Dict[str, Any]]:
+    # Oldest first; a lease that ran out belongs to a worker that died
+    now = now_utc()
+    return db.work_items.find_one_and_update(
+        {"$or": [
+            {"status": "pending"},
+            {"status": "leased", "lease_expires_at": {"$lt": now}}
+        ]},
+        {"$set": {"status": "leased", **lease_fields(owner, now)}, "$inc": {"attempts": 1}},
+        sort=[("created_at", 1), ("_id", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def heartbeat(db, owner: str, item_ids: List[str]) -> int:
+    if not item_ids:
+        return 0
+    result = db.work_items.update_many(
+        {"_id": {"$in": item_ids}, "status": "leased", "lease_owner": owner},
+        {"$set": lease_fields(owner, now_utc())}
+    )
+    return result.modified_count
+
+def usage_increments(usage: Optional[Dict[str, float]]) -> Dict[str, float]:
+    # Model usage of one attempt, added to the run's "usage" totals
+    return {f"usage.{key}": value for key, value in (usage or {}).items() if value}
+
+def complete_item(db, item: Dict[str, Any], owner: str, cached: bool = False,
+                  usage: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+    # Only the current lease holder can finish an item; if the lease was
+    # lost, the worker that took it over counts it instead
+    result = db.work_items.update_one(
+        {"_id": item["_id"], "status": "leased", "lease_owner": owner},
+        {"$set": {"status": "done", "finished_at": now_utc()}, "$unset": {"lease_owner": "", "lease_expires_at": ""}}
+    )
+    if result.modified_count:
+        db.agent_runs.update_one({"_id": item["call_id"]}, {"$inc": {"done": 1, "cached": 1 if cached else 0, **usage_increments(usage)}})
+    elif usage:
+        # The calls were made (and paid for) even if the lease was lost
+        db.agent_runs.update_one({"_id": item["call_id"]}, {"$inc": usage_increments(usage)})
+    return complete_run_if_done(db, item["call_id"])
+
+def fail_item(db, item: Dict[str, Any], owner: str, error: str, max_attempts: int = WORK_MAX_ATTEMPTS,
+              usage: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+    # Back to pending for another worker, or failed for good after max_attempts
+    give_up = item.get("attempts", 0) >= max_attempts
+    result = db.work_items.update_one(
+        {"_id": item["_id"], "status": "leased", "lease_owner": owner},
+        {"$set": {"status": "failed" if give_up else "pending", "error": error}, "$unset": {"lease_owner": "", "lease_expires_at": ""}}
+    )
+    increments = usage_increments(usage)
+    if result.modified_count and give_up:
+        increments["failed"] = 1
+    if increments:
+        db.agent_runs.update_one({"_id": item["call_id"]}, {"$inc": increments})
+    return complete_run_if_done(db, item["call_id"])
+
+def complete_run_if_done(db, call_id: str) -> Optional[Dict[str, Any]]:
+    # Returns the run to exactly one caller: the one that marked it completed
+    if db.work_items.count_documents({"call_id": call_id, "status": {"$in": OPEN_ITEM_STATUSES}}, limit=1):
+        return None
+    return db.agent_runs.find_one_and_update(
+        {"_id": call_id, "status": "running"},
+        {"$set": {"status": "completed", "finished_at": now_utc()}, "$unset": {"active_fingerprint": ""}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def run_progress(db, call_id: str) -> Optional[Dict[str, Any]]:
+    return db.agent_runs.find_one({"_id": call_id}, {"competencies": 0, "active_fingerprint": 0})